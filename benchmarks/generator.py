@@ -0,0 +1,295 @@
+"""
+Seeded synthetic SICAR / MyBusiness data at configurable scale.
+
+Everything derives from one event log (sales, purchases, transfers, returns,
+imports, adjustments) so the source tables a store query reads and the frames
+the pipeline works on describe the same history. SKU popularity is Zipf-like,
+sales follow a weekly and intraday curve, and a few cashiers ring most tickets.
+"""
+import numpy as np
+import pandas as pd
+
+STORE_ID = 1
+STORE_NAME = "bench"
+
+# Per unit of scale
+BASE = {
+    "skus": 2_000,
+    "sales_per_day": 300,
+    "purchase_lines_per_day": 40,
+    "transfer_lines_per_day": 15,
+}
+USERS = ["Ana", "Luis", "Marta", "Jose", "Carmen", "Pedro", "Lucia", "Raul"]
+
+def _zipf_probs(n, a=1.1):
+    p = 1.0 / np.arange(1, n + 1) ** a
+    return p / p.sum()
+
+def _timestamps(rng, n, days, start):
+    """Sale times: busier weekends, peak around early afternoon, store open 8h-21h"""
+    day_idx = np.arange(days)
+    weekday = (pd.Timestamp(start).dayofweek + day_idx) % 7
+    weights = np.where(weekday >= 5, 1.4, 1.0)
+    day = rng.choice(day_idx, size=n, p=weights / weights.sum())
+    seconds = np.clip(rng.normal(14.5 * 3600, 3 * 3600, size=n), 8 * 3600, 21 * 3600 - 1)
+    ts = pd.Timestamp(start) + pd.to_timedelta(day, unit="D") + pd.to_timedelta(seconds.astype(int), unit="s")
+    return np.sort(ts.values)
+
+def generate(scale=1.0, days=180, seed=42, start="2025-01-01"):
+    """Return a dict of DataFrames: SICAR source tables plus pipeline-shaped frames ('_'-prefixed)"""
+    rng = np.random.default_rng(seed)
+    n_skus = max(10, int(BASE["skus"] * scale))
+    sku_p = _zipf_probs(n_skus)
+    art_ids = np.arange(1, n_skus + 1)
+    price_cents = np.round(rng.lognormal(4.2, 0.8, size=n_skus) * 100).astype("int64")
+    user_p = _zipf_probs(len(USERS), a=0.8)
+    t = {}
+
+    t["articulo"] = pd.DataFrame({"art_id": art_ids, "existencia": rng.integers(0, 200, size=n_skus)})
+    t["usuario"] = pd.DataFrame({"usu_id": np.arange(1, len(USERS) + 1), "nombre": USERS})
+    t["tipopago"] = pd.DataFrame({"tpa_id": [1, 3, 6], "nombre": ["Efectivo", "Vales", "Tarjeta"]})
+    t["nubecfg"] = pd.DataFrame({"sucId": [STORE_ID]})
+
+    historial = []
+
+    # --- Sales: tickets, lines, payments ---
+    n_sales = int(BASE["sales_per_day"] * scale * days)
+    sale_ts = _timestamps(rng, n_sales, days, start)
+    ven_id = np.arange(1, n_sales + 1)
+    sale_user = rng.choice(len(USERS), size=n_sales, p=user_p) + 1
+    historial.append(pd.DataFrame({"tabla": "Venta", "id": ven_id, "movimiento": "0", "fecha": sale_ts, "usu_id": sale_user}))
+
+    lines_per_sale = 1 + rng.poisson(1.5, size=n_sales)
+    line_ven = np.repeat(ven_id, lines_per_sale)
+    line_art = rng.choice(art_ids, size=len(line_ven), p=sku_p)
+    line_qty = rng.geometric(0.6, size=len(line_ven))
+    t["detallev"] = pd.DataFrame({"ven_id": line_ven, "art_id": line_art, "cantidad": line_qty})
+
+    ticket_cents = pd.Series(line_qty * price_cents[line_art - 1]).groupby(line_ven).sum().to_numpy()
+    kind = rng.choice(3, size=n_sales, p=[0.70, 0.25, 0.05])  # cash / card / cash + vales
+    cash_part = np.where(kind == 2, ticket_cents // 2, ticket_cents)
+    pay_ven = np.concatenate([ven_id, ven_id[kind == 2]])
+    pay_tpa = np.concatenate([np.where(kind == 1, 6, 1), np.full((kind == 2).sum(), 3)])
+    pay_cents = np.concatenate([cash_part, (ticket_cents - cash_part)[kind == 2]])
+    mov_id = np.arange(1, len(pay_ven) + 1)
+    t["movimiento"] = pd.DataFrame({
+        "mov_id": mov_id,
+        "ven_id": pay_ven,
+        "caj_id": rng.integers(1, 4, size=len(pay_ven)),
+        "tpa_id": pay_tpa,
+        "tipo": 1,
+        "status": 1,
+        "total": pay_cents / 100,
+    })
+    historial.append(pd.DataFrame({
+        "tabla": "Movimiento", "id": mov_id, "movimiento": "0",
+        "fecha": sale_ts[pay_ven - 1], "usu_id": sale_user[pay_ven - 1],
+    }))
+
+    # ~1% of tickets are cancelled an hour later
+    cancelled = rng.random(n_sales) < 0.01
+    historial.append(pd.DataFrame({
+        "tabla": "Venta", "id": ven_id[cancelled], "movimiento": "1",
+        "fecha": sale_ts[cancelled] + np.timedelta64(1, "h"), "usu_id": sale_user[cancelled],
+    }))
+
+    # --- Customer returns (NotaCredito) on ~0.5% of sale lines ---
+    ret = rng.random(len(line_ven)) < 0.005
+    ncr_id = np.arange(1, ret.sum() + 1)
+    t["detallen"] = pd.DataFrame({"ncr_id": ncr_id, "art_id": line_art[ret], "cantidad": line_qty[ret]})
+    historial.append(pd.DataFrame({
+        "tabla": "NotaCredito", "id": ncr_id, "movimiento": "0",
+        "fecha": sale_ts[line_ven[ret] - 1] + np.timedelta64(2, "D"), "usu_id": 1,
+    }))
+
+    # --- Purchases: documents of 20 lines, restocking popular SKUs more ---
+    n_pl = int(BASE["purchase_lines_per_day"] * scale * days)
+    com_line = np.arange(n_pl) // 20 + 1
+    n_com = com_line.max() if n_pl else 0
+    com_ts = _timestamps(rng, n_com, days, start)
+    t["compra"] = pd.DataFrame({"com_id": np.arange(1, n_com + 1)})
+    t["detallec"] = pd.DataFrame({
+        "com_id": com_line,
+        "art_id": rng.choice(art_ids, size=n_pl, p=sku_p),
+        "cantidad": rng.integers(10, 100, size=n_pl),
+    })
+    historial.append(pd.DataFrame({"tabla": "Compra", "id": np.arange(1, n_com + 1), "movimiento": "0", "fecha": com_ts, "usu_id": 1}))
+
+    # --- Transfers out of / into this store, 5% cancelled ---
+    n_tl = int(BASE["transfer_lines_per_day"] * scale * days)
+    tra_line = np.arange(n_tl) // 10 + 1
+    n_tra = tra_line.max() if n_tl else 0
+    outgoing = rng.random(n_tra) < 0.5
+    tra_ts = _timestamps(rng, n_tra, days, start)
+    t["traspaso"] = pd.DataFrame({"tra_id": np.arange(1, n_tra + 1), "sucOri": np.where(outgoing, STORE_ID, 2)})
+    t["detallet"] = pd.DataFrame({
+        "tra_id": tra_line,
+        "art_id": rng.choice(art_ids, size=n_tl, p=sku_p),
+        "cantidad": rng.integers(1, 20, size=n_tl),
+    })
+    tra_ids = np.arange(1, n_tra + 1)
+    historial.append(pd.DataFrame({
+        "tabla": "Traspaso", "id": tra_ids, "movimiento": np.where(outgoing, "0", "1"), "fecha": tra_ts, "usu_id": 1,
+    }))
+    tra_cancel = rng.random(n_tra) < 0.05
+    historial.append(pd.DataFrame({
+        "tabla": "Traspaso", "id": tra_ids[tra_cancel], "movimiento": "2",
+        "fecha": tra_ts[tra_cancel] + np.timedelta64(1, "D"), "usu_id": 1,
+    }))
+
+    # --- Supplier returns (NotaCreditoPro) ---
+    n_ncp = max(1, int(days * scale / 10))
+    ncp_ids = np.arange(1, n_ncp + 1)
+    t["notacreditopro"] = pd.DataFrame({"ncp_id": ncp_ids})
+    t["detallenpro"] = pd.DataFrame({
+        "ncp_id": np.repeat(ncp_ids, 3),
+        "art_id": rng.choice(art_ids, size=n_ncp * 3, p=sku_p),
+        "cantidad": rng.integers(1, 10, size=n_ncp * 3),
+    })
+    historial.append(pd.DataFrame({"tabla": "NotaCreditoPro", "id": ncp_ids, "movimiento": "0", "fecha": _timestamps(rng, n_ncp, days, start), "usu_id": 1}))
+
+    # --- Initial article import on day 0 ---
+    initial = rng.integers(0, 300, size=n_skus)
+    t["importararticulodetalle"] = pd.DataFrame({"ima_id": 1, "art_id": art_ids, "exisAnterior": 0, "exisActual": initial})
+    historial.append(pd.DataFrame({"tabla": "ImportarArticulo", "id": [1], "movimiento": "0", "fecha": [pd.Timestamp(start) + pd.Timedelta(hours=7)], "usu_id": 1}))
+
+    # --- Monthly cycle counts on the top SKUs (absolute snapshots) ---
+    ain_dates = pd.date_range(start, periods=max(1, days // 30), freq="30D") + pd.Timedelta(hours=22)
+    counted = art_ids[: max(1, n_skus // 10)]
+    t["ajusteinventarioarticulo"] = pd.DataFrame({
+        "ain_id": np.repeat(np.arange(1, len(ain_dates) + 1), len(counted)),
+        "art_id": np.tile(counted, len(ain_dates)),
+        "exisActual": rng.integers(0, 200, size=len(ain_dates) * len(counted)),
+    })
+    historial.append(pd.DataFrame({"tabla": "ajusteinventario", "id": np.arange(1, len(ain_dates) + 1), "movimiento": "0", "fecha": ain_dates, "usu_id": 1}))
+
+    t["historial"] = pd.concat(historial, ignore_index=True)
+    t["_stock_movements"] = _stock_movements(t)
+    t["_sicar_sales"] = _sicar_sales(t)
+    t["_legacy_sales"] = legacy_sales(n_sales, rng, days, start)
+    return t
+
+def _stock_movements(t):
+    """Rows shaped like extract_stock_movements() output, derived from the generated tables"""
+    h = t["historial"]
+    users = t["usuario"].set_index("usu_id")["nombre"]
+    parts = []
+
+    def add(tabla, detail, key, tipo, delta, is_absolute=0, abs_after=None, movimiento=None):
+        hh = h[h["tabla"] == tabla]
+        if movimiento is not None:
+            hh = hh[hh["movimiento"] == movimiento]
+        m = hh.merge(detail, left_on="id", right_on=key)
+        parts.append(pd.DataFrame({
+            "art_id": m["art_id"],
+            "fecha": m["fecha"],
+            "tipo_movimiento": tipo,
+            "is_absolute": is_absolute,
+            "delta_cantidad": delta(m) if delta else pd.NA,
+            "abs_stock_after": abs_after(m) if abs_after else pd.NA,
+            "id_origen": m["id"],
+            "tabla_origen": tabla,
+            "usuario": users.reindex(m["usu_id"]).to_numpy(),
+        }))
+
+    add("Venta", t["detallev"], "ven_id", "Venta", lambda m: -m["cantidad"], movimiento="0")
+    add("Venta", t["detallev"], "ven_id", "Venta Cancelada", lambda m: m["cantidad"], movimiento="1")
+    add("NotaCredito", t["detallen"], "ncr_id", "Nota de Crédito", lambda m: m["cantidad"])
+    add("Compra", t["detallec"], "com_id", "Compra", lambda m: m["cantidad"])
+    add("NotaCreditoPro", t["detallenpro"], "ncp_id", "Devolucion Proveedor", lambda m: -m["cantidad"])
+    add("ImportarArticulo", t["importararticulodetalle"], "ima_id", "Importar Articulo",
+        lambda m: m["exisActual"] - m["exisAnterior"])
+    add("ajusteinventario", t["ajusteinventarioarticulo"], "ain_id", "Ajuste de Inventario", None,
+        is_absolute=1, abs_after=lambda m: m["exisActual"])
+
+    tra = t["detallet"].merge(t["traspaso"], on="tra_id")
+    out, inc = tra[tra["sucOri"] == STORE_ID], tra[tra["sucOri"] != STORE_ID]
+    add("Traspaso", out, "tra_id", "Traspaso Salida", lambda m: -m["cantidad"], movimiento="0")
+    add("Traspaso", out, "tra_id", "Traspaso Salida Cancelado", lambda m: m["cantidad"], movimiento="2")
+    add("Traspaso", inc, "tra_id", "Traspaso Entrada", lambda m: m["cantidad"], movimiento="1")
+    add("Traspaso", inc, "tra_id", "Traspaso Entrada Cancelado", lambda m: -m["cantidad"], movimiento="2")
+
+    df = pd.concat(parts, ignore_index=True).sort_values("fecha", kind="mergesort", ignore_index=True)
+    df["tienda_id"] = STORE_ID
+    df["extracted_at"] = pd.Timestamp.now().floor("s")
+    return df
+
+def _sicar_sales(t):
+    """Rows shaped like extract_sicar() output (money in int64 cents)"""
+    h = t["historial"]
+    mov = t["movimiento"].merge(h[h["tabla"] == "Movimiento"], left_on="mov_id", right_on="id")
+    mov["cents"] = np.round(mov["total"] * 100).astype("int64")
+    g = mov.groupby("ven_id")
+    df = pd.DataFrame({
+        "fecha_hora": g["fecha"].max(),
+        "caja": g["caj_id"].max().astype(str),
+        "usuario": t["usuario"].set_index("usu_id")["nombre"].reindex(g["usu_id"].max()).to_numpy(),
+        "efectivo": mov["cents"].where(mov["tpa_id"] == 1, 0).groupby(mov["ven_id"]).sum(),
+        "tarjeta": mov["cents"].where(mov["tpa_id"] == 6, 0).groupby(mov["ven_id"]).sum(),
+        "otros": mov["cents"].where(~mov["tpa_id"].isin([1, 6]), 0).groupby(mov["ven_id"]).sum(),
+        "total_venta": g["cents"].sum(),
+    }).reset_index()
+    df["tienda"] = STORE_NAME
+    df["source_db"] = "sicar_bench"
+    df["source_system"] = "sicar"
+    df["extracted_at"] = pd.Timestamp.now().floor("s")
+    return df
+
+def legacy_sales(n, rng, days=180, start="2023-01-01"):
+    """Rows shaped like extract_legacy() output, with the payment anomalies the QA pass tags"""
+    ts = pd.DatetimeIndex(_timestamps(rng, n, days, start))
+    total = np.round(rng.lognormal(5.0, 0.9, size=n) * 100).astype("int64")
+    kind = rng.choice(6, size=n, p=[0.62, 0.25, 0.05, 0.03, 0.03, 0.02])
+    # 0 cash, 1 card, 2 mixed, 3 no flujo, 4 overpaid cash, 5 refund bigger than payments
+    efectivo_in = np.select([kind == 0, kind == 2, kind == 4, kind == 5], [total, total // 2, total + 5_000, total], 0)
+    tarjeta_in = np.select([kind == 1, kind == 2], [total, total - total // 2], 0)
+    egresos = np.where(kind == 5, total * 2, 0)
+    return pd.DataFrame({
+        "venta": np.arange(1, n + 1),
+        "fecha": ts.strftime("%Y-%m-%d 00:00:00"),
+        "usuhora": ts.strftime("%H:%M:%S"),
+        "caja": rng.choice(["1", "2", "3"], size=n),
+        "usuario": rng.choice(USERS, size=n, p=_zipf_probs(len(USERS), a=0.8)),
+        "total": total,
+        "tarjeta_in": tarjeta_in.astype("int64"),
+        "efectivo_in": efectivo_in.astype("int64"),
+        "otros_in": np.zeros(n, dtype="int64"),
+        "cobranza_aplicada": np.zeros(n, dtype="int64"),
+        "egresos": egresos.astype("int64"),
+        "tienda": STORE_NAME,
+        "source_db": "mybusiness_bench",
+        "source_system": "mybusiness",
+        "extracted_at": pd.Timestamp.now().floor("s"),
+    })
+
+# Indexes the store queries rely on in a real SICAR schema
+SOURCE_INDEXES = {
+    "historial": ["tabla, fecha", "tabla, id"],
+    "movimiento": ["mov_id", "ven_id"],
+    "detallev": ["ven_id"],
+    "detallet": ["tra_id"],
+    "traspaso": ["tra_id"],
+    "detallen": ["ncr_id"],
+    "detallec": ["com_id"],
+    "compra": ["com_id"],
+    "detallenpro": ["ncp_id"],
+    "notacreditopro": ["ncp_id"],
+    "ajusteinventarioarticulo": ["ain_id"],
+    "importararticulodetalle": ["ima_id"],
+    "articulo": ["art_id"],
+}
+
+def load_source_tables(tables, engine):
+    """Write the generated SICAR tables (not the '_' frames) into a MySQL/MariaDB schema"""
+    from sqlalchemy import text
+    from sqlalchemy.types import String
+
+    for name, df in tables.items():
+        if name.startswith("_"):
+            continue
+        strings = {col: String(64) for col in df.columns if df[col].dtype == object}
+        df.to_sql(name, engine, if_exists="replace", index=False, chunksize=10_000, method="multi", dtype=strings)
+
+        with engine.begin() as conn:
+            for i, cols in enumerate(SOURCE_INDEXES.get(name, [])):
+                conn.execute(text(f"CREATE INDEX idx_{name}_{i} ON {name} ({cols})"))
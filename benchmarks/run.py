@@ -0,0 +1,296 @@
+"""
+End-to-end stage benchmarks on synthetic data.
+
+    python -m benchmarks.run --scale 1 --days 180
+    python -m benchmarks.run --mysql-url mysql+pymysql://user:pw@localhost:3306/osmart_bench
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+
+In-memory stages (transforms, stock point replay) always run. Stages that talk
+to a database (extraction, upserts, save_stock_points) run only when
+--mysql-url points at a scratch MySQL/MariaDB schema; it is overwritten.
+stock_points_pandas and stock_points_sql derive the same stock points with the
+pandas replay and with the in-database engine, and are checked to match.
+Each stage reports wall time (best of --repeat), rows/sec and peak traced
+memory, and the results are written as JSON for regression comparisons.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.generator import STORE_ID, STORE_NAME, generate, load_source_tables
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+
+# Importing an entry point must not read config.json, connect or parse arguments
+ENTRY_POINTS = [
+    "etl_sales.update_clean_data", "etl_sales.reconcile", "etl_sales.seed_historical",
+    "etl_inventory.update_raw_stock_movements", "etl_inventory.update_stock_points",
+    "etl_inventory.update_stock_asof", "etl_inventory.seed_stock_points", "etl_worker",
+    "onboard_store",
+]
+
+# Consistency checks registered by the stages, run once after all timings: name -> fn returning (ok, detail)
+CHECKS = {}
+
+def import_entry_points():
+    """Cold import of every entry point in a fresh interpreter"""
+    subprocess.run([sys.executable, "-c", f"import {', '.join(ENTRY_POINTS)}"], cwd=PROJECT_ROOT, check=True)
+
+def measure(setup, run, rows, repeat):
+    """Best-of-`repeat` wall time, then one extra traced run for peak memory"""
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        t0 = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - t0)
+
+    args = setup()
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall = min(times)
+    return {
+        "rows": int(rows),
+        "wall_s": round(wall, 4),
+        "rows_per_s": round(rows / wall, 1) if wall > 0 else None,
+        "peak_mem_mb": round(peak / 2**20, 2),
+    }
+
+def memory_stages(data):
+    from etl_common.schema import FILTERED_MOVEMENTS, STOCK_MOVEMENTS, apply_schema
+    from etl_inventory import stock_points_helpers as helpers
+    from etl_inventory.dq_engine import flag_outliers, robust_stats
+    from etl_inventory.raw_stock_movements_helpers import effective_flags
+    from etl_sales import transform
+
+    legacy = data["_legacy_sales"]
+    sicar = data["_sicar_sales"]
+    movements = apply_schema(data["_stock_movements"].copy(), STOCK_MOVEMENTS)
+    filtered = apply_schema(movements[[c for c in FILTERED_MOVEMENTS if c in movements]].astype({"delta_cantidad": "float64", "abs_stock_after": "float64"}), FILTERED_MOVEMENTS)
+
+    cal = pd.date_range(filtered["fecha"].min().normalize(), filtered["fecha"].max().normalize(), freq="D").date
+    prepared = helpers.prepare_movements(filtered.copy())
+    daily_net = helpers.replay_daily_deltas(prepared)
+    sod = helpers.compute_sod_matrix(daily_net, cal)
+
+    # DQ statistics from the same movements: |delta| of deltas, levels of snapshots
+    is_abs = filtered["is_absolute"].eq(1)
+    observations = pd.DataFrame({
+        "art_id": filtered["art_id"],
+        "kind": is_abs.map({True: "stock", False: "delta"}),
+        "value": filtered["abs_stock_after"].where(is_abs, filtered["delta_cantidad"].abs()),
+    }).dropna(subset=["value"])
+    dq_stats = robust_stats(observations)
+
+    return {
+        "import_entry_points": (lambda: (), import_entry_points, len(ENTRY_POINTS)),
+        "clean_and_standardize_legacy": (lambda: (legacy.copy(), STORE_NAME), transform.clean_and_standardize_legacy, len(legacy)),
+        "clean_and_standardize_sicar": (lambda: (sicar.copy(), STORE_NAME), transform.clean_and_standardize_sicar, len(sicar)),
+        "effective_flags": (lambda: (movements,), effective_flags, len(movements)),
+        "replay_daily_deltas": (lambda: (helpers.prepare_movements(filtered.copy()),), helpers.replay_daily_deltas, len(filtered)),
+        "compute_sod_matrix": (lambda: (daily_net, cal), helpers.compute_sod_matrix, sod.size),
+        "sod_to_points": (lambda: (sod, STORE_ID), helpers.sod_to_points, sod.size),
+        "dq_robust_stats": (lambda: (observations,), robust_stats, len(observations)),
+        "dq_flag_outliers": (lambda: (filtered, dq_stats), flag_outliers, len(filtered)),
+    }, {"sod": sod, "movements": movements}
+
+def db_stages(data, url, derived):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.engine import make_url
+    from etl_common.shadow_tables import run_sql_script
+
+    engine = create_engine(url)
+    u = make_url(url)
+    source = {
+        "user": u.username, "password": u.password, "host": u.host, "port": u.port or 3306,
+        "database": u.database, "store": STORE_NAME, "store_id": STORE_ID, "name": STORE_NAME,
+    }
+    print(f"⏳ Loading synthetic SICAR tables into {u.database}...")
+    load_source_tables(data, engine)
+
+    from etl_inventory import extract as inv_extract
+    from etl_inventory import raw_stock_movements_helpers as raw_helpers
+    from etl_inventory import stock_points_helpers as helpers
+    from etl_inventory.queries import SQL
+    from etl_inventory.stock_points_sql import derive_stock_points
+    from etl_common.schema import FILTERED_MOVEMENTS, apply_schema
+    from etl_sales import money
+    from etl_sales.db import db_helpers
+
+    run_sql_script(engine, SQL.source("create_raw_stock_movements_next.sql")
+                   .replace("raw_stock_movements__next", "bench_raw_stock_movements"))
+    run_sql_script(engine, SQL.source("create_stock_flows_daily.sql")
+                   .replace("stock_flows_daily", "bench_stock_flows_daily"))
+    for table in ("bench_stock_points", "bench_stock_points_pandas", "bench_stock_points_sql"):
+        run_sql_script(engine, SQL.source("create_stock_points_next.sql").replace("stock_points__next", table))
+    db_helpers.reset_ventas_limpias(engine, table="bench_ventas_limpias")
+
+    h = data["historial"]
+    span = (str(h["fecha"].min().date()), str(h["fecha"].max().date()))
+    sales = data["_sicar_sales"]
+    movements = derived["movements"]
+    points = helpers.sod_to_points(derived["sod"], STORE_ID)
+
+    def upsert_ventas(df):
+        df.to_sql("bench_ventas_limpias", engine, if_exists="append", index=False,
+                  method=db_helpers.insert_on_conflict_update, chunksize=5_000)
+
+    def upsert_raw(df):
+        with engine.begin() as conn:
+            raw_helpers.upsert_raw_stock_movements(conn, df, table="bench_raw_stock_movements",
+                                                   flows_table="bench_stock_flows_daily")
+
+    def save_points(df):
+        with engine.begin() as conn:
+            helpers.write_stock_points(conn, df, table="bench_stock_points")
+
+    # Stock points from the loaded raw movements, both engines, over the whole span
+    start, end = (date.fromisoformat(d) for d in span)
+    filter_sql = SQL.source("extract_filter_raw_stock_movements_incremental.sql").replace(
+        "raw_stock_movements", "bench_raw_stock_movements")
+
+    def stock_points_setup(table):
+        with engine.begin() as conn:
+            if not conn.execute(text("SELECT COUNT(*) FROM bench_raw_stock_movements")).scalar():
+                raw_helpers.upsert_raw_stock_movements(conn, movements, table="bench_raw_stock_movements",
+                                                       flows_table="bench_stock_flows_daily")
+            conn.execute(text(f"TRUNCATE TABLE {table}"))
+        return ()
+
+    def stock_points_pandas():
+        with engine.begin() as conn:
+            df = pd.read_sql_query(text(filter_sql), conn, params={
+                "store_id": STORE_ID, "start_date": start.isoformat(), "end_date": end.isoformat()})
+            df = helpers.prepare_movements(apply_schema(df, FILTERED_MOVEMENTS))
+            cal = pd.date_range(start, end + timedelta(days=1), freq="D").date
+            sod = helpers.compute_sod_matrix(helpers.replay_daily_deltas(df), cal)
+            helpers.write_stock_points(conn, helpers.sod_to_points(sod, STORE_ID), table="bench_stock_points_pandas")
+
+    def stock_points_sql():
+        with engine.begin() as conn:
+            derive_stock_points(conn, STORE_ID, start, end, table="bench_stock_points_sql",
+                                raw_table="bench_raw_stock_movements")
+
+    def same_stock_points():
+        with engine.connect() as conn:
+            diff = conn.execute(text("""
+                SELECT COUNT(*) FROM (
+                  SELECT art_id, point_date, sod_stock FROM bench_stock_points_pandas
+                  UNION ALL
+                  SELECT art_id, point_date, sod_stock FROM bench_stock_points_sql
+                ) p
+                GROUP BY art_id, point_date, sod_stock HAVING COUNT(*) <> 2
+            """)).fetchall()
+        return not diff, f"{len(diff)} points differ between the pandas and SQL engines"
+
+    stages = {
+        "extract_stock_movements": (lambda: (source, [span]),
+                                    lambda *a: sum(len(df) for df in inv_extract.extract_stock_movements(*a)),
+                                    len(movements)),
+        "upsert_ventas_limpias": (lambda: (money.cents_to_amounts(sales),), upsert_ventas, len(sales)),
+        "upsert_raw_stock_movements": (lambda: (movements,), upsert_raw, len(movements)),
+        "save_stock_points": (lambda: (points,), save_points, len(points)),
+        "stock_points_pandas": (lambda: stock_points_setup("bench_stock_points_pandas"),
+                                stock_points_pandas, len(movements)),
+        "stock_points_sql": (lambda: stock_points_setup("bench_stock_points_sql"),
+                             stock_points_sql, len(movements)),
+    }
+    CHECKS["stock_points_engines_match"] = same_stock_points
+
+    from etl_sales import extract as sales_extract
+    stages["extract_sicar"] = (lambda: (source, [span]),
+                               lambda *a: sum(len(df) for df in sales_extract.extract_sicar(*a)),
+                               len(sales))
+
+    return stages
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Print per-stage throughput change vs a previous run; returns True if any stage regressed"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["stages"]
+    regressed = False
+    print(f"\n📊 Compared to {baseline_path}")
+    for stage, cur in results["stages"].items():
+        prev = baseline.get(stage)
+        if not prev or not prev.get("rows_per_s") or not cur.get("rows_per_s"):
+            continue
+        change = cur["rows_per_s"] / prev["rows_per_s"] - 1
+        flag = "❗️" if change < -threshold else "  "
+        regressed |= change < -threshold
+        print(f"{flag} {stage:32s} {prev['rows_per_s']:>12.0f} → {cur['rows_per_s']:>12.0f} rows/s ({change:+.1%})")
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on SKUs and daily volumes")
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mysql-url", help="scratch MySQL/MariaDB schema for the DB stages")
+    parser.add_argument("--only", nargs="*", help="run only these stages")
+    parser.add_argument("--out", help="results JSON path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed throughput drop before flagging")
+    args = parser.parse_args(argv)
+
+    print(f"🧪 Generating synthetic data (scale={args.scale}, days={args.days}, seed={args.seed})...")
+    data = generate(scale=args.scale, days=args.days, seed=args.seed)
+
+    stages, derived = memory_stages(data)
+    if args.mysql_url:
+        stages.update(db_stages(data, args.mysql_url, derived))
+
+    results = {
+        "meta": {
+            "date": date.today().isoformat(),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "scale": args.scale, "days": args.days, "seed": args.seed, "repeat": args.repeat,
+            "database": bool(args.mysql_url),
+        },
+        "stages": {},
+    }
+
+    for name, (setup, run, rows) in stages.items():
+        if args.only and name not in args.only:
+            continue
+        print(f"⏱️ {name}...", end="", flush=True)
+        results["stages"][name] = r = measure(setup, run, rows, args.repeat)
+        print(f" {r['wall_s']}s, {r['rows_per_s']} rows/s, peak {r['peak_mem_mb']} MB")
+
+    if CHECKS and (not args.only or {"stock_points_pandas", "stock_points_sql"} <= set(args.only)):
+        results["checks"] = {}
+        for name, check in CHECKS.items():
+            ok, detail = check()
+            results["checks"][name] = ok
+            print(f"{'✅' if ok else '❗️'} {name}" + ("" if ok else f": {detail}"))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%dT%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"💾 Results written to {out}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import asyncio
+import random
+import pandas as pd
+from sqlalchemy import text
+from etl_common.retry import RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+# Extraction is network wait on the store databases: run the queries of every
+# store at once on one event loop (SQLAlchemy asyncio + aiomysql), so a run
+# takes as long as the slowest store instead of the sum of all of them.
+DEFAULT_PER_STORE = 2   # concurrent queries (and pooled connections) per store database
+DEFAULT_TIMEOUT = 300   # seconds per query attempt
+
+def add_async_args(parser):
+    parser.add_argument("--async-per-store", type=int, default=0, metavar="N",
+                        help="extract every store concurrently with N queries per store (0 = one store at a time)")
+    parser.add_argument("--query-timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds before a store query is abandoned and retried")
+    return parser
+
+def async_mysql_url(db):
+    return f"mysql+aiomysql://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['database']}"
+
+async def _query_frame(engine, sql, params):
+    async with engine.connect() as conn:
+        result = await conn.execute(text(sql), params)
+        # coerce_float mirrors pd.read_sql_query, so apply_schema sees the same types
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+async def _fetch_all(requests, per_store, timeout, attempts):
+    from sqlalchemy.ext.asyncio import create_async_engine  # optional: pip install aiomysql "sqlalchemy[asyncio]"
+
+    engines, limits = {}, {}
+    for source, _, _ in requests:
+        store = source["store"]
+        if store not in engines:
+            engines[store] = create_async_engine(async_mysql_url(source), pool_size=per_store,
+                                                 max_overflow=0, pool_pre_ping=True)
+            limits[store] = asyncio.Semaphore(per_store)
+
+    async def fetch(source, sql, params):
+        store = source["store"]
+        for attempt in range(1, attempts + 1):
+            try:
+                async with limits[store]:
+                    return await asyncio.wait_for(_query_frame(engines[store], sql, params), timeout)
+            except Exception as e:
+                if attempt == attempts:
+                    print(f"❗️ {store} query {params} failed after {attempts} attempts: {e!r}")
+                    return e
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                print(f"⚠️ {store} query {params} failed (attempt {attempt}/{attempts}): {e!r}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    try:
+        return await asyncio.gather(*(fetch(*r) for r in requests))
+    finally:
+        await asyncio.gather(*(engine.dispose() for engine in engines.values()))
+
+def fetch_frames(requests, per_store=DEFAULT_PER_STORE, timeout=DEFAULT_TIMEOUT, attempts=RETRY_ATTEMPTS):
+    """
+    Run (source, sql, params) requests against their store databases concurrently,
+    at most `per_store` at a time per store, each attempt bounded by `timeout`
+    and retried with backoff. Returns, in request order, a DataFrame or the
+    exception of a request that kept failing.
+    """
+    if not requests:
+        return []
+    return asyncio.run(_fetch_all(requests, per_store, timeout, attempts))
@@ -0,0 +1,14 @@
+import argparse
+from etl_common.locks import add_lock_args
+from etl_common.profiling import add_profile_args, profiler_from_args
+
+def run_options(job, argv=None, parser=None):
+    """
+    Parse the flags every entry point shares (--profile, --lock-wait/--skip-if-busy)
+    plus any the caller added to `parser`. args.profiler is ready to attach to RunMetrics.
+    """
+    parser = parser or argparse.ArgumentParser(description=f"osmart-etl {job}")
+    add_lock_args(add_profile_args(parser))
+    args = parser.parse_args(argv)
+    args.profiler = profiler_from_args(job, args)
+    return args
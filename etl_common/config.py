@@ -0,0 +1,39 @@
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
+CONFIG_PATH = Path(os.environ.get("OSMART_CONFIG", PROJECT_ROOT / "config.json"))
+
+# Long-lived connections: check them on checkout and recycle before MySQL's wait_timeout
+POOL_OPTIONS = {"pool_pre_ping": True, "pool_recycle": 1800}
+
+@lru_cache(maxsize=None)
+def load_config():
+    """config.json, read on first use rather than at import"""
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def mysql_url(db):
+    return f"mysql+pymysql://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['database']}"
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def analytics_engine():
+    """The process-wide pooled engine for the analytics DB (osmart_data), created on first use"""
+    return _cached_engine("analytics_db", lambda: load_config()["analytics_db"])
+
+def source_engine(source):
+    """Pooled engine for one SICAR store, shared by everything in the process that reads it"""
+    return _cached_engine(f"sicar:{source['store']}", lambda: source)
+
+def _cached_engine(key, db):
+    from sqlalchemy import create_engine
+
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(mysql_url(db()), **POOL_OPTIONS)
+        return _engines[key]
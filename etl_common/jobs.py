@@ -0,0 +1,189 @@
+import json
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from sqlalchemy import bindparam, text
+
+# Durable (stage, store) work queue in the analytics DB. Any number of workers
+# claim jobs with a lease they keep renewing; a job whose lease expires (worker
+# died or hung) is claimed again until it runs out of attempts.
+DEFAULT_LEASE = 900        # seconds a claim stays valid without a renewal
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY = 60           # seconds before a failed or released job is offered again
+
+CREATE_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS etl_jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    stage VARCHAR(32) NOT NULL,
+    store VARCHAR(50) NOT NULL,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lease_owner VARCHAR(100) NULL,
+    lease_expires_at DATETIME NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    result JSON NULL,
+    error TEXT NULL,
+    INDEX idx_claim (status, run_after),
+    INDEX idx_lease (status, lease_expires_at),
+    INDEX idx_stage_store (stage, store, status)
+)
+"""
+
+def create_jobs_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_JOBS_SQL))
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+def publish(conn, stage, store, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0):
+    """Enqueue (stage, store) unless it is already pending or running; returns True if enqueued"""
+    result = conn.execute(
+        text("""
+            INSERT INTO etl_jobs (stage, store, max_attempts, run_after)
+            SELECT :stage, :store, :max_attempts, NOW() + INTERVAL :delay SECOND
+            FROM DUAL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM etl_jobs
+                WHERE stage = :stage AND store = :store AND status IN ('pending', 'running')
+            )
+        """),
+        {"stage": stage, "store": store, "max_attempts": max_attempts, "delay": int(delay)}
+    )
+    return result.rowcount == 1
+
+def claim(engine, owner, stages=None, lease=DEFAULT_LEASE):
+    """
+    Lease the oldest runnable job: pending and due, or running with an expired
+    lease. SKIP LOCKED lets concurrent workers claim different rows (MySQL 8).
+    Returns the job as a dict, or None when there is nothing to do.
+    """
+    query = """
+        SELECT id, stage, store, attempts, max_attempts FROM etl_jobs
+        WHERE ((status = 'pending' AND run_after <= NOW())
+               OR (status = 'running' AND lease_expires_at < NOW()))
+    """
+    if stages:
+        query += " AND stage IN :stages"
+    query += " ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED"
+    select = text(query)
+    params = {}
+    if stages:
+        select = select.bindparams(bindparam("stages", expanding=True))
+        params["stages"] = list(stages)
+
+    while True:
+        with engine.begin() as conn:
+            row = conn.execute(select, params).mappings().first()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["attempts"] >= job["max_attempts"]:
+                # Its last attempt lost the lease: give up on it
+                conn.execute(
+                    text("""
+                        UPDATE etl_jobs SET status = 'failed', finished_at = NOW(), lease_owner = NULL,
+                               error = CONCAT_WS('\n', error, 'lease expired on the last attempt')
+                        WHERE id = :id
+                    """),
+                    {"id": job["id"]}
+                )
+                continue
+            conn.execute(
+                text("""
+                    UPDATE etl_jobs
+                    SET status = 'running', attempts = attempts + 1, lease_owner = :owner,
+                        lease_expires_at = NOW() + INTERVAL :lease SECOND, started_at = NOW()
+                    WHERE id = :id
+                """),
+                {"id": job["id"], "owner": owner, "lease": int(lease)}
+            )
+            job["attempts"] += 1
+            return job
+
+def renew(engine, job, owner, lease=DEFAULT_LEASE):
+    """Extend the lease; False if another worker has taken the job over"""
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("""
+                UPDATE etl_jobs SET lease_expires_at = NOW() + INTERVAL :lease SECOND
+                WHERE id = :id AND lease_owner = :owner AND status = 'running'
+            """),
+            {"id": job["id"], "owner": owner, "lease": int(lease)}
+        )
+    return result.rowcount == 1
+
+def complete(engine, job, owner, result=None):
+    """Mark the job done; False if the lease was lost meanwhile (the job will run again)"""
+    with engine.begin() as conn:
+        updated = conn.execute(
+            text("""
+                UPDATE etl_jobs
+                SET status = 'done', finished_at = NOW(), lease_owner = NULL, lease_expires_at = NULL,
+                    result = :result, error = NULL
+                WHERE id = :id AND lease_owner = :owner AND status = 'running'
+            """),
+            {"id": job["id"], "owner": owner, "result": json.dumps(result or {}, default=str)}
+        )
+    return updated.rowcount == 1
+
+def fail(engine, job, owner, error, retry_delay=RETRY_DELAY):
+    """Record an error; the job goes back to pending until it runs out of attempts"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                UPDATE etl_jobs
+                SET status = IF(attempts < max_attempts, 'pending', 'failed'),
+                    run_after = NOW() + INTERVAL :delay SECOND,
+                    finished_at = IF(attempts < max_attempts, NULL, NOW()),
+                    lease_owner = NULL, lease_expires_at = NULL, error = :error
+                WHERE id = :id AND lease_owner = :owner
+            """),
+            {"id": job["id"], "owner": owner, "error": str(error)[:10_000], "delay": int(retry_delay)}
+        )
+
+def release(engine, job, owner, delay=RETRY_DELAY):
+    """Hand the job back without counting the attempt (e.g. its store is locked by a cron run)"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                UPDATE etl_jobs
+                SET status = 'pending', attempts = attempts - 1, run_after = NOW() + INTERVAL :delay SECOND,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = :id AND lease_owner = :owner
+            """),
+            {"id": job["id"], "owner": owner, "delay": int(delay)}
+        )
+
+@contextmanager
+def leased(engine, job, owner, lease=DEFAULT_LEASE):
+    """Renew the job's lease in the background while the block runs"""
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease / 3):
+            try:
+                if not renew(engine, job, owner, lease):
+                    return  # taken over; complete() will report it
+            except Exception:
+                pass  # transient DB error: try again next beat, the lease has slack
+
+    beat = threading.Thread(target=heartbeat, name=f"lease-{job['id']}", daemon=True)
+    beat.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        beat.join()
+
+def queue_summary(conn):
+    """Job counts per stage and status"""
+    rows = conn.execute(
+        text("SELECT stage, status, COUNT(*) AS jobs FROM etl_jobs GROUP BY stage, status ORDER BY stage, status")
+    ).mappings().all()
+    return [dict(r) for r in rows]
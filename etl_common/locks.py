@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from sqlalchemy import text
+
+# Writer stages. Updates lock (stage, store); seeds, which rebuild a whole table, lock every store.
+SALES = "sales"                          # ventas_limpias, rollups, etl_progress.last_processed_ven_id
+RAW_STOCK_MOVEMENTS = "raw_stock_movements"
+STOCK_POINTS = "stock_points"
+STOCK_ASOF = "stock_asof"
+
+DEFAULT_LOCK_WAIT = 600  # seconds; 0 = skip if busy
+
+class LockBusy(RuntimeError):
+    pass
+
+def lock_name(stage, store):
+    return f"osmart_etl:{stage}:{store}"[:64]  # MySQL limit for lock names
+
+def add_lock_args(parser):
+    parser.add_argument("--lock-wait", type=float, default=DEFAULT_LOCK_WAIT,
+                        help="seconds to wait for a busy store/stage before skipping it")
+    parser.add_argument("--skip-if-busy", dest="lock_wait", action="store_const", const=0,
+                        help="skip stores another run is working on (same as --lock-wait 0)")
+    return parser
+
+@contextmanager
+def stage_lock(engine, stage, stores, wait=DEFAULT_LOCK_WAIT):
+    """
+    Hold MySQL advisory locks (GET_LOCK) for `stage` on each store in `stores`
+    (a name or a list) for the duration of the block. The locks live on a
+    dedicated connection, so MySQL also drops them if the process dies.
+    Raises LockBusy if any of them is not free within `wait` seconds.
+    """
+    stores = [stores] if isinstance(stores, str) else sorted(set(stores))  # fixed order: no deadlocks
+    conn = engine.connect()
+    held = []
+    try:
+        for store in stores:
+            name = lock_name(stage, store)
+            got = conn.execute(text("SELECT GET_LOCK(:name, :wait)"), {"name": name, "wait": wait}).scalar()
+            if got != 1:
+                raise LockBusy(f"{stage} for {store} is locked by another run")
+            held.append(name)
+        yield
+    finally:
+        for name in reversed(held):
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+        conn.close()
@@ -0,0 +1,146 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
+# Point this at node_exporter's textfile collector directory to scrape the .prom files
+METRICS_DIR = Path(os.environ.get("OSMART_METRICS_DIR", PROJECT_ROOT / "metrics"))
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+class RunMetrics:
+    """
+    Per-run instrumentation shared by every entry point: timed spans per
+    (stage, store), row/byte counters and peak RSS per store. write() emits a
+    JSON report and a Prometheus textfile named after the job.
+
+    Set `profiler` (etl_common.profiling.Profiler, from --profile) to also
+    profile the spans; write() then closes it and writes its artifacts.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self.spans = []
+        self.counters = defaultdict(float)
+        self.store_peak_rss = {}
+        self.profiler = None
+
+    @contextmanager
+    def span(self, stage, store=None):
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            if self.profiler is None:
+                yield
+            else:
+                with self.profiler.stage(stage, store):
+                    yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.spans.append({
+                "stage": stage,
+                "store": store,
+                "seconds": round(time.perf_counter() - t0, 6),
+                "status": status,
+            })
+            if store is not None:
+                self.store_peak_rss[store] = peak_rss_bytes()
+
+    def timed(self, iterable, stage, store=None):
+        """Yield from iterable, charging the time spent producing each item to `stage`"""
+        it = iter(iterable)
+        while True:
+            with self.span(stage, store):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def add(self, name, value, stage, store=None):
+        self.counters[(name, stage, store)] += value
+
+    def add_frame(self, df, stage, store=None):
+        """Count rows and in-memory bytes of a DataFrame handled by `stage`"""
+        self.add("rows", len(df), stage, store)
+        self.add("bytes", int(df.memory_usage(index=False, deep=True).sum()), stage, store)
+
+    def report(self):
+        failed = any(s["status"] == "error" for s in self.spans)
+        totals = defaultdict(float)
+        for s in self.spans:
+            totals[(s["stage"], s["store"])] += s["seconds"]
+
+        return {
+            "job": self.job,
+            "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "duration_s": round(time.time() - self.started, 3),
+            "status": "error" if failed else "ok",
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": [
+                {"stage": stage, "store": store, "seconds": round(sec, 6)}
+                for (stage, store), sec in totals.items()
+            ],
+            "counters": [
+                {"name": name, "stage": stage, "store": store, "value": value}
+                for (name, stage, store), value in self.counters.items()
+            ],
+            "store_peak_rss_bytes": self.store_peak_rss,
+            "spans": self.spans,
+        }
+
+    def prometheus(self, report):
+        def labels(**kv):
+            inner = ",".join(f'{k}="{_escape(v)}"' for k, v in kv.items() if v is not None)
+            return "{" + inner + "}"
+
+        lines = [
+            "# TYPE osmart_etl_stage_seconds gauge",
+            *[f"osmart_etl_stage_seconds{labels(job=self.job, stage=s['stage'], store=s['store'])} {s['seconds']}"
+              for s in report["stages"]],
+            "# TYPE osmart_etl_rows gauge",
+            "# TYPE osmart_etl_bytes gauge",
+            *[f"osmart_etl_{c['name']}{labels(job=self.job, stage=c['stage'], store=c['store'])} {c['value']:g}"
+              for c in report["counters"]],
+            "# TYPE osmart_etl_store_peak_rss_bytes gauge",
+            *[f"osmart_etl_store_peak_rss_bytes{labels(job=self.job, store=store)} {rss}"
+              for store, rss in report["store_peak_rss_bytes"].items()],
+            "# TYPE osmart_etl_run_duration_seconds gauge",
+            f"osmart_etl_run_duration_seconds{labels(job=self.job)} {report['duration_s']}",
+            "# TYPE osmart_etl_run_success gauge",
+            f"osmart_etl_run_success{labels(job=self.job)} {int(report['status'] == 'ok')}",
+            "# TYPE osmart_etl_last_run_timestamp_seconds gauge",
+            f"osmart_etl_last_run_timestamp_seconds{labels(job=self.job)} {int(time.time())}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, out_dir=None):
+        """Write <job>.json and <job>.prom atomically; returns the report"""
+        out_dir = Path(out_dir or METRICS_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        if self.profiler is not None:
+            report["profile_dir"] = str(self.profiler.close())
+            self.profiler = None
+        _atomic_write(out_dir / f"{self.job}.json", json.dumps(report, indent=2, default=str))
+        _atomic_write(out_dir / f"{self.job}.prom", self.prometheus(report))
+        return report
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _atomic_write(path, content):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
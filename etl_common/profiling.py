@@ -0,0 +1,142 @@
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
+PROFILES_DIR = PROJECT_ROOT / "profiles"
+DEFAULT_STAGES = ("extract", "transform", "load", "get_existing_stock_data")
+
+def add_profile_args(parser):
+    parser.add_argument(
+        "--profile", nargs="*", metavar="STAGE", default=None,
+        help=f"profile these stages with cProfile/tracemalloc and time SQL "
+             f"(no stage names: {', '.join(DEFAULT_STAGES)})"
+    )
+    parser.add_argument("--profile-dir", type=Path, default=PROFILES_DIR)
+    parser.add_argument("--profile-top", type=int, default=20, help="slow queries / functions listed per report")
+    return parser
+
+def profiler_from_args(job, args):
+    """Profiler for parsed --profile flags; None unless --profile was given"""
+    if args.profile is None:
+        return None
+    return Profiler(job, stages=args.profile or DEFAULT_STAGES, out_dir=args.profile_dir, top=args.profile_top)
+
+class Profiler:
+    """
+    Opt-in diagnostics for one run. RunMetrics calls stage() around every span;
+    selected stages accumulate a cProfile and traced memory per (stage, store),
+    and every SQL statement is timed through SQLAlchemy cursor events.
+    close() writes everything under <out_dir>/<job>_<timestamp>/.
+    """
+    def __init__(self, job, stages=DEFAULT_STAGES, out_dir=PROFILES_DIR, top=20):
+        self.job = job
+        self.stages = set(stages)
+        self.top = top
+        self.run_dir = Path(out_dir) / f"{job}_{time.strftime('%Y%m%dT%H%M%S')}"
+        self.profiles = {}
+        self.memory = {}
+        self.queries = defaultdict(lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0, "stages": set()})
+        self._active = None
+        self._listening = False
+        tracemalloc.start()
+        self._watch_sql()
+
+    @contextmanager
+    def stage(self, stage, store=None):
+        # cProfile cannot nest, so an inner span inherits the outer one's profile
+        if stage not in self.stages or self._active is not None:
+            yield
+            return
+
+        key = (stage, store)
+        prof = self.profiles.setdefault(key, cProfile.Profile())
+        self._active = key
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            self._active = None
+            _, peak = tracemalloc.get_traced_memory()
+            prev = self.memory.get(key)
+            if prev is None or peak > prev["peak"]:
+                diff = tracemalloc.take_snapshot().compare_to(before, "lineno")
+                self.memory[key] = {"peak": peak, "diff": diff[: self.top]}
+
+    def _watch_sql(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("_profile_t0", []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["_profile_t0"].pop()
+            q = self.queries[_normalize_sql(statement)]
+            q["count"] += 1
+            q["total_s"] += elapsed
+            q["max_s"] = max(q["max_s"], elapsed)
+            q["stages"].add("/".join(str(p) for p in self._active if p) if self._active else "-")
+
+        # Listening on the Engine class covers engines created inside helpers (e.g. extract.py)
+        event.listen(Engine, "before_cursor_execute", before)
+        event.listen(Engine, "after_cursor_execute", after)
+        self._hooks = (before, after)
+        self._listening = True
+
+    def close(self):
+        """Write per-stage artifacts and the slow-query summary; returns the output directory"""
+        if self._listening:
+            from sqlalchemy import event
+            from sqlalchemy.engine import Engine
+            event.remove(Engine, "before_cursor_execute", self._hooks[0])
+            event.remove(Engine, "after_cursor_execute", self._hooks[1])
+            self._listening = False
+        tracemalloc.stop()
+
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        for (stage, store), prof in self.profiles.items():
+            name = _slug(stage, store)
+            prof.dump_stats(self.run_dir / f"{name}.prof")
+
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(self.top)
+            (self.run_dir / f"{name}.txt").write_text(buf.getvalue(), encoding="utf-8")
+
+        for (stage, store), mem in self.memory.items():
+            lines = [f"peak traced memory: {mem['peak'] / 2**20:.1f} MB", "top allocations during the stage:"]
+            lines += [str(stat) for stat in mem["diff"]]
+            (self.run_dir / f"{_slug(stage, store)}.mem.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        slow = sorted(self.queries.items(), key=lambda kv: kv[1]["total_s"], reverse=True)[: self.top]
+        summary = [
+            {"sql": sql, "count": q["count"], "total_s": round(q["total_s"], 4),
+             "max_s": round(q["max_s"], 4), "stages": sorted(q["stages"])}
+            for sql, q in slow
+        ]
+        (self.run_dir / "slow_queries.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+        print(f"\n🐢 Top {len(summary)} SQL statements by total time:")
+        for q in summary:
+            print(f"{q['total_s']:>9.3f}s {q['count']:>6}x max {q['max_s']:.3f}s  {q['sql'][:100]}")
+        print(f"🔬 Profiles written to {self.run_dir}")
+        return self.run_dir
+
+def _normalize_sql(statement):
+    """Collapse whitespace and multi-row VALUES lists so repeated statements group together"""
+    sql = re.sub(r"\s+", " ", statement).strip()
+    sql = re.sub(r"VALUES \(.*\)", "VALUES (...)", sql, flags=re.IGNORECASE)
+    return sql[:300]
+
+def _slug(stage, store):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{stage}_{store}" if store else stage)
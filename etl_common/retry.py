@@ -0,0 +1,84 @@
+import random
+import time
+from sqlalchemy import text
+
+# Per-batch retries inside one run, then a persisted queue of the windows that
+# still failed so later runs replay them instead of losing them.
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2   # seconds; doubles per attempt
+RETRY_MAX_DELAY = 60
+
+def with_retries(fn, what, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """Call fn() until it succeeds, sleeping with jittered exponential backoff; re-raises the last error"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            print(f"\n⚠️ {what} failed (attempt {attempt}/{attempts}): {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+CREATE_FAILED_WINDOWS_SQL = """
+CREATE TABLE IF NOT EXISTS etl_failed_windows (
+    stage VARCHAR(32) NOT NULL,
+    store VARCHAR(50) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    failures INT NOT NULL DEFAULT 1,
+    error TEXT NULL,
+    first_failed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_failed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    resolved_at DATETIME NULL,
+    PRIMARY KEY (stage, store, start_date, end_date),
+    INDEX idx_pending (stage, store, resolved_at)
+)
+"""
+
+def pending_windows(engine, stage, store):
+    """Unresolved (start_date, end_date) windows for a store, oldest first, as ISO strings"""
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_FAILED_WINDOWS_SQL))
+        rows = conn.execute(
+            text("""
+                SELECT start_date, end_date FROM etl_failed_windows
+                WHERE stage = :stage AND store = :store AND resolved_at IS NULL
+                ORDER BY start_date, end_date
+            """),
+            {"stage": stage, "store": store}
+        ).fetchall()
+    return [(r[0].isoformat(), r[1].isoformat()) for r in rows]
+
+def settle_windows(engine, stage, store, attempted, failed):
+    """
+    Record the outcome of an extraction: windows in `failed` ((start, end, error)
+    tuples) are queued or have their failure count bumped; every other window
+    in `attempted` is marked resolved.
+    """
+    failed_keys = {(start, end) for start, end, _ in failed}
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_FAILED_WINDOWS_SQL))
+        for start, end, error in failed:
+            conn.execute(
+                text("""
+                    INSERT INTO etl_failed_windows (stage, store, start_date, end_date, error)
+                    VALUES (:stage, :store, :start, :end, :error)
+                    ON DUPLICATE KEY UPDATE failures = failures + 1, error = VALUES(error),
+                                            last_failed_at = NOW(), resolved_at = NULL
+                """),
+                {"stage": stage, "store": store, "start": start, "end": end, "error": str(error)[:10_000]}
+            )
+        resolved = [{"stage": stage, "store": store, "start": start, "end": end}
+                    for start, end in attempted if (start, end) not in failed_keys]
+        if resolved:
+            conn.execute(
+                text("""
+                    UPDATE etl_failed_windows SET resolved_at = NOW()
+                    WHERE stage = :stage AND store = :store AND start_date = :start AND end_date = :end
+                      AND resolved_at IS NULL
+                """),
+                resolved
+            )
+    if failed:
+        print(f"❗️ {len(failed)} {stage} windows for {store} queued for the next run")
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# Declared compact dtypes for frames right after fetch. Low-cardinality text goes
+# to category, ids to 32-bit ints, timestamps to datetime64, nullable counts to Int64
+# (rounded, like the BIGINT columns they load into) and money to int64 cents
+# (non-nullable: the extraction SQL turns NULL amounts into 0).
+STOCK_MOVEMENTS = {
+    "art_id": "int32",
+    "tienda_id": "int32",
+    "fecha": "datetime64[ns]",
+    "tipo_movimiento": "category",
+    "is_absolute": "int8",
+    "delta_cantidad": "Int64",
+    "abs_stock_after": "Int64",
+    "id_origen": "Int64",
+    "tabla_origen": "category",
+    "usuario": "category",
+    "extracted_at": "datetime64[ns]",
+}
+
+# Output of extract_filter_raw_stock_movements*.sql (NaN-carrying columns stay float)
+FILTERED_MOVEMENTS = {
+    "art_id": "int32",
+    "fecha": "datetime64[ns]",
+    "is_absolute": "int8",
+    "delta_cantidad": "float64",
+    "abs_stock_after": "float64",
+    "raw_id": "int64",
+    "tipo_movimiento": "category",
+    "tabla_origen": "category",
+    "id_origen": "object",  # VARCHAR in raw_stock_movements
+}
+
+STOCK_POINTS = {
+    "store_id": "int32",
+    "art_id": "int32",
+    "point_date": "datetime64[ns]",
+    "sod_stock": "int64",
+}
+
+SICAR_SALES = {
+    "ven_id": "int32",
+    "fecha_hora": "datetime64[ns]",
+    "caja": "category",
+    "usuario": "category",
+    "efectivo": "int64",  # money in integer cents (see etl_sales/money.py)
+    "tarjeta": "int64",
+    "otros": "int64",
+    "total_venta": "int64",
+    "tienda": "category",
+    "source_db": "category",
+    "source_system": "category",
+    "extracted_at": "datetime64[ns]",
+}
+
+# fecha/usuhora stay as text: transform.py combines them into fecha_hora
+LEGACY_SALES = {
+    "venta": "int32",
+    "caja": "category",
+    "usuario": "category",
+    "total": "int64",  # money in integer cents
+    "tarjeta_in": "int64",
+    "efectivo_in": "int64",
+    "otros_in": "int64",
+    "cobranza_aplicada": "int64",
+    "egresos": "int64",
+    "tienda": "category",
+    "source_db": "category",
+    "source_system": "category",
+    "extracted_at": "datetime64[ns]",
+}
+
+def extraction_timestamp():
+    """One datetime64 stamp per batch instead of a formatted string on every row"""
+    return pd.Timestamp.now().floor("s")
+
+def apply_schema(df, schema):
+    """Cast the declared columns present in df; unknown columns are left as-is"""
+    casts = {col: dtype for col, dtype in schema.items() if col in df.columns}
+    for col, dtype in casts.items():
+        if dtype.startswith("datetime64"):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif dtype in ("float64", "int64", "Int64"):
+            # DECIMAL/BIGINT columns can arrive as Python objects (Decimal, int)
+            values = pd.to_numeric(df[col], errors="coerce") if df[col].dtype == object else df[col]
+            if dtype != "float64" and values.dtype.kind == "f":
+                # Fractional quantities (Decimal('2.500')) can't be cast to ints as-is:
+                # round half away from zero, as MySQL does storing them in BIGINT
+                values = np.trunc(values + np.copysign(0.5, values))
+            df[col] = values.astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def memory_report(df):
+    """Short per-batch memory footprint: total and the three heaviest columns"""
+    usage = df.memory_usage(index=False, deep=True)
+    top = usage.sort_values(ascending=False).head(3)
+    detail = ", ".join(f"{col} {_fmt_bytes(n)}" for col, n in top.items())
+    return f"{_fmt_bytes(usage.sum())} in memory ({detail})"
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
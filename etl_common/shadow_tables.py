@@ -0,0 +1,101 @@
+import math
+import pandas as pd
+from sqlalchemy import text
+
+# Rebuilds load into <table>__next and only replace the live table once the
+# copy is complete and verified, so readers never see a half-built table.
+SHADOW_SUFFIX = "__next"
+OLD_SUFFIX = "__old"
+
+def shadow_name(table):
+    return f"{table}{SHADOW_SUFFIX}"
+
+def run_sql_script(engine, sql):
+    """Execute a ';'-separated SQL script in a single transaction"""
+    with engine.begin() as conn:
+        for query in sql.split(';'):
+            if query.strip():
+                conn.execute(text(query))
+
+class LoadTally:
+    """
+    Tracks what a loader wrote into a shadow table (row count + column sum).
+    When key_cols is given, rows are de-duplicated last-wins on those keys,
+    mirroring what an upsert leaves in the table.
+    """
+    def __init__(self, checksum_col, key_cols=None):
+        self.checksum_col = checksum_col
+        self.key_cols = key_cols
+        self._frames = []
+        self._rows = 0
+        self._checksum = 0
+
+    def add(self, df):
+        if self.key_cols:
+            self._frames.append(df[self.key_cols + [self.checksum_col]])
+        else:
+            self._rows += len(df)
+            self._checksum += _exact_sum(df[self.checksum_col])
+
+    def add_totals(self, rows, checksum):
+        """Account for rows loaded server-side (INSERT ... SELECT) without fetching them"""
+        if self.key_cols:
+            raise ValueError("add_totals cannot de-duplicate on key_cols")
+        self._rows += rows
+        self._checksum += checksum
+
+    def expected(self):
+        if not self.key_cols:
+            return self._rows, self._checksum
+        if not self._frames:
+            return 0, 0
+        combined = pd.concat(self._frames, ignore_index=True)
+        combined = combined.drop_duplicates(subset=self.key_cols, keep="last")
+        return len(combined), _exact_sum(combined[self.checksum_col])
+
+def _exact_sum(series):
+    values = pd.to_numeric(series, errors="coerce").dropna()
+    if pd.api.types.is_integer_dtype(values):
+        return int(values.sum())
+    return math.fsum(values)
+
+def table_stats(conn, table, checksum_col):
+    row = conn.execute(
+        text(f"SELECT COUNT(*), COALESCE(SUM({checksum_col}), 0) FROM `{table}`")
+    ).fetchone()
+    return int(row[0]), row[1]
+
+def verify_shadow(engine, table, tally, tolerance=0):
+    """
+    Compare the shadow table against what the loader wrote; raise before any swap on mismatch.
+    `tolerance` is the allowed checksum difference per row (e.g. DECIMAL rounding on load).
+    """
+    expected_rows, expected_sum = tally.expected()
+    with engine.connect() as conn:
+        rows, checksum = table_stats(conn, shadow_name(table), tally.checksum_col)
+
+    print(f"🔍 Verifying {shadow_name(table)}: rows={rows} (expected {expected_rows}), "
+          f"sum({tally.checksum_col})={checksum} (expected {expected_sum})")
+
+    if rows != expected_rows:
+        raise RuntimeError(f"{shadow_name(table)} has {rows} rows, expected {expected_rows}")
+    if abs(float(checksum) - float(expected_sum)) > tolerance * rows:
+        raise RuntimeError(
+            f"{shadow_name(table)} checksum mismatch on {tally.checksum_col}: {checksum} != {expected_sum}"
+        )
+
+def swap_shadow(engine, table):
+    """Atomically replace `table` with `table__next` using a single RENAME TABLE"""
+    shadow, old = shadow_name(table), f"{table}{OLD_SUFFIX}"
+
+    with engine.begin() as conn:
+        live_exists = conn.execute(text("SHOW TABLES LIKE :t"), {"t": table}).fetchone() is not None
+        conn.execute(text(f"DROP TABLE IF EXISTS `{old}`"))
+
+        if live_exists:
+            conn.execute(text(f"RENAME TABLE `{table}` TO `{old}`, `{shadow}` TO `{table}`"))
+            conn.execute(text(f"DROP TABLE `{old}`"))
+        else:
+            conn.execute(text(f"RENAME TABLE `{shadow}` TO `{table}`"))
+
+    print(f"🔁 Swapped {shadow} into {table}")
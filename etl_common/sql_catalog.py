@@ -0,0 +1,32 @@
+from functools import lru_cache
+from pathlib import Path
+from sqlalchemy import text
+
+class SqlCatalog:
+    """
+    The .sql files of one directory, all read the first time any of them is
+    needed and kept for the life of the process; text() constructs are built
+    once per file. Lookups never depend on the working directory.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory).resolve()
+
+    def source(self, name):
+        """Raw SQL of `name` (e.g. for ';'-separated scripts)"""
+        files = _read_dir(self.directory)
+        if name not in files:
+            raise KeyError(f"{name} not found in {self.directory}")
+        return files[name]
+
+    def text(self, name):
+        """Compiled-once sqlalchemy text() for `name`"""
+        self.source(name)
+        return _compiled(self.directory, name)
+
+@lru_cache(maxsize=None)
+def _read_dir(directory):
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(directory.glob("*.sql"))}
+
+@lru_cache(maxsize=None)
+def _compiled(directory, name):
+    return text(_read_dir(directory)[name])
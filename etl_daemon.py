@@ -0,0 +1,96 @@
+"""
+Long-running alternative to the run_etl.sh cron.
+
+    python -m etl_daemon --sales-interval 30 --inventory-interval 3600
+
+Keeps pooled engines and each store's last_processed_ven_id in memory and
+polls every SICAR store for sales with ven_id beyond it (the
+extract_latest_sicar_sales.sql logic), upserting small batches into
+ventas_limpias. The inventory updates (raw movements, stock points, stock as-of) run
+on their own schedule in a background thread so they never delay the sales
+polls. Every store is processed under the same advisory locks as the cron
+scripts, without waiting: a busy store is picked up on the next cycle.
+SIGINT/SIGTERM finish the current batch and exit.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import SALES, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_inventory import update_raw_stock_movements, update_stock_points, update_stock_asof
+from etl_sales.sales_poller import SalesPoller
+
+def run_inventory_loop(interval, stop):
+    """Raw movements, stock points, then the stock as-of table, every `interval` seconds until stopped"""
+    stages = [
+        (update_raw_stock_movements, "update_raw_stock_movements"),
+        (update_stock_points, "update_stock_points"),
+        (update_stock_asof, "update_stock_asof"),
+    ]
+    while not stop.is_set():
+        for module, job in stages:
+            if stop.is_set():
+                break
+            module.metrics = RunMetrics(job)  # fresh report per run
+            try:
+                module.main(["--skip-if-busy"])  # skip stores a cron/seed run is working on
+            except Exception as e:
+                logging.error(f"❗️ {job} failed: {e}")
+        stop.wait(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales-interval", type=float, default=30, help="seconds between polls of each store")
+    parser.add_argument("--inventory-interval", type=float, default=3600, help="seconds between inventory updates")
+    parser.add_argument("--no-inventory", action="store_true", help="only sync sales")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # The same pooled engine the inventory updaters use
+    engine = analytics_engine()
+
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        logging.info("🛑 Stop requested, finishing current work...")
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    inventory = None
+    if not args.no_inventory:
+        inventory = threading.Thread(
+            target=run_inventory_loop, args=(args.inventory_interval, stop), name="inventory", daemon=True
+        )
+        inventory.start()
+
+    poller = SalesPoller(engine, load_config()["sicar_sources"])
+    logging.info(f"🚀 Polling {len(poller.sources)} stores every {args.sales_interval}s")
+    while not stop.is_set():
+        cycle_start = time.monotonic()
+        metrics = RunMetrics("daemon_sales")
+        for source in poller.sources:
+            if stop.is_set():
+                break
+            try:
+                # Never wait on a cron run or reconcile holding the store; catch it next cycle
+                with stage_lock(engine, SALES, source["store"], wait=0):
+                    poller.poll(source, metrics)
+            except LockBusy:
+                logging.info(f"⏭️ {source['store']} busy, skipping this poll")
+                poller.forget(source["store"])  # the other run may move the checkpoint
+            except Exception as e:
+                logging.error(f"❗️ Sales sync failed for {source['store']}: {e}")
+                poller.forget(source["store"])
+        metrics.write()
+        stop.wait(max(0.0, args.sales_interval - (time.monotonic() - cycle_start)))
+
+    if inventory is not None:
+        inventory.join()
+    logging.info("👋 Daemon stopped")
+
+if __name__ == "__main__":
+    main()
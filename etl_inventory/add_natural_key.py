@@ -0,0 +1,80 @@
+"""
+One-off: add the uq_natural key to a raw_stock_movements seeded before it (a
+fresh seed_raw_stock_movements run builds it with the key).
+
+    python -m etl_inventory.add_natural_key
+
+Rows already sharing a natural key are merged first (sql/dedup_natural_key.sql),
+then the daily flows of the stores that had any are rebuilt from the first day
+touched. Until the key exists, update_raw_stock_movements keeps filtering to
+rows newer than its checkpoint instead of re-extracting an overlap.
+"""
+import sys
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.shadow_tables import run_sql_script
+from etl_inventory.queries import SQL
+from etl_inventory.raw_stock_movements_helpers import has_natural_key, resolve_traspasos
+from etl_inventory.stock_flows import create_flows_table, rebuild_store_flows
+
+metrics = RunMetrics("add_natural_key")
+
+def merge_duplicates(engine):
+    """Merge the rows sharing a natural key; returns {store_id: first day touched} and the rows removed"""
+    with metrics.span("load"), engine.begin() as conn:
+        before = conn.execute(text("SELECT COUNT(*) FROM raw_stock_movements")).scalar()
+        for query in SQL.source("dedup_natural_key.sql").split(";"):
+            if query.strip():
+                conn.execute(text(query))
+        removed = before - conn.execute(text("SELECT COUNT(*) FROM raw_stock_movements")).scalar()
+
+        # Dropped duplicates can change which traspaso cancellation counts
+        resolve_traspasos(conn, "SELECT DISTINCT tienda_id, id_origen, art_id FROM _natural_dups "
+                                "WHERE tabla_origen = 'Traspaso'")
+        first_days = dict(conn.execute(
+            text("SELECT tienda_id, DATE(MIN(fecha)) FROM _natural_dups GROUP BY tienda_id")
+        ).all())
+        conn.execute(text("DROP TEMPORARY TABLE _natural_dups"))
+    metrics.add("rows_removed", removed, "load")
+    return first_days, removed
+
+def migrate(engine, sources):
+    with engine.connect() as conn:
+        if has_natural_key(conn):
+            print("✅ raw_stock_movements already has uq_natural")
+            return
+
+    first_days, removed = merge_duplicates(engine)
+    print(f"🧹 {removed} duplicate rows merged in {len(first_days)} stores")
+    with metrics.span("load"):
+        run_sql_script(engine, SQL.source("add_natural_key.sql"))
+    print("🔑 uq_natural added to raw_stock_movements")
+
+    with engine.begin() as conn:
+        create_flows_table(conn)
+    for source in sources:
+        if source["store_id"] in first_days:
+            rebuild_store_flows(engine, source, first_days[source["store_id"]])
+    if removed:
+        print("⚠️ Stock points were replayed with the duplicates: run etl_inventory.seed_stock_points")
+
+def main(argv=None):
+    options = run_options("add_natural_key", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    sources = load_config()["sicar_sources"]
+
+    # Rewrites rows of every store: keep the loaders off the whole table meanwhile
+    try:
+        with stage_lock(engine, RAW_STOCK_MOVEMENTS, [s["store"] for s in sources], options.lock_wait):
+            migrate(engine, sources)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not migrating")
+    finally:
+        metrics.write()
+
+if __name__ == "__main__":
+    main()
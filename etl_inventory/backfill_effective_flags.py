@@ -0,0 +1,64 @@
+"""
+One-off: add and fill raw_stock_movements.is_effective/dedup_rank on a table
+seeded before they existed (a fresh seed_raw_stock_movements run sets them too).
+
+    python -m etl_inventory.backfill_effective_flags
+"""
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.shadow_tables import run_sql_script
+from etl_inventory.queries import SQL
+from etl_inventory.raw_stock_movements_helpers import resolve_traspasos
+
+metrics = RunMetrics("backfill_effective_flags")
+
+def has_flags(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'raw_stock_movements'
+              AND column_name = 'is_effective'
+        """)).scalar() > 0
+
+def backfill_store(engine, source):
+    """Flag one store's ajustes and resolve all of its traspaso lines; returns the rows changed"""
+    store = source["store"]
+    with metrics.span("load", store), engine.begin() as conn:
+        changed = conn.execute(
+            text("""
+                UPDATE raw_stock_movements SET is_effective = 0
+                WHERE tienda_id = :store_id AND tabla_origen = 'ajusteinventario' AND is_absolute <> 1
+            """),
+            {"store_id": source["store_id"]}
+        ).rowcount
+        changed += resolve_traspasos(
+            conn,
+            "SELECT DISTINCT tienda_id, id_origen, art_id FROM raw_stock_movements "
+            "WHERE tienda_id = :store_id AND tabla_origen = 'Traspaso'",
+            params={"store_id": source["store_id"]}
+        )
+    metrics.add("rows_flagged", changed, "load", store)
+    return changed
+
+def main(argv=None):
+    options = run_options("backfill_effective_flags", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+
+    if not has_flags(engine):
+        print("🧱 Adding is_effective/dedup_rank to raw_stock_movements")
+        run_sql_script(engine, SQL.source("add_effective_flags.sql"))
+
+    for source in load_config()["sicar_sources"]:
+        try:
+            with stage_lock(engine, RAW_STOCK_MOVEMENTS, source["store"], options.lock_wait):
+                print(f"✅ {source['name']}: {backfill_store(engine, source)} rows flagged")
+        except LockBusy as e:
+            print(f"⏭️ Skipping {source['name']}: {e}")
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Keep raw_stock_movements bounded: write month-start stock anchors, then move
+raw movements older than the retention horizon to compressed local files.
+
+    python -m etl_inventory.compact_raw_stock_movements --keep-months 12
+    python -m etl_inventory.compact_raw_stock_movements --anchors-only
+
+Per store, under the raw movements and stock points locks:
+1. stock_anchors gets a full SOD snapshot for every month start up to the
+   stock points checkpoint (from stock_points, which holds the same values).
+2. Months before the cutoff are written one Parquet file each to
+   archive/raw_stock_movements/<store>/ and deleted from MySQL. The cutoff is
+   the latest anchor no later than the horizon, the stock points checkpoint and
+   the stock as-of progress, so the incremental updaters never need an
+   archived row and seed_stock_points can replay from that anchor.
+Traspaso cancellations whose original movement was archived no longer match
+it, so the horizon should be far longer than any cancellation delay.
+"""
+import argparse
+import os
+from datetime import date
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, STOCK_POINTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_inventory.queries import SQL
+from etl_inventory.stock_anchors import anchor_dates, create_anchors_table, write_anchors
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+ARCHIVE_DIR = PACKAGE_DIR / "archive"
+DEFAULT_KEEP_MONTHS = 12
+
+metrics = RunMetrics("compact_raw_stock_movements")
+
+def compaction_cutoff(conn, source, keep_months):
+    """Latest anchor the store's raw movements can be archived up to, or None"""
+    horizon = (pd.Timestamp(date.today()) - pd.DateOffset(months=keep_months)).date()
+    limits = [horizon]
+
+    last_points_dt = conn.execute(SQL.text("get_last_points_dt.sql"), {"store_name": source["store"]}).scalar()
+    if last_points_dt is None:
+        return None
+    limits.append(last_points_dt)
+
+    has_asof = conn.execute(text("SHOW TABLES LIKE 'stock_movements_asof'")).fetchone() is not None
+    if has_asof:
+        last_asof_dt = conn.execute(
+            text("SELECT DATE(MAX(fecha)) FROM stock_movements_asof WHERE store_id = :store_id"),
+            {"store_id": source["store_id"]}
+        ).scalar()
+        if last_asof_dt is not None:
+            limits.append(last_asof_dt)
+
+    eligible = [d for d in anchor_dates(conn, source["store_id"]) if d <= min(limits)]
+    return eligible[-1] if eligible else None
+
+def archive_month(engine, source, month_start, archive_dir, run_id):
+    """Write one month of a store's raw movements to Parquet, then delete them; returns the rows moved"""
+    store = source["store"]
+    params = {"store_id": source["store_id"], "start": month_start,
+              "end": (pd.Timestamp(month_start) + pd.DateOffset(months=1)).date()}
+    where = "tienda_id = :store_id AND fecha >= :start AND fecha < :end"
+
+    with metrics.span("extract", store), engine.connect() as conn:
+        df = pd.read_sql_query(text(f"SELECT * FROM raw_stock_movements WHERE {where} ORDER BY id"),
+                               conn, params=params)
+    if df.empty:
+        return 0
+    metrics.add_frame(df, "extract", store)
+
+    path = archive_dir / "raw_stock_movements" / store / f"{month_start:%Y-%m}_{run_id}.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    df.to_parquet(tmp_path, index=False, compression="zstd")
+    os.replace(tmp_path, path)
+
+    # Only the rows that are in the file; the store's locks keep loaders out meanwhile
+    with metrics.span("load", store), engine.begin() as conn:
+        deleted = conn.execute(text(f"DELETE FROM raw_stock_movements WHERE {where} AND id <= :max_id"),
+                               {**params, "max_id": int(df["id"].max())}).rowcount
+    if deleted != len(df):
+        print(f"⚠️ {store} {month_start:%Y-%m}: archived {len(df)} rows but deleted {deleted}")
+    print(f"🗄️ {store} {month_start:%Y-%m}: {len(df)} raw movements archived to {path}")
+    return len(df)
+
+def compact_store(engine, source, keep_months, archive_dir, run_id, anchors_only=False):
+    store = source["store"]
+    with metrics.span("anchors", store), engine.begin() as conn:
+        last_points_dt = conn.execute(SQL.text("get_last_points_dt.sql"), {"store_name": store}).scalar()
+        written = write_anchors(conn, source["store_id"], last_points_dt) if last_points_dt else []
+    if written:
+        print(f"⚓ {store}: anchors for {', '.join(f'{d:%Y-%m}' for d in written)}")
+    if anchors_only:
+        return 0
+
+    with engine.connect() as conn:
+        cutoff = compaction_cutoff(conn, source, keep_months)
+        if cutoff is None:
+            print(f"ℹ️ {store}: no anchor old enough to archive up to")
+            return 0
+        months = conn.execute(
+            text("""
+                SELECT DISTINCT DATE_FORMAT(fecha, '%Y-%m-01') FROM raw_stock_movements
+                WHERE tienda_id = :store_id AND fecha < :cutoff
+            """),
+            {"store_id": source["store_id"], "cutoff": cutoff}
+        ).scalars().all()
+
+    moved = 0
+    for month in sorted(months):
+        moved += archive_month(engine, source, date.fromisoformat(month), archive_dir, run_id)
+    print(f"✅ {store}: {moved} raw movements before {cutoff} archived")
+    return moved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-months", type=int, default=DEFAULT_KEEP_MONTHS,
+                        help="raw movements newer than this many months stay in MySQL")
+    parser.add_argument("--archive-dir", type=Path, default=ARCHIVE_DIR)
+    parser.add_argument("--anchors-only", action="store_true", help="write anchors, archive nothing")
+    options = run_options("compact_raw_stock_movements", argv, parser)
+    metrics.profiler = options.profiler
+
+    engine = analytics_engine()
+    with engine.begin() as conn:
+        create_anchors_table(conn)
+
+    run_id = pd.Timestamp.now().strftime("%Y%m%dT%H%M%S")
+    for source in load_config()["sicar_sources"]:
+        try:
+            # Nothing may load raw movements or replay them into stock points meanwhile
+            with stage_lock(engine, RAW_STOCK_MOVEMENTS, source["store"], options.lock_wait), \
+                 stage_lock(engine, STOCK_POINTS, source["store"], options.lock_wait):
+                compact_store(engine, source, options.keep_months, options.archive_dir, run_id,
+                              options.anchors_only)
+        except LockBusy as e:
+            print(f"⏭️ Skipping {source['name']}: {e}")
+            continue
+        except Exception as e:
+            print(f"❗️ Error compacting {source['name']}: {e}")
+            continue
+
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
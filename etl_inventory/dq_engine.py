@@ -0,0 +1,186 @@
+"""
+Data-quality screen for the movements replayed into stock_points and
+stock_movements_asof, used by the seed, the incremental updates (both stock
+points engines), update_stock_asof and onboard_store.
+
+A movement is excluded, and logged to dq_exclusions.csv, when
+- its hist_id is a manual exclusion in the CSV,
+- its quantity is beyond ABS_MAX, or
+- it is an outlier for its SKU: an absolute snapshot far from the SKU's typical
+  stock level, or a delta far above its typical movement size. "Far" is a robust
+  z-score (distance from the median over 1.4826 * MAD) above Z_MAX, and never
+  below MIN_UNITS units. SKUs with fewer than MIN_HISTORY observations are only
+  checked against ABS_MAX.
+
+The per-SKU medians and MADs come from the last STATS_LOOKBACK of movements and
+stock points. They are computed with pandas group operations and cached in
+dq_sku_stats (and in memory) for STATS_MAX_AGE, so screening a batch is a
+vectorized comparison.
+"""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from etl_inventory.dq_exclusions_csv import append_exclusions, get_manual_hist_ids
+from etl_inventory.queries import SQL
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+EXCLUSIONS_CSV = PACKAGE_DIR / "dq_exclusions.csv"
+
+ABS_MAX = 1_000_000   # no quantity is ever this large
+Z_MAX = 12            # robust z-score above which a value is an outlier for its SKU
+MIN_UNITS = 100       # smaller quantities are never outliers
+MIN_HISTORY = 8       # observations a SKU needs before its statistics are trusted
+MAD_TO_SIGMA = 1.4826
+STATS_LOOKBACK = timedelta(days=365)
+STATS_MAX_AGE = timedelta(days=7)
+
+KINDS = ["delta", "stock"]
+STATS_COLUMNS = [f"{kind}_{stat}" for kind in KINDS for stat in ("n", "median", "mad")]
+
+_cache = {}  # store_id -> (computed_at, stats)
+
+def robust_stats(observations):
+    """
+    Count, median and MAD of `value` per art_id and kind ('delta' or 'stock'),
+    one row per art_id with STATS_COLUMNS
+    """
+    keys = [observations["art_id"], observations["kind"]]
+    values = observations["value"].astype("float64")
+    median = values.groupby(keys, sort=False).transform("median")
+    grouped = pd.DataFrame({
+        "n": values.groupby(keys, sort=False).size(),
+        "median": values.groupby(keys, sort=False).median(),
+        "mad": (values - median).abs().groupby(keys, sort=False).median(),
+    }).unstack(1)
+    grouped.columns = [f"{kind}_{stat}" for stat, kind in grouped.columns]
+    stats = grouped.reindex(columns=STATS_COLUMNS)
+    stats[["delta_n", "stock_n"]] = stats[["delta_n", "stock_n"]].fillna(0).astype("int64")
+    stats.index.name = "art_id"
+    return stats
+
+def compute_store_stats(engine, store_id):
+    """Recompute a store's statistics from its recent history and replace its dq_sku_stats rows"""
+    with engine.connect() as conn:
+        observations = pd.read_sql_query(
+            SQL.text("extract_dq_observations.sql"), conn,
+            params={"store_id": store_id, "since": date.today() - STATS_LOOKBACK}
+        )
+    stats = robust_stats(observations)
+    computed_at = datetime.now().replace(microsecond=0)
+
+    rows = stats.reset_index()
+    rows.insert(0, "store_id", store_id)
+    rows["computed_at"] = computed_at
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM dq_sku_stats WHERE store_id = :store_id"), {"store_id": store_id})
+        rows.to_sql("dq_sku_stats", con=conn, if_exists="append", index=False, method="multi", chunksize=5_000)
+    print(f"📐 DQ statistics for {len(stats)} SKUs from {len(observations)} observations")
+    return computed_at, stats
+
+def store_stats(engine, store_id):
+    """A store's per-SKU statistics: from memory, dq_sku_stats, or recomputed once STATS_MAX_AGE old"""
+    fresh_after = datetime.now() - STATS_MAX_AGE
+    cached = _cache.get(store_id)
+    if cached and cached[0] >= fresh_after:
+        return cached[1]
+
+    with engine.begin() as conn:
+        conn.execute(SQL.text("create_dq_sku_stats.sql"))
+        computed_at = conn.execute(
+            text("SELECT MAX(computed_at) FROM dq_sku_stats WHERE store_id = :store_id"),
+            {"store_id": store_id}
+        ).scalar()
+        if computed_at is not None and computed_at >= fresh_after:
+            stats = pd.read_sql_query(
+                text(f"SELECT art_id, {', '.join(STATS_COLUMNS)} FROM dq_sku_stats WHERE store_id = :store_id"),
+                conn, params={"store_id": store_id}, index_col="art_id"
+            )
+            _cache[store_id] = (computed_at, stats)
+            return stats
+
+    _cache[store_id] = compute_store_stats(engine, store_id)
+    return _cache[store_id][1]
+
+def flag_outliers(df, stats, abs_max=ABS_MAX):
+    """
+    Reason per movement ('abs_stock_after_too_large', 'delta_too_large',
+    'abs_stock_outlier', 'delta_outlier') or None, plus the detail to log
+    """
+    s = stats.reindex(df["art_id"].to_numpy())
+    is_abs = df["is_absolute"].fillna(0).astype(bool).to_numpy()
+    level = pd.to_numeric(df["abs_stock_after"], errors="coerce").to_numpy(dtype="float64")
+    delta = pd.to_numeric(df["delta_cantidad"], errors="coerce").abs().to_numpy(dtype="float64")
+    stock_median = s["stock_median"].to_numpy(dtype="float64")
+    delta_median = s["delta_median"].to_numpy(dtype="float64")
+
+    # Scales never shrink below the typical level itself (or one unit), so a SKU
+    # whose stock or movements barely vary isn't flagged for ordinary changes
+    stock_scale = np.fmax(np.fmax(MAD_TO_SIGMA * s["stock_mad"].to_numpy(dtype="float64"),
+                                  np.abs(stock_median)), 1)
+    delta_scale = np.fmax(np.fmax(MAD_TO_SIGMA * s["delta_mad"].to_numpy(dtype="float64"), delta_median),
+                          np.fmax(np.abs(stock_median), 1))
+    stock_z = np.abs(level - stock_median) / stock_scale
+    delta_z = (delta - delta_median) / delta_scale
+    with np.errstate(invalid="ignore"):
+        conditions = [
+            is_abs & (np.abs(level) > abs_max),
+            ~is_abs & (delta > abs_max),
+            is_abs & (s["stock_n"].to_numpy() >= MIN_HISTORY) & (stock_z > Z_MAX) & (np.abs(level) >= MIN_UNITS),
+            ~is_abs & (s["delta_n"].to_numpy() >= MIN_HISTORY) & (delta_z > Z_MAX) & (delta >= MIN_UNITS),
+        ]
+    reasons = np.select(conditions, ["abs_stock_after_too_large", "delta_too_large",
+                                     "abs_stock_outlier", "delta_outlier"], default="")
+    value = np.where(is_abs, level, delta)
+    median = np.where(is_abs, stock_median, delta_median)
+    z = np.where(is_abs, stock_z, delta_z)
+
+    out = pd.DataFrame({"reason": reasons, "value": value, "median": median, "z": z}, index=df.index)
+    out = out[out["reason"] != ""]
+    out["detail"] = [f"value={v:.0f} median={m:.0f} z={zz:.1f}" for v, m, zz in
+                     zip(out["value"], out["median"].fillna(0), out["z"].fillna(0))]
+    return out[["reason", "detail"]]
+
+def screen_movements(engine, source, df, csv_path=EXCLUSIONS_CSV):
+    """
+    Drop the manual exclusions and outliers from filtered movements, logging the
+    outliers to the exclusions CSV. Returns (kept movements, number excluded).
+    """
+    if df.empty:
+        return df, 0
+    store_id = source["store_id"]
+
+    manual = pd.Series(False, index=df.index)
+    if "hist_id" in df.columns:
+        manual_hist = get_manual_hist_ids(csv_path, store_id)
+        if manual_hist:
+            manual = df["hist_id"].astype(str).isin(manual_hist)
+
+    flagged = flag_outliers(df, store_stats(engine, store_id))
+    if not flagged.empty:
+        to_log = df.loc[flagged.index, ["art_id", "fecha"]].join(flagged)
+        to_log["store_id"] = store_id
+        append_exclusions(csv_path, to_log)
+        print(f"[DQ] {source['store']}: {len(flagged)} outlier movements excluded "
+              f"({', '.join(f'{n} {r}' for r, n in flagged['reason'].value_counts().items())})")
+
+    bad = manual | df.index.isin(flagged.index)
+    return df.loc[~bad], int(bad.sum())
+
+def excluded_raw_ids(engine, source, start_date, end_date, csv_path=EXCLUSIONS_CSV):
+    """
+    raw_stock_movements ids the screen excludes from [start_date, end_date], for the
+    SQL stock points engine. Only snapshots and deltas of at least MIN_UNITS can be
+    outliers, so only those leave MySQL.
+    """
+    with engine.connect() as conn:
+        candidates = pd.read_sql_query(
+            SQL.text("extract_dq_candidates.sql"), conn,
+            params={"store_id": source["store_id"], "start_date": start_date.isoformat(),
+                    "end_date": end_date.isoformat(), "min_units": MIN_UNITS}
+        )
+    kept, excluded = screen_movements(engine, source, candidates, csv_path)
+    if not excluded:
+        return []
+    return candidates.loc[~candidates["raw_id"].isin(kept["raw_id"]), "raw_id"].astype("int64").tolist()
@@ -2,7 +2,6 @@ from __future__ import annotations
 from pathlib import Path
 from datetime import datetime, timezone
 import pandas as pd
-import numpy as np
 import os
 
 EXCLUSION_COLS = ["store_id","art_id","hist_id","fecha_iso","reason","detail","detected_at_iso","uniq"]
@@ -43,10 +42,8 @@ def _normalize_rows(df: pd.DataFrame) -> pd.DataFrame:
         out["detected_at_iso"] = _now_iso()
 
     # Stable de-dup key (treat NaN hist_id as empty)
-    out["uniq"] = out.apply(
-        lambda r: f"{r['store_id']}|{r['art_id']}|{'' if pd.isna(r['hist_id']) else int(r['hist_id'])}|{r['fecha_iso']}|{r['reason']}",
-        axis=1
-    )
+    parts = [out[c].astype("string").fillna("") for c in ["store_id", "art_id", "hist_id", "fecha_iso", "reason"]]
+    out["uniq"] = parts[0].str.cat(parts[1:], sep="|")
 
     return out[EXCLUSION_COLS]
 
@@ -70,52 +67,3 @@ def get_manual_hist_ids(csv_path: Path, store_id: int) -> set[str]:
     df = df[df["store_id"] == str(store_id)]
     # Only hist_id rows, ignore blanks
     return set(df.loc[df["hist_id"] != "", "hist_id"])
-
-def apply_exclusions_and_log(
-    df: pd.DataFrame,
-    store_id: int,
-    csv_path: Path,
-    abs_max: int = 1_000_000
-) -> tuple[pd.DataFrame, int]:
-    """
-    Exclude rows by (a) manual hist_id in CSV and (b) threshold rule for absurd absolute snapshots.
-    Log newly detected threshold violations into CSV.
-    """
-    df = df.copy()
-    # Columns we rely on
-    df["is_absolute"] = df.get("is_absolute", 0).fillna(0).astype(bool)
-    df["abs_stock_after"] = pd.to_numeric(df.get("abs_stock_after", np.nan), errors="coerce")
-
-    # (a) manual by hist_id (if hist_id present)
-    if "hist_id" in df.columns:
-        manual_hist = get_manual_hist_ids(csv_path, store_id)
-        bad_manual = df["hist_id"].astype(str).isin(manual_hist) if manual_hist else pd.Series(False, index=df.index)
-    else:
-        bad_manual = pd.Series(False, index=df.index)
-
-    # (b) rule-based absurd absolute snapshot
-    bad_rule = df["is_absolute"] & (df["abs_stock_after"].abs() > abs_max)
-
-    bad = bad_manual | bad_rule
-    flagged = df.loc[bad].copy()
-
-    # Log only newly detected threshold violations (not already in CSV)
-    if flagged.any(axis=None):
-        to_log = flagged.copy()
-        to_log["store_id"] = store_id
-        if "fecha_iso" not in to_log.columns:
-            to_log["fecha_iso"] = pd.to_datetime(to_log["fecha"]).dt.strftime("%Y-%m-%d %H:%M:%S")
-        to_log["reason"] = np.where(bad_rule.loc[bad] & ~bad_manual.loc[bad], "abs_stock_after_too_large",
-                             np.where(~bad_rule.loc[bad] & bad_manual.loc[bad], "manual_exclusion",
-                                      "manual_and_threshold"))
-        to_log["detail"] = to_log["abs_stock_after"].apply(lambda v: f"value={int(v)}" if pd.notnull(v) else "")
-        
-        # Ensure columns exist even if your extract doesn't include them
-        if "hist_id" not in to_log.columns:
-            to_log["hist_id"] = pd.NA
-        if "fecha_iso" not in to_log.columns:
-            to_log["fecha_iso"] = pd.to_datetime(to_log["fecha"]).dt.strftime("%Y-%m-%d %H:%M:%S")
-
-        append_exclusions(csv_path, to_log[["store_id","art_id","hist_id","fecha_iso","reason","detail"]])
-
-    return df.loc[~bad].copy(), len(flagged)
@@ -1,39 +1,48 @@
 import pandas as pd
-from sqlalchemy import text, create_engine
+from etl_common.config import source_engine
+from etl_common.retry import with_retries
+from etl_common.schema import STOCK_MOVEMENTS, apply_schema, extraction_timestamp, memory_report
+from etl_inventory.queries import SQL
 
-def extract_stock_movements(source, batch_dates, script_dir):
-    conn = None
-    
-    try:
-        conn_str = f"mysql+pymysql://{source['user']}:{source['password']}@{source['host']}:{source['port']}/{source['database']}"
-        engine = create_engine(conn_str)
-        conn = engine.connect()
-    
-        with open(script_dir / "sql/extract_stock_movements.sql", "r") as f:
-            query = text(f.read())
-    
-        for start_date, end_date in batch_dates:
-            try:
-                print(f"🔄 Extracting stock movements for {source['store']} from {start_date} to {end_date}...", end="", flush=True)
-                df = pd.read_sql_query(
-                    query,
-                    conn,
-                    params={"start_date": start_date, "end_date": end_date}
-                )
-                
-                df["tienda_id"] = source["store_id"]
-                df["extracted_at"] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                if not df.empty:
-                    print(f" ✅ Extracted {len(df)} rows")
-                    yield df
-                else:
-                    print(f" ⚠️ No data found in batch {start_date} to {end_date}")
-            except Exception as e:
-                print(f"❗️ Error extracting batch {start_date} to {end_date} for {source['store']}: {e}")
-    except Exception as conn_err:
-        print(f"❗️ Database connection error for SICAR {source['store']} at {source['host']}::{conn_err}")
-    finally:
-        if conn:
-            conn.close()
-            print("🔌 SICAR connection closed")
+def tag_stock_movements(df, source):
+    """Add the per-source columns and the STOCK_MOVEMENTS dtypes to an extracted frame"""
+    df["tienda_id"] = source["store_id"]
+    df["extracted_at"] = extraction_timestamp()
+    return apply_schema(df, STOCK_MOVEMENTS)
+
+def extract_stock_movements(source, batch_dates, failed=None):
+    """
+    Yield one frame per (start_date, end_date) batch. Each batch is retried with
+    backoff on a fresh connection; a batch that still fails is appended to
+    `failed` as (start_date, end_date, error) so the caller can queue it
+    instead of silently skipping it.
+    """
+    engine = source_engine(source)
+    query = SQL.text("extract_stock_movements.sql")
+
+    def read_batch(start_date, end_date):
+        with engine.connect() as conn:
+            return pd.read_sql_query(
+                query,
+                conn,
+                params={"start_date": start_date, "end_date": end_date}
+            )
+
+    for start_date, end_date in batch_dates:
+        print(f"🔄 Extracting stock movements for {source['store']} from {start_date} to {end_date}...", end="", flush=True)
+        try:
+            df = with_retries(lambda: read_batch(start_date, end_date),
+                              f"{source['store']} batch {start_date} to {end_date}")
+        except Exception as e:
+            print(f"❗️ Error extracting batch {start_date} to {end_date} for {source['store']}: {e}")
+            if failed is not None:
+                failed.append((start_date, end_date, e))
+            continue
+
+        df = tag_stock_movements(df, source)
+
+        if not df.empty:
+            print(f" ✅ Extracted {len(df)} rows, {memory_report(df)}")
+            yield df
+        else:
+            print(f" ⚠️ No data found in batch {start_date} to {end_date}")
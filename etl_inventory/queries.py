@@ -0,0 +1,4 @@
+from pathlib import Path
+from etl_common.sql_catalog import SqlCatalog
+
+SQL = SqlCatalog(Path(__file__).resolve().parent / "sql")
@@ -0,0 +1,167 @@
+import pandas as pd
+from sqlalchemy import text
+from etl_inventory.stock_flows import FLOWS_TABLE, refresh_batch_flows
+
+# One SICAR document line per (store, source doc, product, movement type, timestamp)
+NATURAL_KEY = ["tienda_id", "tabla_origen", "id_origen", "art_id", "tipo_movimiento", "fecha"]
+
+RAW_COLUMNS = [
+    "art_id", "tienda_id", "fecha", "tipo_movimiento", "is_absolute", "delta_cantidad",
+    "abs_stock_after", "id_origen", "tabla_origen", "usuario", "extracted_at"
+]
+
+# Load-time resolution of which rows the stock replay counts (is_effective), so the
+# filter queries are plain range scans over (tienda_id, is_effective, fecha)
+FLAG_COLUMNS = ["is_effective", "dedup_rank"]
+TRASPASO_KINDS = ["Traspaso Entrada", "Traspaso Salida"]
+CANCELLED = " Cancelado"
+
+def effective_flags(df):
+    """
+    is_effective and dedup_rank for raw movements, computed per group without row loops.
+    - A traspaso cancellation counts only if it is the earliest one of its kind for
+      (tienda_id, id_origen, art_id) (dedup_rank 1) and the movement it cancels
+      exists no later than it.
+    - Traspaso Entrada/Salida count; other traspaso types don't.
+    - Ajustes count only as absolute snapshots; everything else counts.
+    Cancellations are only resolved correctly when df holds their whole group.
+    """
+    tipo = df["tipo_movimiento"].astype(str).str.strip()  # SICAR emits 'Traspaso Entrada '
+    tabla = df["tabla_origen"].astype(str)
+    traspaso = tabla.eq("Traspaso")
+    cancel = traspaso & tipo.str.endswith(CANCELLED)
+    kind = tipo.str.removesuffix(CANCELLED)
+    known = traspaso & kind.isin(TRASPASO_KINDS)
+    keys = [df["tienda_id"], df["id_origen"].astype(str), df["art_id"], kind]
+
+    rank = df["fecha"].where(cancel & known).groupby(keys, sort=False).rank(method="min")
+    first_original = df["fecha"].where(known & ~cancel).groupby(keys, sort=False).transform("min")
+
+    effective = (
+        (~traspaso & ~tabla.eq("ajusteinventario"))
+        | (tabla.eq("ajusteinventario") & df["is_absolute"].eq(1))
+        | (known & ~cancel)
+        | (known & cancel & rank.eq(1) & first_original.le(df["fecha"]))
+    )
+    return pd.DataFrame({
+        "is_effective": effective.astype("int8"),
+        "dedup_rank": rank.astype("Int16"),
+    }, index=df.index)
+
+def resolve_traspasos(conn, groups_sql, table="raw_stock_movements", params=None):
+    """
+    Recompute the flags of every traspaso row in the (tienda_id, id_origen, art_id)
+    groups selected by groups_sql and write back the ones that changed, e.g. when
+    the original of an already loaded cancellation arrives later. Returns the
+    number of rows updated.
+    """
+    current = pd.read_sql_query(text(f"""
+        SELECT r.id, r.tienda_id, r.tabla_origen, r.id_origen, r.art_id, r.tipo_movimiento,
+               r.fecha, r.is_absolute, r.is_effective, r.dedup_rank
+        FROM {table} r
+        JOIN ({groups_sql}) g
+          ON r.tienda_id = g.tienda_id AND r.tabla_origen = 'Traspaso'
+         AND r.id_origen = g.id_origen AND r.art_id = g.art_id
+    """), conn, params=params)
+    if current.empty:
+        return 0
+
+    flags = effective_flags(current)
+    old_rank = current["dedup_rank"].astype("Int16")
+    changed = (flags["is_effective"].ne(current["is_effective"])
+               | old_rank.isna().ne(flags["dedup_rank"].isna())
+               | old_rank.ne(flags["dedup_rank"]).fillna(False))
+    if not changed.any():
+        return 0
+
+    updates = flags[changed].astype(object).where(flags[changed].notna(), None)
+    updates["id"] = current.loc[changed, "id"]
+    conn.execute(
+        text(f"UPDATE {table} SET is_effective = :is_effective, dedup_rank = :dedup_rank WHERE id = :id"),
+        updates.to_dict("records")
+    )
+    return int(changed.sum())
+
+def has_natural_key(conn, table="raw_stock_movements"):
+    """
+    Whether `table` has the uq_natural key the upsert relies on: tables seeded
+    before it need add_natural_key, and until then an upsert is a plain insert
+    """
+    return conn.execute(
+        text("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = :table AND index_name = 'uq_natural'
+        """),
+        {"table": table}
+    ).scalar() > 0
+
+def collapse_natural_key(df):
+    """
+    Merge rows sharing a natural key (e.g. the same product twice on one ticket).
+    Deltas are summed so the stock effect is unchanged; other columns keep the last value.
+    """
+    if not df.duplicated(subset=NATURAL_KEY).any():
+        return df
+
+    g = df.groupby(NATURAL_KEY, sort=False, dropna=False, observed=True)
+    out = g.last()
+    out["delta_cantidad"] = g["delta_cantidad"].sum(min_count=1)
+    return out.reset_index()[df.columns]
+
+def upsert_raw_stock_movements(conn, df, table="raw_stock_movements", flows_table=FLOWS_TABLE):
+    """
+    Idempotent load of extracted movements: stage the batch in a temp table and
+    upsert on the natural key, then refresh the daily flows of the days it touched
+    (none when flows_table is None, e.g. for shadow loads). Returns the rows
+    written (after collapsing).
+    """
+    batch = collapse_natural_key(df[RAW_COLUMNS])
+    # Provisional flags from this batch alone; cancellations are fixed up below
+    batch = batch.join(effective_flags(batch))
+
+    # Temp tables outlive a rolled-back load on the pooled connection: drop any leftover
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS _raw_batch;")
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _raw_batch (
+          art_id          INT NOT NULL,
+          tienda_id       INT NOT NULL,
+          fecha           DATETIME NOT NULL,
+          tipo_movimiento VARCHAR(30) NOT NULL,
+          is_absolute     TINYINT(1) NOT NULL,
+          delta_cantidad  BIGINT NULL,
+          abs_stock_after BIGINT NULL,
+          id_origen       VARCHAR(50) NOT NULL,
+          tabla_origen    VARCHAR(30) NOT NULL,
+          usuario         VARCHAR(150),
+          extracted_at    DATETIME NOT NULL,
+          is_effective    TINYINT(1) NOT NULL,
+          dedup_rank      SMALLINT NULL
+        ) ENGINE=InnoDB;
+    """)
+
+    batch.to_sql('_raw_batch', conn, if_exists='append', index=False, method="multi")
+
+    cols = ", ".join(RAW_COLUMNS + FLAG_COLUMNS)
+    conn.exec_driver_sql(f"""
+        INSERT INTO {table} ({cols})
+        SELECT {cols} FROM _raw_batch
+        ON DUPLICATE KEY UPDATE
+          is_absolute     = VALUES(is_absolute),
+          delta_cantidad  = VALUES(delta_cantidad),
+          abs_stock_after = VALUES(abs_stock_after),
+          usuario         = VALUES(usuario),
+          extracted_at    = VALUES(extracted_at),
+          is_effective    = VALUES(is_effective),
+          dedup_rank      = VALUES(dedup_rank);
+    """)
+
+    # Re-resolve every traspaso line the batch touched, against what is already loaded
+    if batch["tabla_origen"].astype(str).eq("Traspaso").any():
+        resolve_traspasos(conn, "SELECT DISTINCT tienda_id, id_origen, art_id FROM _raw_batch "
+                                "WHERE tabla_origen = 'Traspaso'", table=table)
+
+    if flows_table is not None:
+        refresh_batch_flows(conn, raw_table=table, table=flows_table)
+
+    conn.exec_driver_sql("DROP TEMPORARY TABLE _raw_batch;")
+    return batch
@@ -1,42 +1,23 @@
-import json
+import sys
 from datetime import date, timedelta
 import calendar
-from sqlalchemy import create_engine, text
-from pathlib import Path
-from extract import extract_stock_movements
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, STOCK_ASOF, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.retry import settle_windows
+from etl_common.shadow_tables import LoadTally, run_sql_script, shadow_name, swap_shadow, verify_shadow
+from etl_inventory.extract import extract_stock_movements
+from etl_inventory.queries import SQL
+from etl_inventory.raw_stock_movements_helpers import upsert_raw_stock_movements
+from etl_inventory.stock_flows import create_flows_table, rebuild_store_flows
+from etl_inventory.update_stock_asof import reset_asof
 
-SCRITP_DIR = Path(__file__).resolve().parent
-PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
-CONFIG_PATH  = PROJECT_ROOT / "config.json"
-CONFIG = json.load(open(CONFIG_PATH))
+metrics = RunMetrics("seed_raw_stock_movements")
 
-# Create connection to the cleaned data database (osmart_data)
-db_config = CONFIG["analytics_db"]
-engine = create_engine(
-    f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
-
-# Delete and create raw_stock_movements table
-raw_stock_movements_sql = Path(SCRITP_DIR / "sql/create_raw_stock_movements.sql").read_text(encoding="utf-8")
-raw_stock_movements_queries = raw_stock_movements_sql.split(';')
-
-with engine.begin() as conn:
-    for query in raw_stock_movements_queries:
-        if query.strip(): 
-            conn.execute(text(query))
-
-# Restart etl progress tracker for all stores
-reset_last_raw_ts_sql = Path(SCRITP_DIR / "sql/reset_last_raw_ts.sql").read_text(encoding="utf-8")
-
-with engine.begin() as conn:
-    conn.execute(text(reset_last_raw_ts_sql))
-
-for source in CONFIG["sicar_sources"]:
-    # 1. Extract
-    print(f"🚀 Extracting historical data for {source['name']}")
-    
-    start_date = date(2024, 10, 26)
-    end_date = date.today() - timedelta(days=1)
+def monthly_batches(start_date, end_date):
+    """(first day, last day) of every month in [start_date, end_date], clipped to the range"""
     batch_dates = []
     current_start = start_date
 
@@ -58,28 +39,105 @@ for source in CONFIG["sicar_sources"]:
             next_month = 1
             next_year += 1
         current_start = date(next_year, next_month, 1)
+    return batch_dates
+
+def retained_start(engine, source):
+    """
+    First day to re-extract: the go-live date, or the first month still in
+    raw_stock_movements once compact_raw_stock_movements archived older ones
+    """
+    oldest = None
+    with engine.connect() as conn:
+        if conn.execute(text("SHOW TABLES LIKE 'raw_stock_movements'")).fetchone() is not None:
+            oldest = conn.execute(
+                text("SELECT DATE(MIN(fecha)) FROM raw_stock_movements WHERE tienda_id = :store_id"),
+                {"store_id": source['store_id']}
+            ).scalar()
+    start = date(2024, 10, 26)
+    if oldest is not None and oldest > start:
+        start = max(start, date(oldest.year, oldest.month, 1))
+    return start
+
+def seed_store(source, engine, tally):
+    # 1. Extract
+    print(f"🚀 Extracting historical data for {source['name']}")
+    start = retained_start(engine, source)
+    batch_dates = monthly_batches(start, date.today() - timedelta(days=1))
 
-    for df in extract_stock_movements(source, batch_dates):
-        # 2. Load raw logs (for audit/debug)
-        df.to_sql(
-            "raw_stock_movements", 
-            con=engine, 
-            if_exists="append", 
-            index=False,
-            method="multi"
-        )
-
-    # 3. Set last_raw_ts to max 'fecha'
-    get_max_raw_ts_sql = Path(SCRITP_DIR / "sql/get_max_raw_ts.sql").read_text(encoding="utf-8")
-    set_last_raw_ts_sql = Path(SCRITP_DIR / "sql/set_last_raw_ts.sql").read_text(encoding="utf-8")
-        
+    store = source['store']
+    failed = []
+    for df in metrics.timed(extract_stock_movements(source, batch_dates, failed), "extract", store):
+        metrics.add_frame(df, "extract", store)
+        # 2. Load raw logs (upsert on the natural key)
+        with metrics.span("load", store), engine.begin() as conn:
+            written = upsert_raw_stock_movements(conn, df, table=shadow_name("raw_stock_movements"),
+                                                 flows_table=None)
+        metrics.add_frame(written, "load", store)
+        tally.add(written)
+    # Months that still failed are replayed by update_raw_stock_movements after the swap
+    settle_windows(engine, RAW_STOCK_MOVEMENTS, store, batch_dates, failed)
+    return start
+
+def reset_checkpoints(engine, sources):
+    """Restart etl progress tracker and set last_raw_ts to max 'fecha' per store"""
+    with metrics.span("checkpoint"), engine.begin() as conn:
+        conn.execute(SQL.text("reset_last_raw_ts.sql"))
+
+        for source in sources:
+            max_fecha = conn.execute(
+                SQL.text("get_max_raw_ts.sql"),
+                {'tienda_id': source['store_id']}
+            ).scalar()
+
+            conn.execute(
+                SQL.text("set_last_raw_ts.sql"),
+                {"ts": max_fecha, 'store_name': source['store']}
+            )
+
+def seed(engine, sources):
+    # Rebuild into raw_stock_movements__next (no secondary indexes during the bulk load);
+    # the live table keeps serving until the swap
+    run_sql_script(engine, SQL.source("create_raw_stock_movements_next.sql"))
+    tally = LoadTally(checksum_col="delta_cantidad")
+
+    starts = {source['store']: seed_store(source, engine, tally) for source in sources}
+
+    # 3. Build indexes after the bulk load, verify and swap in the rebuilt table
+    with metrics.span("load"):
+        run_sql_script(engine, SQL.source("index_raw_stock_movements_next.sql"))
+    with metrics.span("verify"):
+        verify_shadow(engine, "raw_stock_movements", tally)
+    with metrics.span("load"):
+        swap_shadow(engine, "raw_stock_movements")
+    # The as-of rows point at the old ids; empty them before the flows read their adjustments
+    reset_asof(engine)
+
+    # Daily flows of the re-extracted days; archived months keep theirs
     with engine.begin() as conn:
-        max_fecha = conn.execute(
-            text(get_max_raw_ts_sql), 
-            {'tienda_id': source['store_id']}
-        ).scalar()
-        
-        conn.execute(
-            text(set_last_raw_ts_sql),
-            {"ts": max_fecha, 'store_name': source['store']}
-        )
\ No newline at end of file
+        create_flows_table(conn)
+    for source in sources:
+        rebuild_store_flows(engine, source, starts[source['store']])
+
+    # 4. Checkpoints follow the rebuilt table
+    reset_checkpoints(engine, sources)
+
+def main(argv=None):
+    options = run_options("seed_raw_stock_movements", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    sources = load_config()["sicar_sources"]
+
+    # Seeds rewrite the whole table: keep the incremental updaters off every store meanwhile,
+    # including update_stock_asof, whose table is reset after the swap
+    stores = [s["store"] for s in sources]
+    try:
+        with stage_lock(engine, RAW_STOCK_MOVEMENTS, stores, options.lock_wait), \
+                stage_lock(engine, STOCK_ASOF, stores, options.lock_wait):
+            seed(engine, sources)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not seeding")
+    finally:
+        metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -1,136 +1,128 @@
-import json
+import argparse
+import sys
 import pandas as pd
-import numpy as np
 from pathlib import Path
-from sqlalchemy import create_engine, text
-from datetime import date, timedelta
-from stock_points_helpers import verify_stock_accuracy
-from dq_exclusions_csv import apply_exclusions_and_log
-
-SCRITP_DIR = Path(__file__).resolve().parent
-PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
-CONFIG_PATH  = PROJECT_ROOT / "config.json"
-CONFIG = json.load(open(CONFIG_PATH))
-EXCLUSIONS_CSV = Path("dq_exclusions.csv")  # choose your path
-ABS_MAX = 1_000_000  # tune per business reality
-
-# Create connection to the analytics database (osmart_data)
-db_config = CONFIG["analytics_db"]
-engine = create_engine(
-    f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
+from datetime import date
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import STOCK_POINTS, STOCK_ASOF, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.schema import FILTERED_MOVEMENTS, apply_schema, memory_report
+from etl_common.shadow_tables import LoadTally, run_sql_script, shadow_name, swap_shadow, verify_shadow
+from etl_inventory.dq_engine import screen_movements
+from etl_inventory.queries import SQL
+from etl_inventory.stock_anchors import create_anchors_table, nearest_anchor
+from etl_inventory.stock_points_helpers import (
+    compute_sod_matrix, prepare_movements, replay_daily_deltas, sod_to_points,
+    verify_stock_accuracy, write_stock_points
 )
+from etl_inventory.update_stock_asof import reset_asof
 
-# Delete and create stock_points table
-stock_pints_sql = Path(SCRITP_DIR / "sql/create_stock_points.sql").read_text(encoding="utf-8")
-stock_pints_queries = stock_pints_sql.split(';')
+PACKAGE_DIR = Path(__file__).resolve().parent
 
-with engine.begin() as conn:
-    for query in stock_pints_queries:
-        if query.strip(): 
-            conn.execute(text(query))
-            
-# Restart etl progress tracker for all stores
-reset_last_points_dt_sql = Path(SCRITP_DIR / "sql/reset_last_points_dt.sql").read_text(encoding="utf-8")
+metrics = RunMetrics("seed_stock_points")
 
-with engine.begin() as conn:
-    conn.execute(text(reset_last_points_dt_sql))
+DEFAULT_START = date(2024, 10, 26)
+
+def replay_start(engine, source, latest_anchor=False):
+    """
+    (start date, opening stock by art_id) of a rebuild. Without anchors it is the
+    go-live date from zero stock. Otherwise it is the nearest anchor at or before
+    the oldest raw movement still in MySQL (older ones may be archived), or the
+    latest anchor when latest_anchor is set.
+    """
+    with engine.begin() as conn:
+        create_anchors_table(conn)
+        if latest_anchor:
+            on_or_before = date.today()
+        else:
+            oldest = conn.execute(
+                text("SELECT DATE(MIN(fecha)) FROM raw_stock_movements WHERE tienda_id = :store_id"),
+                {"store_id": source['store_id']}
+            ).scalar()
+            on_or_before = oldest or date.today()
+        anchor_date, stock = nearest_anchor(conn, source['store_id'], on_or_before)
+    if anchor_date is None:
+        return DEFAULT_START, None
+    return anchor_date, stock
+
+def copy_points_before(engine, source, start_date, tally):
+    """Carry the live points older than the replay start over into stock_points__next"""
+    params = {"store_id": source['store_id'], "start_date": start_date}
+    with metrics.span("load", source['store']), engine.begin() as conn:
+        conn.execute(
+            text(f"""
+                INSERT INTO {shadow_name("stock_points")} (store_id, art_id, point_date, sod_stock)
+                SELECT store_id, art_id, point_date, sod_stock FROM stock_points
+                WHERE store_id = :store_id AND point_date < :start_date
+            """),
+            params
+        )
+        rows, checksum = conn.execute(
+            text(f"""
+                SELECT COUNT(*), COALESCE(SUM(sod_stock), 0) FROM {shadow_name("stock_points")}
+                WHERE store_id = :store_id AND point_date < :start_date
+            """),
+            params
+        ).fetchone()
+    tally.add_totals(rows, int(checksum))
+    print(f"📎 Kept {rows} stock points before {start_date}")
+
+def seed_store(source, engine, tally, latest_anchor=False):
+    """Replay a store's raw history, from its nearest stock anchor, into stock_points__next"""
+    start_date, start_stocks = replay_start(engine, source, latest_anchor)
+    if start_stocks is not None:
+        print(f"⚓ Replaying {source['name']} from the {start_date} anchor ({len(start_stocks)} SKUs)")
+        copy_points_before(engine, source, start_date, tally)
 
-for source in CONFIG["sicar_sources"]:
     print(f"🚀 Extracting historical raw stock movements data for {source['name']}")
     ## Aggregate raw stock movements into daily net changes per product and store.
     # Extract from raw logs
-    with open(SCRITP_DIR / "sql/extract_filter_raw_stock_movements.sql", "r") as f:
-        query = text(f.read())
-
-    with engine.begin() as conn:
-        df = pd.read_sql_query(query, conn, params={"store_id": source['store_id'],})
-        
-    # Filter & log exclusions (threshold-based)
-    df, flagged = apply_exclusions_and_log(
-        df=df,
-        store_id=source['store_id'],
-        csv_path=EXCLUSIONS_CSV,
-        abs_max=ABS_MAX
-    )
+    if start_stocks is None:
+        query = SQL.text("extract_filter_raw_stock_movements.sql")
+        params = {"store_id": source['store_id']}
+    else:
+        query = SQL.text("extract_filter_raw_stock_movements_incremental.sql")
+        params = {"store_id": source['store_id'], "start_date": start_date.isoformat(),
+                  "end_date": date.today().isoformat()}
+
+    store = source['store']
+    with metrics.span("extract", store), engine.begin() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+        df = apply_schema(df, FILTERED_MOVEMENTS)
+    metrics.add_frame(df, "extract", store)
+    print(f"📦 {len(df)} raw movements, {memory_report(df)}")
+
+    # Filter & log exclusions (manual, absurd or outlier for the SKU)
+    with metrics.span("dq", store):
+        df, flagged = screen_movements(engine, source, df)
+    metrics.add("rows_excluded", flagged, "dq", store)
     if flagged:
-        print(f"[DQ] Excluded {flagged} raw rows (manual or absurd absolute snapshots).")
-    
-    print(f"Cleaning data...")
-    # Ensure types
-    df['fecha'] = pd.to_datetime(df['fecha'])
-    # normalize flags
-    df['is_absolute'] = df.get('is_absolute', 0).fillna(0).astype(bool)
-    # ensure numeric types
-    if 'delta_cantidad' not in df.columns:
-        df['delta_cantidad'] = np.nan
-    if 'abs_stock_after' not in df.columns:
-        df['abs_stock_after'] = np.nan
-
-    # stable chronological order per SKU
-    df = df.sort_values(['art_id','fecha'], kind='mergesort')
-
-    print(f"Computing daily net deltas...")
-    # transform abs_stock_after into deltas
-    out_rows = []
-    for art_id, g in df.groupby('art_id', sort=False):
-        running = 0  # because your history contains initial loads; first absolute snaps it anyway
-        for _, r in g.iterrows():
-            if r['is_absolute']:
-                target = int(r['abs_stock_after']) if pd.notnull(r['abs_stock_after']) else 0
-                d = target - running
-                running = target
-            else:
-                d = int(r['delta_cantidad']) if pd.notnull(r['delta_cantidad']) else 0
-                running += d
-            out_rows.append((art_id, r['fecha'].date(), d))
-
-    # compute daily net deltas
-    temp = pd.DataFrame(out_rows, columns=['art_id','fecha','delta_cantidad'])
-    daily_net = (temp.groupby(['art_id','fecha'], as_index=False)['delta_cantidad']
-                    .sum()
-                    .sort_values(['art_id','fecha']))
-    start_date = date(2024, 10, 26)
-    end_date = date.today()
-    cal = pd.date_range(pd.to_datetime(start_date).date(),
-                            pd.to_datetime(end_date).date(),
-                            freq='D').date
-
-    # Pivot to wide: rows=art_id, cols=date, values=delta
-    wide = (daily_net.pivot(index='art_id', columns='fecha', values='delta_cantidad')
-                .reindex(columns=cal)
-                .fillna(0)
-                .astype(int))
-
-    # Initial stock vector
-    eod = wide.cumsum(axis=1)
-    start_stock = eod.shift(1, axis=1, fill_value=0).astype('int64')
+        print(f"[DQ] Excluded {flagged} raw rows (manual exclusions or outliers).")
+
+    with metrics.span("transform", store):
+        print(f"Cleaning data...")
+        df = prepare_movements(df)
+
+        print(f"Computing daily net deltas...")
+        # transform abs_stock_after into deltas (history contains initial loads; first absolute snaps it anyway)
+        daily_net = replay_daily_deltas(df, start_stocks)
+        end_date = date.today()
+        cal = pd.date_range(pd.to_datetime(start_date).date(),
+                                pd.to_datetime(end_date).date(),
+                                freq='D').date
+
+        # Initial stock vector
+        start_stock = compute_sod_matrix(daily_net, cal, start_stocks)
 
     ### Verify calculated stock vs actual stock
-    verify_stock_accuracy(source, start_stock, SCRITP_DIR)
+    with metrics.span("verify", store):
+        verify_stock_accuracy(source, start_stock)
 
     ## Load into sparse logs
-    # Ensure clean labels & types
-    cols = sorted(start_stock.columns)
-    sod = start_stock[cols].fillna(0).astype('int64')
-    sod = sod.rename_axis(index='art_id', columns='point_date')
-    sod.columns = pd.to_datetime(sod.columns).normalize()
-    sod = sod.sort_index(axis=1).astype('int64')
-    
-    # Detect change-days
-    prev = sod.shift(axis=1)
-    change_mask = prev.isna() | sod.ne(prev)
-    
-    # Stack first (int), then filter by stacked mask (no NaNs -> stays int)
-    stacked_vals = sod.stack()                 # int64
-    stacked_mask = change_mask.stack()         # bool
-    points = stacked_vals[stacked_mask]        # int64
-    points = points.rename('sod_stock').reset_index()  # cols: art_id, point_date, sod_stock
-
-    # point_date as DATE objects for MySQL
-    points['point_date'] = pd.to_datetime(points['point_date']).dt.date
-    points['store_id'] = source['store_id']
-    points = points[['store_id','art_id','point_date','sod_stock']]
-    
+    points = sod_to_points(start_stock, source['store_id'])
+
     INT_MIN, INT_MAX = -(2**31), 2**31 - 1
 
     # DEBUG: Basic sanity on range
@@ -149,42 +141,69 @@ for source in CONFIG["sicar_sources"]:
         print(offenders.head(10))
 
     # DEBUG: Save data to csv to inspect
-    points.to_csv(f"output_{source['store_id']}_{source['store']}_points.csv")
+    points.to_csv(PACKAGE_DIR / f"output_{source['store_id']}_{source['store']}_points.csv")
 
     # 5) bulk-insert via temp table (idempotent)
-    with engine.begin() as conn:
-        conn.exec_driver_sql("""
-            CREATE TEMPORARY TABLE _init_points (
-              store_id   INT NOT NULL,
-              art_id     INT NOT NULL,
-              point_date DATE NOT NULL,
-              sod_stock  BIGINT NOT NULL,
-              PRIMARY KEY (store_id, art_id, point_date)
-            ) ENGINE=InnoDB;
-        """)
-        points[['store_id','art_id','point_date','sod_stock']].to_sql(
-            '_init_points', conn, if_exists='append', index=False
-        )
-
-        conn.exec_driver_sql("""
-            INSERT INTO stock_points (store_id, art_id, point_date, sod_stock)
-            SELECT store_id, art_id, point_date, sod_stock FROM _init_points
-            ON DUPLICATE KEY UPDATE sod_stock = VALUES(sod_stock);
-        """)
-
-        conn.exec_driver_sql("DROP TEMPORARY TABLE _init_points;")
-    
-    # 6) Set last_points_dt to the max date_time of the data inserted
-    get_max_points_dt_sql = Path(SCRITP_DIR / "sql/get_max_points_dt.sql").read_text(encoding="utf-8")
-    set_last_points_dt_sql = Path(SCRITP_DIR / "sql/set_last_points_dt.sql").read_text(encoding="utf-8")
-
-    with engine.begin() as conn:
-        max_dt = conn.execute(
-            text(get_max_points_dt_sql), 
-            {'store_id': source['store_id']}
-        ).scalar()
-        
-        conn.execute(
-            text(set_last_points_dt_sql),
-            {"dt": max_dt, 'store_name': source['store']}
-        )
\ No newline at end of file
+    with metrics.span("load", store), engine.begin() as conn:
+        write_stock_points(conn, points, table=shadow_name("stock_points"))
+    metrics.add_frame(points, "load", store)
+    tally.add(points)
+
+def reset_checkpoints(engine, sources):
+    """Restart etl progress tracker and set last_points_dt to the max date of the data inserted"""
+    with metrics.span("checkpoint"), engine.begin() as conn:
+        conn.execute(SQL.text("reset_last_points_dt.sql"))
+
+        for source in sources:
+            max_dt = conn.execute(
+                SQL.text("get_max_points_dt.sql"),
+                {'store_id': source['store_id']}
+            ).scalar()
+
+            conn.execute(
+                SQL.text("set_last_points_dt.sql"),
+                {"dt": max_dt, 'store_name': source['store']}
+            )
+
+def seed(engine, sources, latest_anchor=False):
+    # Rebuild into stock_points__next; the live table keeps serving until the swap
+    run_sql_script(engine, SQL.source("create_stock_points_next.sql"))
+    tally = LoadTally(checksum_col="sod_stock")
+
+    for source in sources:
+        seed_store(source, engine, tally, latest_anchor)
+
+    # 6) Verify and swap in the rebuilt table
+    with metrics.span("verify"):
+        verify_shadow(engine, "stock_points", tally)
+    with metrics.span("load"):
+        swap_shadow(engine, "stock_points")
+    # The as-of stock was replayed from the old SOD stock
+    reset_asof(engine)
+
+    # 7) Checkpoints follow the rebuilt table
+    reset_checkpoints(engine, sources)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="osmart-etl seed_stock_points")
+    parser.add_argument("--latest-anchor", action="store_true",
+                        help="replay only from the latest stock anchor, keeping the older points")
+    options = run_options("seed_stock_points", argv, parser)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    sources = load_config()["sicar_sources"]
+
+    # Seeds rewrite the whole table: keep the incremental updaters off every store meanwhile,
+    # including update_stock_asof, whose table is reset after the swap
+    stores = [s["store"] for s in sources]
+    try:
+        with stage_lock(engine, STOCK_POINTS, stores, options.lock_wait), \
+                stage_lock(engine, STOCK_ASOF, stores, options.lock_wait):
+            seed(engine, sources, options.latest_anchor)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not seeding")
+    finally:
+        metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+-- One-off: the is_effective/dedup_rank columns of create_raw_stock_movements_next.sql
+-- on a raw_stock_movements built before them (backfill_effective_flags.py fills them in)
+ALTER TABLE raw_stock_movements
+    ADD COLUMN is_effective TINYINT(1) NOT NULL DEFAULT 1,
+    ADD COLUMN dedup_rank SMALLINT NULL,
+    ADD INDEX idx_store_effective_date (tienda_id, is_effective, fecha);
@@ -0,0 +1,5 @@
+-- One-off: the uq_natural key of create_raw_stock_movements_next.sql on a
+-- raw_stock_movements built before it, once dedup_natural_key.sql has merged
+-- the rows that share a key (add_natural_key.py runs both)
+ALTER TABLE raw_stock_movements
+    ADD UNIQUE KEY uq_natural (tienda_id, tabla_origen, id_origen, art_id, tipo_movimiento, fecha);
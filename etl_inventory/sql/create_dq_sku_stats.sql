@@ -0,0 +1,15 @@
+-- Per-SKU robust statistics the stock movement DQ screen compares against
+-- (dq_engine.py), recomputed per store once they are older than STATS_MAX_AGE.
+-- Deltas are absolute quantities; stock levels are stock points and ajuste snapshots.
+CREATE TABLE IF NOT EXISTS dq_sku_stats (
+  store_id     INT NOT NULL,
+  art_id       INT NOT NULL,
+  delta_n      INT NOT NULL,
+  delta_median DOUBLE NULL,
+  delta_mad    DOUBLE NULL,
+  stock_n      INT NOT NULL,
+  stock_median DOUBLE NULL,
+  stock_mad    DOUBLE NULL,
+  computed_at  DATETIME NOT NULL,
+  PRIMARY KEY (store_id, art_id)
+) ENGINE=InnoDB;
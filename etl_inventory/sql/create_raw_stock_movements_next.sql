@@ -0,0 +1,25 @@
+DROP TABLE IF EXISTS raw_stock_movements__next;
+
+-- secondary indexes are added after the bulk load (index_raw_stock_movements_next.sql);
+-- only the natural key is kept during the load since the upsert relies on it
+CREATE TABLE raw_stock_movements__next (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    art_id INT NOT NULL,
+    tienda_id INT NOT NULL,
+    fecha DATETIME NOT NULL,
+    tipo_movimiento VARCHAR(30) NOT NULL,
+    is_absolute TINYINT(1) NOT NULL DEFAULT 0,
+    delta_cantidad BIGINT NULL,
+    abs_stock_after BIGINT NULL,
+    id_origen VARCHAR(50) NOT NULL,
+    tabla_origen VARCHAR(30) NOT NULL,
+    usuario VARCHAR(150),
+    extracted_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- resolved at load (raw_stock_movements_helpers.effective_flags): whether the stock
+    -- replay counts the row, and a traspaso cancellation's rank among its duplicates
+    is_effective TINYINT(1) NOT NULL DEFAULT 1,
+    dedup_rank SMALLINT NULL,
+
+    -- natural key: re-extracting any window upserts instead of duplicating
+    UNIQUE KEY uq_natural (tienda_id, tabla_origen, id_origen, art_id, tipo_movimiento, fecha)
+);
@@ -0,0 +1,11 @@
+-- Full start-of-day stock of every SKU on the first day of each month, i.e. the
+-- stock at the close of the previous month (compact_raw_stock_movements.py).
+-- Rebuilds of stock_points replay raw movements from the nearest anchor.
+CREATE TABLE IF NOT EXISTS stock_anchors (
+  store_id    INT NOT NULL,
+  anchor_date DATE NOT NULL,
+  art_id      INT NOT NULL,
+  sod_stock   BIGINT NOT NULL,
+  created_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (store_id, anchor_date, art_id)
+) ENGINE=InnoDB;
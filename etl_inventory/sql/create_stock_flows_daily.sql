@@ -0,0 +1,16 @@
+-- Daily units per SKU and movement type from the effective raw movements
+-- (stock_flows.py), kept current by every raw movements load. qty is the signed
+-- stock effect (sales and traspaso salidas are negative); for 'Ajuste de Inventario'
+-- it is the net adjustment, NULL until update_stock_asof has replayed the day.
+-- Rows outlive the raw movements compact_raw_stock_movements archives.
+CREATE TABLE IF NOT EXISTS stock_flows_daily (
+  store_id        INT NOT NULL,
+  art_id          INT NOT NULL,
+  day             DATE NOT NULL,
+  tipo_movimiento VARCHAR(30) NOT NULL,      -- trimmed ('Traspaso Entrada', not 'Traspaso Entrada ')
+  qty             BIGINT NULL,
+  events          INT NOT NULL,              -- movements counted
+  updated_at      TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (store_id, art_id, day, tipo_movimiento),
+  KEY idx_store_day_tipo (store_id, day, tipo_movimiento)
+) ENGINE=InnoDB;
@@ -0,0 +1,22 @@
+-- Every filtered movement with the store's on-hand stock right before and after it
+-- (update_stock_asof.py: SOD stock from stock_points plus the intraday replay).
+-- raw_id is only stable between seeds: seed_raw_stock_movements and seed_stock_points
+-- empty the table (reset_asof) and update_stock_asof rebuilds it from the go-live.
+CREATE TABLE IF NOT EXISTS stock_movements_asof (
+  raw_id          BIGINT NOT NULL,           -- raw_stock_movements.id
+  store_id        INT NOT NULL,
+  art_id          INT NOT NULL,
+  fecha           DATETIME NOT NULL,
+  tipo_movimiento VARCHAR(30) NULL,
+  tabla_origen    VARCHAR(30) NULL,
+  id_origen       VARCHAR(50) NULL,          -- e.g. the sale for tipo_movimiento = 'Venta'
+  delta_cantidad  BIGINT NOT NULL,           -- effective change (absolute snapshots as a delta)
+  is_absolute     TINYINT NOT NULL DEFAULT 0,
+  sod_stock       BIGINT NOT NULL,
+  stock_before    BIGINT NOT NULL,
+  stock_after     BIGINT NOT NULL,
+  PRIMARY KEY (raw_id),
+  KEY idx_store_art_fecha (store_id, art_id, fecha),
+  KEY idx_store_fecha (store_id, fecha),
+  KEY idx_source_doc (tabla_origen, id_origen)
+) ENGINE=InnoDB;
@@ -1,7 +1,7 @@
-DROP TABLE IF EXISTS stock_points;
+DROP TABLE IF EXISTS stock_points__next;
 
 -- compact “points” table: one row only when a value changes (or first time seen)
-CREATE TABLE stock_points (
+CREATE TABLE stock_points__next (
   store_id   INT NOT NULL,
   art_id     INT NOT NULL,
   point_date DATE NOT NULL,      -- day the SOD value applies/changed
@@ -9,4 +9,4 @@ CREATE TABLE stock_points (
   updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
                      ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (store_id, art_id, point_date)  -- critical for fast lookups
-) ENGINE=InnoDB;
\ No newline at end of file
+) ENGINE=InnoDB;
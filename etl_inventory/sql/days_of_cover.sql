@@ -0,0 +1,25 @@
+-- Days of cover per SKU: stock at the start of :as_of over the average units sold
+-- per day in the :days days before it (stock_flows_daily, sales net of cancellations).
+-- NULL for SKUs without sales in the window.
+WITH stock AS (
+  SELECT art_id, sod_stock,
+         ROW_NUMBER() OVER (PARTITION BY art_id ORDER BY point_date DESC, updated_at DESC) AS rn
+  FROM stock_points
+  WHERE store_id = :store_id AND point_date <= :as_of
+),
+sold AS (
+  SELECT art_id, -SUM(qty) AS units
+  FROM stock_flows_daily
+  WHERE store_id = :store_id
+    AND day >= DATE_SUB(:as_of, INTERVAL :days DAY) AND day < :as_of
+    AND tipo_movimiento IN ('Venta', 'Venta Cancelada')
+  GROUP BY art_id
+)
+SELECT s.art_id,
+       s.sod_stock AS stock,
+       COALESCE(v.units, 0) AS units_sold,
+       s.sod_stock / NULLIF(v.units / :days, 0) AS days_of_cover
+FROM stock s
+LEFT JOIN sold v ON v.art_id = s.art_id
+WHERE s.rn = 1
+ORDER BY days_of_cover IS NULL, days_of_cover;
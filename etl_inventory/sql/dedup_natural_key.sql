@@ -0,0 +1,35 @@
+-- One-off (add_natural_key.py): merge the rows of a raw_stock_movements loaded
+-- before uq_natural that share a natural key. The latest extraction of a key
+-- replaces the earlier ones, as the upsert would have. Lines of that extraction
+-- become one row with their deltas summed, as collapse_natural_key does. The
+-- survivor is the last row inserted. _natural_dups stays for the caller.
+DROP TEMPORARY TABLE IF EXISTS _natural_dups;
+
+CREATE TEMPORARY TABLE _natural_dups ENGINE=InnoDB AS
+SELECT r.tienda_id, r.tabla_origen, r.id_origen, r.art_id, r.tipo_movimiento, r.fecha,
+       MAX(r.id) AS keep_id, SUM(r.delta_cantidad) AS delta_cantidad
+FROM raw_stock_movements r
+JOIN (
+  SELECT tienda_id, tabla_origen, id_origen, art_id, tipo_movimiento, fecha,
+         MAX(extracted_at) AS extracted_at
+  FROM raw_stock_movements
+  GROUP BY tienda_id, tabla_origen, id_origen, art_id, tipo_movimiento, fecha
+  HAVING COUNT(*) > 1
+) k ON r.tienda_id = k.tienda_id AND r.tabla_origen <=> k.tabla_origen
+   AND r.id_origen <=> k.id_origen AND r.art_id = k.art_id
+   AND r.tipo_movimiento <=> k.tipo_movimiento AND r.fecha = k.fecha
+   AND r.extracted_at <=> k.extracted_at
+GROUP BY r.tienda_id, r.tabla_origen, r.id_origen, r.art_id, r.tipo_movimiento, r.fecha;
+
+ALTER TABLE _natural_dups ADD PRIMARY KEY (keep_id), ADD KEY idx_store_art_fecha (tienda_id, art_id, fecha);
+
+UPDATE raw_stock_movements r
+JOIN _natural_dups d ON r.id = d.keep_id
+SET r.delta_cantidad = d.delta_cantidad;
+
+DELETE r FROM raw_stock_movements r
+JOIN _natural_dups d
+  ON r.tienda_id = d.tienda_id AND r.art_id = d.art_id AND r.fecha = d.fecha
+ AND r.tabla_origen <=> d.tabla_origen AND r.id_origen <=> d.id_origen
+ AND r.tipo_movimiento <=> d.tipo_movimiento
+WHERE r.id <> d.keep_id;
@@ -0,0 +1,20 @@
+/* The movements of extract_filter_raw_stock_movements_incremental.sql that the DQ
+   screen could flag: absolute snapshots and deltas of at least :min_units */
+SELECT
+  r.art_id,
+  r.fecha,
+  CASE WHEN r.tabla_origen = 'ajusteinventario' THEN NULL ELSE r.delta_cantidad END AS delta_cantidad,
+  CASE WHEN r.tabla_origen = 'ajusteinventario' THEN r.is_absolute ELSE 0 END AS is_absolute,
+  CASE WHEN r.tabla_origen = 'ajusteinventario' THEN r.abs_stock_after END AS abs_stock_after,
+  r.id AS raw_id
+FROM
+  raw_stock_movements r
+WHERE
+  r.tienda_id = :store_id
+  AND r.is_effective = 1
+  AND r.fecha >= :start_date
+  AND r.fecha < DATE_ADD(:end_date, INTERVAL 1 DAY)
+  AND (
+    (r.tabla_origen = 'ajusteinventario' AND r.is_absolute = 1)
+    OR (r.tabla_origen <> 'ajusteinventario' AND ABS(r.delta_cantidad) >= :min_units)
+  );
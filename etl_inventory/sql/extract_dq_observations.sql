@@ -0,0 +1,15 @@
+/* History the DQ statistics are computed from: |delta| of every effective
+   movement and every stock level (ajuste snapshots and stock points) since :since */
+SELECT r.art_id, 'delta' AS kind, ABS(r.delta_cantidad) AS value
+FROM raw_stock_movements r
+WHERE r.tienda_id = :store_id AND r.is_effective = 1 AND r.fecha >= :since
+  AND r.tabla_origen <> 'ajusteinventario' AND r.delta_cantidad IS NOT NULL
+UNION ALL
+SELECT r.art_id, 'stock', r.abs_stock_after
+FROM raw_stock_movements r
+WHERE r.tienda_id = :store_id AND r.is_effective = 1 AND r.fecha >= :since
+  AND r.tabla_origen = 'ajusteinventario' AND r.is_absolute = 1 AND r.abs_stock_after IS NOT NULL
+UNION ALL
+SELECT sp.art_id, 'stock', sp.sod_stock
+FROM stock_points sp
+WHERE sp.store_id = :store_id AND sp.point_date >= :since;
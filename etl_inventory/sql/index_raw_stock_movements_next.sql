@@ -0,0 +1,6 @@
+ALTER TABLE raw_stock_movements__next
+    ADD INDEX idx_product_store_date (art_id, tienda_id, fecha),
+    ADD INDEX idx_tipo_movimiento (tipo_movimiento),
+    ADD INDEX idx_abs (is_absolute, fecha),
+    ADD INDEX idx_source_doc (tabla_origen, id_origen),
+    ADD INDEX idx_store_effective_date (tienda_id, is_effective, fecha);
@@ -0,0 +1,23 @@
+-- SOD stock of every SKU on :anchor_date, from the sparse stock_points
+INSERT INTO stock_anchors (store_id, anchor_date, art_id, sod_stock)
+WITH ranked AS (
+  SELECT
+    sp.art_id,
+    sp.sod_stock,
+    ROW_NUMBER() OVER (PARTITION BY sp.art_id ORDER BY sp.point_date DESC, sp.updated_at DESC) AS rn
+  FROM
+    stock_points sp
+  WHERE
+    sp.store_id = :store_id
+    AND sp.point_date <= :anchor_date
+) SELECT
+  :store_id,
+  :anchor_date,
+  art_id,
+  sod_stock
+FROM
+  ranked
+WHERE
+  rn = 1
+ON DUPLICATE KEY UPDATE
+  sod_stock = VALUES(sod_stock);
@@ -0,0 +1,25 @@
+-- Sell-through per SKU over [:start_date, :end_date]: units sold (net of cancellations)
+-- over the stock available, i.e. the start-of-day stock on :start_date plus the units
+-- purchased or transferred in during the period (stock_flows_daily).
+WITH opening AS (
+  SELECT art_id, sod_stock,
+         ROW_NUMBER() OVER (PARTITION BY art_id ORDER BY point_date DESC, updated_at DESC) AS rn
+  FROM stock_points
+  WHERE store_id = :store_id AND point_date <= :start_date
+),
+flows AS (
+  SELECT art_id,
+         -SUM(CASE WHEN tipo_movimiento IN ('Venta', 'Venta Cancelada') THEN qty ELSE 0 END) AS units_sold,
+         SUM(CASE WHEN tipo_movimiento IN ('Compra', 'Traspaso Entrada') THEN qty ELSE 0 END) AS units_received
+  FROM stock_flows_daily
+  WHERE store_id = :store_id AND day >= :start_date AND day <= :end_date
+  GROUP BY art_id
+)
+SELECT f.art_id,
+       COALESCE(o.sod_stock, 0) AS opening_stock,
+       f.units_received,
+       f.units_sold,
+       f.units_sold / NULLIF(COALESCE(o.sod_stock, 0) + f.units_received, 0) AS sell_through
+FROM flows f
+LEFT JOIN opening o ON o.art_id = f.art_id AND o.rn = 1
+ORDER BY sell_through DESC;
@@ -0,0 +1,48 @@
+from datetime import date
+import pandas as pd
+from sqlalchemy import text
+from etl_inventory.queries import SQL
+
+FIRST_ANCHOR = date(2024, 11, 1)  # first month start after the 2024-10-26 go-live
+
+def month_starts(start, end):
+    """First day of every month in [start, end]"""
+    return [d.date() for d in pd.date_range(start, end, freq="MS")]
+
+def create_anchors_table(conn):
+    conn.execute(SQL.text("create_stock_anchors.sql"))
+
+def anchor_dates(conn, store_id):
+    return conn.execute(
+        text("SELECT DISTINCT anchor_date FROM stock_anchors WHERE store_id = :store_id ORDER BY anchor_date"),
+        {"store_id": store_id}
+    ).scalars().all()
+
+def write_anchors(conn, store_id, through):
+    """Snapshot every month start up to `through` that has no anchor yet; returns the dates written"""
+    missing = sorted(set(month_starts(FIRST_ANCHOR, through)) - set(anchor_dates(conn, store_id)))
+    for anchor_date in missing:
+        conn.execute(SQL.text("insert_stock_anchor.sql"), {"store_id": store_id, "anchor_date": anchor_date})
+    return missing
+
+def nearest_anchor(conn, store_id, on_or_before):
+    """
+    The latest anchor at or before `on_or_before` as (anchor_date, sod_stock by art_id),
+    or (None, empty series) if there is none
+    """
+    anchor_date = conn.execute(
+        text("""
+            SELECT MAX(anchor_date) FROM stock_anchors
+            WHERE store_id = :store_id AND anchor_date <= :on_or_before
+        """),
+        {"store_id": store_id, "on_or_before": on_or_before}
+    ).scalar()
+    if anchor_date is None:
+        return None, pd.Series(dtype="int64")
+
+    stock = pd.read_sql_query(
+        text("SELECT art_id, sod_stock FROM stock_anchors WHERE store_id = :store_id AND anchor_date = :anchor_date"),
+        conn,
+        params={"store_id": store_id, "anchor_date": anchor_date}
+    )
+    return anchor_date, stock.set_index("art_id")["sod_stock"].astype("int64")
@@ -0,0 +1,164 @@
+"""
+stock_flows_daily: each SKU's daily units per movement type (sold, purchased,
+transferred in/out, returned, adjusted), so sell-through and days-of-cover
+queries (sql/sell_through.sql, sql/days_of_cover.sql) don't scan raw movements.
+
+upsert_raw_stock_movements refreshes the days each loaded batch touches, and
+update_stock_asof fills in the net adjustments of the days it replays. To build
+the table on an existing raw_stock_movements:
+
+    python -m etl_inventory.stock_flows
+"""
+from datetime import timedelta
+import pandas as pd
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_inventory.queries import SQL
+
+FLOWS_TABLE = "stock_flows_daily"
+AJUSTE = "Ajuste de Inventario"
+
+metrics = RunMetrics("stock_flows")
+
+# Effective movements only, so the flows add up to what the stock replay counts.
+# Ajuste deltas are NULL (they are absolute snapshots), which leaves their qty NULL.
+FLOWS_SELECT = """
+    SELECT r.tienda_id, r.art_id, DATE(r.fecha), TRIM(r.tipo_movimiento),
+           SUM(r.delta_cantidad), COUNT(*)
+    FROM {raw_table} r
+    {join}
+    WHERE r.is_effective = 1 {where}
+    GROUP BY r.tienda_id, r.art_id, DATE(r.fecha), TRIM(r.tipo_movimiento)
+"""
+FLOWS_COLUMNS = "(store_id, art_id, day, tipo_movimiento, qty, events)"
+
+def create_flows_table(conn):
+    conn.execute(SQL.text("create_stock_flows_daily.sql"))
+
+def refresh_batch_flows(conn, raw_table="raw_stock_movements", table=FLOWS_TABLE):
+    """
+    Recompute the flows of every (store, SKU, day) in the _raw_batch temp table
+    of upsert_raw_stock_movements, plus the days of the traspaso groups it touched
+    (resolving a cancellation can flip a row on another day). Call it in the load
+    transaction, after the upsert. Returns the number of keys refreshed.
+    """
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS _flow_keys;")  # left by a failed load
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _flow_keys (
+          store_id INT NOT NULL,
+          art_id   INT NOT NULL,
+          day      DATE NOT NULL,
+          PRIMARY KEY (store_id, art_id, day)
+        ) ENGINE=InnoDB;
+    """)
+    conn.exec_driver_sql("""
+        INSERT IGNORE INTO _flow_keys
+        SELECT DISTINCT tienda_id, art_id, DATE(fecha) FROM _raw_batch
+    """)
+    conn.exec_driver_sql(f"""
+        INSERT IGNORE INTO _flow_keys
+        SELECT DISTINCT r.tienda_id, r.art_id, DATE(r.fecha)
+        FROM {raw_table} r
+        JOIN (SELECT DISTINCT tienda_id, id_origen, art_id FROM _raw_batch
+              WHERE tabla_origen = 'Traspaso') g
+          ON r.art_id = g.art_id AND r.tienda_id = g.tienda_id
+         AND r.tabla_origen = 'Traspaso' AND r.id_origen = g.id_origen
+    """)
+
+    conn.exec_driver_sql(f"""
+        DELETE f FROM {table} f
+        JOIN _flow_keys k ON f.store_id = k.store_id AND f.art_id = k.art_id AND f.day = k.day
+    """)
+    conn.exec_driver_sql(f"INSERT INTO {table} {FLOWS_COLUMNS}" + FLOWS_SELECT.format(
+        raw_table=raw_table,
+        join="""JOIN _flow_keys k ON r.art_id = k.art_id AND r.tienda_id = k.store_id
+             AND r.fecha >= k.day AND r.fecha < k.day + INTERVAL 1 DAY""",
+        where=""
+    ))
+    keys = conn.exec_driver_sql("SELECT COUNT(*) FROM _flow_keys").scalar()
+
+    conn.exec_driver_sql("DROP TEMPORARY TABLE _flow_keys;")
+    return int(keys)
+
+def fill_adjustments(conn, store_id, start, end, table=FLOWS_TABLE):
+    """
+    Set the qty of the ajuste flows of [start, end] to their net effect, i.e. the
+    stock_movements_asof delta of each absolute snapshot. Returns the rows updated.
+    """
+    return conn.execute(
+        text(f"""
+            UPDATE {table} f
+            JOIN (
+              SELECT art_id, DATE(fecha) AS day, SUM(delta_cantidad) AS qty
+              FROM stock_movements_asof
+              WHERE store_id = :store_id AND is_absolute = 1
+                AND fecha >= :start AND fecha < :end_excl
+              GROUP BY art_id, DATE(fecha)
+            ) a ON f.art_id = a.art_id AND f.day = a.day
+            SET f.qty = a.qty
+            WHERE f.store_id = :store_id AND f.tipo_movimiento = :ajuste
+        """),
+        {"store_id": store_id, "start": start, "end_excl": end + timedelta(days=1), "ajuste": AJUSTE}
+    ).rowcount
+
+def refresh_range_flows(conn, store_id, start, end, raw_table="raw_stock_movements", table=FLOWS_TABLE):
+    """
+    Rebuild one store's flows of [start, end] from its raw movements, with the
+    adjustments already in stock_movements_asof. Returns the flow rows written.
+    """
+    params = {"store_id": store_id, "start": start, "end_excl": end + timedelta(days=1)}
+    conn.execute(
+        text(f"DELETE FROM {table} WHERE store_id = :store_id AND day >= :start AND day < :end_excl"),
+        params
+    )
+    written = conn.execute(text(f"INSERT INTO {table} {FLOWS_COLUMNS}" + FLOWS_SELECT.format(
+        raw_table=raw_table,
+        join="",
+        where="AND r.tienda_id = :store_id AND r.fecha >= :start AND r.fecha < :end_excl"
+    )), params).rowcount
+
+    if conn.execute(text("SHOW TABLES LIKE 'stock_movements_asof'")).fetchone() is not None:
+        fill_adjustments(conn, store_id, start, end, table=table)
+    return written
+
+def rebuild_store_flows(engine, source, start=None):
+    """Refresh a store's flows month by month from `start` (its oldest raw movement) onwards"""
+    store = source["store"]
+    with engine.connect() as conn:
+        first, last = conn.execute(
+            text("SELECT DATE(MIN(fecha)), DATE(MAX(fecha)) FROM raw_stock_movements WHERE tienda_id = :store_id"),
+            {"store_id": source["store_id"]}
+        ).one()
+    if last is None:
+        return 0
+    start = max(start or first, first)
+
+    written = 0
+    for month_start in pd.date_range(start.replace(day=1), last, freq="MS").date:
+        month_end = (pd.Timestamp(month_start) + pd.offsets.MonthEnd(0)).date()
+        with metrics.span("load", store), engine.begin() as conn:
+            written += refresh_range_flows(conn, source["store_id"], max(month_start, start), month_end)
+    print(f"📈 {store}: {written} daily flows from {start} to {last}")
+    return written
+
+def main(argv=None):
+    options = run_options("stock_flows", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    with engine.begin() as conn:
+        create_flows_table(conn)
+
+    for source in load_config()["sicar_sources"]:
+        try:
+            # Loads refresh the flows themselves; keep them off the store meanwhile
+            with stage_lock(engine, RAW_STOCK_MOVEMENTS, source["store"], options.lock_wait):
+                rebuild_store_flows(engine, source)
+        except LockBusy as e:
+            print(f"⏭️ Skipping {source['name']}: {e}")
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
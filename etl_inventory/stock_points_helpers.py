@@ -1,17 +1,99 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from etl_common.config import source_engine
+from etl_inventory.queries import SQL
+
+def prepare_movements(df):
+    """Normalize types/flags of filtered raw movements and sort them chronologically per SKU"""
+    df['fecha'] = pd.to_datetime(df['fecha'])
+    df['is_absolute'] = df.get('is_absolute', 0).fillna(0).astype(bool)
+    if 'delta_cantidad' not in df.columns:
+        df['delta_cantidad'] = np.nan
+    if 'abs_stock_after' not in df.columns:
+        df['abs_stock_after'] = np.nan
+
+    # stable chronological order per SKU
+    return df.sort_values(['art_id','fecha'], kind='mergesort')
+
+def replay_daily_deltas(df, start_stocks=None):
+    """
+    Replay movements per SKU, turning absolute snapshots into deltas against the
+    running stock (seeded from start_stocks, else 0). Returns daily net deltas.
+    """
+    if start_stocks is None:
+        start_stocks = pd.Series(dtype='int64')
+
+    out_rows = []
+    for art_id, g in df.groupby('art_id', sort=False):
+        running = start_stocks.get(art_id, 0)
+        for _, r in g.iterrows():
+            if r['is_absolute']:
+                target = int(r['abs_stock_after']) if pd.notnull(r['abs_stock_after']) else 0
+                d = target - running
+                running = target
+            else:
+                d = int(r['delta_cantidad']) if pd.notnull(r['delta_cantidad']) else 0
+                running += d
+            out_rows.append((art_id, r['fecha'].date(), d))
+
+    temp = pd.DataFrame(out_rows, columns=['art_id','fecha','delta_cantidad'])
+    return (temp.groupby(['art_id','fecha'], as_index=False)['delta_cantidad']
+                .sum()
+                .sort_values(['art_id','fecha']))
+
+def compute_sod_matrix(daily_net, cal, start_stocks=None):
+    """Wide start-of-day stock (rows=art_id, cols=cal dates) from daily net deltas"""
+    art_ids = set(daily_net['art_id'].unique())
+    if start_stocks is not None:
+        art_ids |= set(start_stocks.index)
+
+    # Pivot to wide: rows=art_id, cols=date, values=delta
+    wide = (daily_net.pivot(index='art_id', columns='fecha', values='delta_cantidad')
+                .reindex(index=sorted(art_ids), columns=cal)
+                .fillna(0)
+                .astype('int64'))
+    wide.index.name = 'art_id'
+
+    # SOD is the opening stock plus every delta of the previous days
+    sod = wide.cumsum(axis=1).shift(1, axis=1, fill_value=0)
+    if start_stocks is not None:
+        opening = start_stocks.reindex(sod.index).fillna(0).astype('int64')
+        sod = sod.add(opening, axis=0)
+    return sod.astype('int64')
+
+def sod_to_points(start_stock, store_id):
+    """Sparse stock points: one row per SKU on each day its SOD value changes (or is first seen)"""
+    # Ensure clean labels & types
+    cols = sorted(start_stock.columns)
+    sod = start_stock[cols].fillna(0).astype('int64')
+    sod = sod.rename_axis(index='art_id', columns='point_date')
+    sod.columns = pd.to_datetime(sod.columns).normalize()
+    sod = sod.sort_index(axis=1).astype('int64')
+    
+    # Detect change-days
+    prev = sod.shift(axis=1)
+    change_mask = prev.isna() | sod.ne(prev)
     
-def verify_stock_accuracy(source, calculated_stock, script_dir):
+    # Stack first (int), then filter by stacked mask (no NaNs -> stays int)
+    stacked_vals = sod.stack()                 # int64
+    stacked_mask = change_mask.stack()         # bool
+    points = stacked_vals[stacked_mask]        # int64
+    points = points.rename('sod_stock').reset_index()  # cols: art_id, point_date, sod_stock
+
+    # point_date as DATE objects for MySQL
+    points['point_date'] = pd.to_datetime(points['point_date']).dt.date
+    points['store_id'] = store_id
+    return points[['store_id','art_id','point_date','sod_stock']]
+    
+def verify_stock_accuracy(source, calculated_stock):
     ## Get current stock now and today's net movement from production
     print(f"🔍 Verifying stock accuracy")
     today = pd.Timestamp.now(tz="America/Mexico_City").normalize()
     tomorrow = (today + pd.Timedelta(days=1))
 
     # Connect to production db
-    # db_config = CONFIG["sicar_sources"][0]
-    prod_engine = create_engine(
-        f"mysql+pymysql://{source['user']}:{source['password']}@{source['host']}:{source['port']}/{source['database']}"
-    )
+    prod_engine = source_engine(source)
 
     # a) current stock now from production
     sql_stock_now = text("""
@@ -20,8 +102,7 @@ def verify_stock_accuracy(source, calculated_stock, script_dir):
     """)
 
     # b) today's movements
-    with open(script_dir / "sql/extract_stock_movements.sql", "r") as f:
-        sql_today_events = text(f.read())
+    sql_today_events = SQL.text("extract_stock_movements.sql")
 
     with prod_engine.begin() as conn:
         prod_now = pd.read_sql_query(sql_stock_now, conn)
@@ -76,4 +157,64 @@ def verify_stock_accuracy(source, calculated_stock, script_dir):
         'mismatch_skus': int((comp['diff'] != 0).sum()),
         'max_abs_diff': int(comp['diff'].abs().max()) if not comp.empty else 0
     }
-    print(f"📊 Verification: {summary}")
\ No newline at end of file
+    print(f"📊 Verification: {summary}")
+
+def write_stock_points(conn, points, table="stock_points"):
+    """Bulk upsert sparse stock points into `table` via a temp table (idempotent)"""
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS _init_points;")  # left by a failed load
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _init_points (
+          store_id   INT NOT NULL,
+          art_id     INT NOT NULL,
+          point_date DATE NOT NULL,
+          sod_stock  BIGINT NOT NULL,
+          PRIMARY KEY (store_id, art_id, point_date)
+        ) ENGINE=InnoDB;
+    """)
+
+    points[['store_id','art_id','point_date','sod_stock']].to_sql(
+        '_init_points', conn, if_exists='append', index=False
+    )
+
+    conn.exec_driver_sql(f"""
+        INSERT INTO {table} (store_id, art_id, point_date, sod_stock)
+        SELECT store_id, art_id, point_date, sod_stock FROM _init_points
+        ON DUPLICATE KEY UPDATE sod_stock = VALUES(sod_stock);
+    """)
+
+    conn.exec_driver_sql("DROP TEMPORARY TABLE _init_points;")
+
+def running_stock(movements, points):
+    """
+    As-of join of prepared movements with sparse SOD points: every movement gets
+    the SOD stock of its day (latest point on or before it, else 0) and the
+    intraday stock right before and after it. Absolute snapshots reset the running
+    stock like replay_daily_deltas does; their delta_cantidad becomes the effective change.
+    """
+    mv = movements.copy()
+    mv['dia'] = mv['fecha'].dt.normalize().astype('datetime64[ns]')
+    # merge_asof needs identical key dtypes on both sides
+    pts = (points[['art_id', 'point_date', 'sod_stock']]
+           .astype({'art_id': mv['art_id'].dtype})
+           .assign(point_date=lambda p: pd.to_datetime(p['point_date']).astype('datetime64[ns]'))
+           .sort_values('point_date', kind='mergesort'))
+
+    # Sort-merge on the day, per art_id
+    mv = pd.merge_asof(mv.sort_values('dia', kind='mergesort'), pts,
+                       left_on='dia', right_on='point_date', by='art_id', direction='backward')
+    mv['sod_stock'] = mv['sod_stock'].fillna(0).astype('int64')
+    order = ['art_id', 'fecha'] + (['raw_id'] if 'raw_id' in mv.columns else [])
+    mv = mv.sort_values(order, kind='mergesort').reset_index(drop=True)
+
+    is_abs = mv['is_absolute'].astype(bool)
+    delta = mv['delta_cantidad'].fillna(0).astype('int64').where(~is_abs, 0)
+    # A segment starts at the day's first movement or at an absolute snapshot;
+    # its base is the SOD stock or the snapshot value
+    seg = is_abs.groupby([mv['art_id'], mv['dia']]).cumsum()
+    anchor = mv['abs_stock_after'].fillna(0).astype('int64').where(is_abs, mv['sod_stock'])
+    keys = [mv['art_id'], mv['dia'], seg]
+    mv['stock_after'] = anchor.groupby(keys).transform('first') + delta.groupby(keys).cumsum()
+    mv['stock_before'] = (mv.groupby(['art_id', 'dia'])['stock_after'].shift(1)
+                            .fillna(mv['sod_stock']).astype('int64'))
+    mv['delta_cantidad'] = mv['stock_after'] - mv['stock_before']
+    return mv.drop(columns=['dia', 'point_date'])
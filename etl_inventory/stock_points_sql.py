@@ -0,0 +1,153 @@
+from sqlalchemy import text
+
+# Alternative stock points engine: the replay of stock_points_helpers
+# (replay_daily_deltas -> compute_sod_matrix -> sod_to_points) done inside
+# MySQL 8 with window functions and INSERT ... SELECT, so no movement leaves
+# the analytics DB. Selected per store with "stock_points_engine": "sql" in
+# its sicar_sources entry; it writes the same points as the pandas path.
+ENGINES = ("pandas", "sql")
+
+def stock_points_engine(source):
+    engine = source.get("stock_points_engine", "pandas")
+    if engine not in ENGINES:
+        raise ValueError(f"unknown stock_points_engine {engine!r} for {source['store']}")
+    return engine
+
+def derive_stock_points(conn, store_id, start_date, end_date, opening_date=None,
+                        table="stock_points", raw_table="raw_stock_movements", exclude_raw_ids=()):
+    """
+    Replay the effective raw movements of [start_date, end_date] into `table`,
+    opening from the SOD stock on opening_date (latest point per SKU on or before
+    it; zero when None) and skipping exclude_raw_ids (dq_engine.excluded_raw_ids).
+    Like the pandas path it writes every SKU's SOD on start_date, then a point on
+    each day after one whose net change is not zero. Writes nothing when there
+    are no movements. Returns the points written.
+    """
+    params = {"store_id": store_id, "start_date": start_date, "end_date": end_date,
+              "opening_date": opening_date}
+
+    has_movements = conn.execute(
+        text(f"""
+            SELECT EXISTS (
+              SELECT 1 FROM {raw_table}
+              WHERE tienda_id = :store_id AND is_effective = 1
+                AND fecha >= :start_date AND fecha < DATE_ADD(:end_date, INTERVAL 1 DAY)
+            )
+        """),
+        params
+    ).scalar()
+    if not has_movements:
+        return 0
+
+    # Left on the pooled connection by a run that failed midway
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS _opening, _day_end, _points, _excluded;")
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _opening (
+          art_id    INT NOT NULL PRIMARY KEY,
+          sod_stock BIGINT NOT NULL
+        ) ENGINE=InnoDB;
+    """)
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _day_end (
+          art_id    INT NOT NULL,
+          dia       DATE NOT NULL,
+          stock_eod BIGINT NOT NULL,   -- stock after the day's last movement
+          opening   BIGINT NULL,       -- _opening.sod_stock, NULL for SKUs without one
+          PRIMARY KEY (art_id, dia)
+        ) ENGINE=InnoDB;
+    """)
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _points (
+          art_id     INT NOT NULL,
+          point_date DATE NOT NULL,
+          sod_stock  BIGINT NOT NULL,
+          PRIMARY KEY (art_id, point_date)
+        ) ENGINE=InnoDB;
+    """)
+    conn.exec_driver_sql("""
+        CREATE TEMPORARY TABLE _excluded (
+          raw_id BIGINT NOT NULL PRIMARY KEY
+        ) ENGINE=InnoDB;
+    """)
+    if exclude_raw_ids:
+        conn.execute(text("INSERT INTO _excluded (raw_id) VALUES (:raw_id)"),
+                     [{"raw_id": raw_id} for raw_id in exclude_raw_ids])
+
+    if opening_date is not None:
+        # Same as update_stock_points.EXISTING_STOCK_SQL
+        conn.execute(text(f"""
+            INSERT INTO _opening (art_id, sod_stock)
+            WITH ranked AS (
+              SELECT art_id, sod_stock,
+                     ROW_NUMBER() OVER (PARTITION BY art_id ORDER BY point_date DESC, updated_at DESC) AS rn
+              FROM {table}
+              WHERE store_id = :store_id AND point_date <= :opening_date
+            )
+            SELECT art_id, sod_stock FROM ranked WHERE rn = 1
+        """), params)
+
+    # Each absolute snapshot starts a segment whose base is its value (the first
+    # segment's is the opening stock); the stock after a movement is the base
+    # plus the segment's deltas so far. Columns mirror extract_filter_raw_stock_movements.
+    conn.execute(text(f"""
+        INSERT INTO _day_end (art_id, dia, stock_eod, opening)
+        WITH mv AS (
+          SELECT
+            r.art_id,
+            r.fecha,
+            r.id,
+            DATE(r.fecha) AS dia,
+            CASE WHEN r.tabla_origen = 'ajusteinventario' AND r.is_absolute = 1 THEN 1 ELSE 0 END AS is_abs,
+            CASE WHEN r.tabla_origen = 'ajusteinventario' AND r.is_absolute = 1
+                 THEN COALESCE(r.abs_stock_after, 0) END AS target,
+            CASE WHEN r.tabla_origen = 'ajusteinventario' THEN 0 ELSE COALESCE(r.delta_cantidad, 0) END AS delta
+          FROM {raw_table} r
+          WHERE r.tienda_id = :store_id AND r.is_effective = 1
+            AND r.fecha >= :start_date AND r.fecha < DATE_ADD(:end_date, INTERVAL 1 DAY)
+            AND r.id NOT IN (SELECT raw_id FROM _excluded)
+        ),
+        segmented AS (
+          SELECT mv.*,
+                 SUM(is_abs) OVER (PARTITION BY art_id ORDER BY fecha, id ROWS UNBOUNDED PRECEDING) AS seg
+          FROM mv
+        ),
+        running AS (
+          SELECT art_id, dia,
+                 MAX(target) OVER (PARTITION BY art_id, seg) AS seg_base,
+                 SUM(delta) OVER (PARTITION BY art_id, seg ORDER BY fecha, id ROWS UNBOUNDED PRECEDING) AS seg_delta,
+                 ROW_NUMBER() OVER (PARTITION BY art_id, dia ORDER BY fecha DESC, id DESC) AS rn_desc
+          FROM segmented
+        )
+        SELECT x.art_id, x.dia, COALESCE(x.seg_base, o.sod_stock, 0) + x.seg_delta, o.sod_stock
+        FROM running x
+        LEFT JOIN _opening o ON o.art_id = x.art_id
+        WHERE x.rn_desc = 1
+    """), params)
+
+    # Every SKU's SOD on the first calendar day...
+    conn.execute(text("INSERT INTO _points SELECT art_id, :start_date, sod_stock FROM _opening"), params)
+    conn.execute(text("""
+        INSERT INTO _points
+        SELECT DISTINCT art_id, :start_date, 0 FROM _day_end WHERE opening IS NULL
+    """), params)
+    # ...then the next day's SOD wherever a day's closing stock differs from its opening
+    conn.execute(text("""
+        INSERT INTO _points
+        SELECT art_id, DATE_ADD(dia, INTERVAL 1 DAY), stock_eod
+        FROM (
+          SELECT art_id, dia, stock_eod,
+                 COALESCE(LAG(stock_eod) OVER (PARTITION BY art_id ORDER BY dia), opening, 0) AS stock_sod
+          FROM _day_end
+        ) d
+        WHERE stock_eod <> stock_sod
+    """))
+
+    conn.execute(text(f"""
+        INSERT INTO {table} (store_id, art_id, point_date, sod_stock)
+        SELECT :store_id, art_id, point_date, sod_stock FROM _points
+        ON DUPLICATE KEY UPDATE sod_stock = VALUES(sod_stock)
+    """), params)
+    written = conn.execute(text("SELECT COUNT(*) FROM _points")).scalar()
+
+    conn.exec_driver_sql("DROP TEMPORARY TABLE _opening, _day_end, _points, _excluded;")
+    return int(written)
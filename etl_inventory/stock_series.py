@@ -0,0 +1,130 @@
+"""
+Dense daily start-of-day stock over the sparse stock_points table.
+
+    python -m etl_inventory.stock_series --store-id 1 --start 2025-01-01 --end 2025-12-31 --out stock.parquet
+    python -m etl_inventory.stock_series --store-id 1 --start 2025-06-01 --end 2025-06-30 --art-ids 101 102 --out stock.csv
+
+stock_points only has a row on the days a SKU's SOD stock changes. The reader
+fetches the change points inside the range plus one seed point per SKU (its
+latest change before the range; earlier history is never read) in a single
+primary-key range query, then forward-fills them into a SKU x day matrix with
+NumPy. Output is wide: one row per art_id, one column per day (.parquet, .csv
+or .npz).
+"""
+import argparse
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from etl_common.config import analytics_engine
+from etl_common.schema import STOCK_POINTS, apply_schema
+
+def fetch_stock_points(conn, store_id, start, end, art_ids=None):
+    """Change points in [start, end] plus the latest point before start for each SKU"""
+    art_filter = "AND art_id IN :art_ids" if art_ids is not None else ""
+    query = text(f"""
+        SELECT art_id, point_date, sod_stock
+        FROM stock_points
+        WHERE store_id = :store_id AND point_date BETWEEN :start AND :end {art_filter}
+        UNION ALL
+        SELECT sp.art_id, sp.point_date, sp.sod_stock
+        FROM stock_points sp
+        JOIN (
+            SELECT art_id, MAX(point_date) AS point_date
+            FROM stock_points
+            WHERE store_id = :store_id AND point_date < :start {art_filter}
+            GROUP BY art_id
+        ) seed ON seed.art_id = sp.art_id AND seed.point_date = sp.point_date
+        WHERE sp.store_id = :store_id
+    """)
+    params = {"store_id": store_id, "start": start, "end": end}
+    if art_ids is not None:
+        query = query.bindparams(bindparam("art_ids", expanding=True))
+        params["art_ids"] = [int(a) for a in art_ids]
+
+    points = pd.read_sql_query(query, conn, params=params)
+    return apply_schema(points, STOCK_POINTS)
+
+def dense_stock_matrix(points, start, end, art_ids=None, fill_value=0):
+    """
+    Forward-fill sparse change points into a dense int64 matrix.
+
+    Returns (values, art_ids, dates) with values[i, j] the SOD stock of
+    art_ids[i] on dates[j]. Points before `start` only seed the first day;
+    SKUs without any point up to a day get fill_value.
+    """
+    dates = pd.date_range(start, end, freq="D")
+    if art_ids is None:
+        art_ids = np.unique(points["art_id"].to_numpy())
+    art_ids = np.asarray(sorted(set(int(a) for a in art_ids)), dtype="int64")
+    values = np.full((len(art_ids), len(dates)), fill_value, dtype="int64")
+    if points.empty or not len(art_ids) or not len(dates):
+        return values, art_ids, dates
+
+    pts = points.sort_values(["art_id", "point_date"], kind="stable")
+    art = pts["art_id"].to_numpy(dtype="int64")
+    row = np.searchsorted(art_ids, art)
+    known = (row < len(art_ids)) & (art_ids[np.minimum(row, len(art_ids) - 1)] == art)
+    day = (pts["point_date"].to_numpy(dtype="datetime64[D]") - np.datetime64(dates[0].date(), "D")).astype("int64")
+    keep = known & (day < len(dates))
+    row, day = row[keep], np.maximum(day[keep], 0)  # seed points land on the first day
+    stock = pts["sod_stock"].to_numpy(dtype="int64")[keep]
+
+    # Per cell keep the latest point (a seed loses to a change on the first day)
+    flat = row * len(dates) + day
+    last = np.r_[flat[1:] != flat[:-1], True]
+    row, day, stock = row[last], day[last], stock[last]
+
+    # Index of the most recent point per cell: point order increases with the date
+    # within a row, so a running maximum along the days forward-fills it
+    pos = np.full(values.shape, -1, dtype="int64")
+    pos[row, day] = np.arange(len(stock))
+    np.maximum.accumulate(pos, axis=1, out=pos)
+    have = pos >= 0
+    values[have] = stock[pos[have]]
+    return values, art_ids, dates
+
+def read_dense_stock(engine, store_id, start, end, art_ids=None, fill_value=0):
+    """Daily SOD stock for a store as a DataFrame (index art_id, one column per day)"""
+    with engine.connect() as conn:
+        points = fetch_stock_points(conn, store_id, start, end, art_ids)
+    values, ids, dates = dense_stock_matrix(points, start, end, art_ids, fill_value)
+    return pd.DataFrame(values, index=pd.Index(ids, name="art_id"), columns=dates, copy=False)
+
+def write_dense_stock(df, out_path):
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if out_path.suffix == ".npz":
+        np.savez_compressed(out_path, values=df.to_numpy(), art_ids=df.index.to_numpy(),
+                            dates=df.columns.to_numpy(dtype="datetime64[D]"))
+        return
+    out = df.copy(deep=False)
+    out.columns = [d.date().isoformat() for d in df.columns]
+    out = out.reset_index()
+    if out_path.suffix == ".parquet":
+        out.to_parquet(out_path, index=False, compression="zstd")
+    else:
+        out.to_csv(out_path, index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store-id", type=int, required=True)
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--art-ids", type=int, nargs="*", help="SKUs to read (default: every SKU with points)")
+    parser.add_argument("--art-ids-file", type=Path, help="file with one art_id per line")
+    parser.add_argument("--fill-value", type=int, default=0, help="stock before a SKU's first point")
+    parser.add_argument("--out", type=Path, required=True, help=".parquet, .csv or .npz")
+    args = parser.parse_args(argv)
+
+    art_ids = args.art_ids
+    if args.art_ids_file:
+        art_ids = (art_ids or []) + [int(line) for line in args.art_ids_file.read_text().split()]
+
+    df = read_dense_stock(analytics_engine(), args.store_id, args.start, args.end, art_ids, args.fill_value)
+    write_dense_stock(df, args.out)
+    print(f"✅ {df.shape[0]} SKUs x {df.shape[1]} days written to {args.out}")
+
+if __name__ == "__main__":
+    main()
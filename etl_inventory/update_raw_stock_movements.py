@@ -1,28 +1,30 @@
-import json
+import argparse
+from contextlib import ExitStack
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-from pathlib import Path
-from extract import extract_stock_movements
+import pandas as pd
+from etl_common.async_extract import add_async_args, fetch_frames
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.retry import pending_windows, settle_windows
+from etl_inventory.extract import extract_stock_movements, tag_stock_movements
+from etl_inventory.queries import SQL
+from etl_inventory.raw_stock_movements_helpers import has_natural_key, upsert_raw_stock_movements
+from etl_inventory.stock_flows import create_flows_table
 
-SCRITP_DIR = Path(__file__).resolve().parent
+# Loads upsert on the natural key, so each run safely re-extracts this much before the checkpoint.
+# Without the key (tables seeded before it, see add_natural_key) the updater keeps to
+# rows strictly newer than the checkpoint.
+OVERLAP = timedelta(days=1)
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
-CONFIG_PATH  = PROJECT_ROOT / "config.json"
-CONFIG = json.load(open(CONFIG_PATH))
-
-# Create connection to the cleaned data database (osmart_data)
-db_config = CONFIG["analytics_db"]
-engine = create_engine(
-    f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
+metrics = RunMetrics("update_raw_stock_movements")
 
 def get_last_processed_timestamp(store_name):
     """Get the last processed timestamp for a store from the checkpoint table"""
-    get_last_ts_sql = Path(SCRITP_DIR / "sql/get_last_raw_ts.sql").read_text(encoding="utf-8")
-    
-    with engine.begin() as conn:
+    with analytics_engine().begin() as conn:
         result = conn.execute(
-            text(get_last_ts_sql),
+            SQL.text("get_last_raw_ts.sql"),
             {'store_name': store_name}
         ).scalar()
         
@@ -30,16 +32,14 @@ def get_last_processed_timestamp(store_name):
 
 def update_last_processed_timestamp(store_name, timestamp):
     """Update the last processed timestamp for a store"""
-    set_last_raw_ts_sql = Path(SCRITP_DIR / "sql/set_last_raw_ts.sql").read_text(encoding="utf-8")
-    
-    with engine.begin() as conn:
+    with analytics_engine().begin() as conn:
         conn.execute(
-            text(set_last_raw_ts_sql),
+            SQL.text("set_last_raw_ts.sql"),
             {"ts": timestamp, 'store_name': store_name}
         )
 
-def extract_incremental_data(source, start_timestamp):
-    """Extract data from start_timestamp to now"""
+def incremental_batch_dates(start_timestamp):
+    """Daily batches from start_timestamp to now"""
     end_date = datetime.now().date()
     start_date = start_timestamp.date() if start_timestamp else datetime(2024, 10, 26).date()
     
@@ -51,73 +51,161 @@ def extract_incremental_data(source, start_timestamp):
         batch_dates.append((current_date.isoformat(), current_date.isoformat()))
         current_date += timedelta(days=1)
     
-    return extract_stock_movements(source, batch_dates, SCRITP_DIR)
+    return batch_dates
 
-def main():
-    """Main updater function"""
-    print("🔄 Starting incremental update...")
+def plan_store(source):
+    """Checkpoint and the batches to extract for one store: (last_ts, start_ts, batch_dates)"""
+    store = source['store']
+    # Get last processed timestamp
+    with metrics.span("checkpoint", store):
+        last_ts = get_last_processed_timestamp(store)
     
-    for source in CONFIG["sicar_sources"]:
-        print(f"\n📊 Processing updates for {source['name']}")
-        
-        # Get last processed timestamp
-        last_ts = get_last_processed_timestamp(source['store'])
-        
-        if last_ts:
-            print(f"📅 Last processed timestamp: {last_ts}")
-            # Add a small buffer to avoid missing data due to timing issues
-            start_ts = last_ts + timedelta(seconds=1)
+    if last_ts:
+        print(f"📅 Last processed timestamp: {last_ts}")
+        with analytics_engine().connect() as conn:
+            upserts = has_natural_key(conn)
+        if upserts:
+            # Overlap the previous window to pick up late-arriving rows; upserts make this idempotent
+            start_ts = last_ts - OVERLAP
         else:
-            print("⚠️ No checkpoint found, starting from default date")
-            start_ts = datetime(2024, 10, 26)
-        
-        print(f"🚀 Extracting data from {start_ts} onwards...")
-        
-        # Extract and load new data
-        total_rows = 0
-        max_fecha = None
+            print("⚠️ raw_stock_movements has no uq_natural key; loading only rows after the checkpoint")
+            start_ts = last_ts + timedelta(seconds=1)
+    else:
+        print("⚠️ No checkpoint found, starting from default date")
+        start_ts = datetime(2024, 10, 26)
+    
+    # Windows that failed in earlier runs (or in a seed) are replayed first
+    replay = pending_windows(analytics_engine(), RAW_STOCK_MOVEMENTS, store)
+    if replay:
+        print(f"🔁 Replaying {len(replay)} failed windows first")
+    batch_dates = replay + [b for b in incremental_batch_dates(start_ts) if b not in replay]
+    return last_ts, start_ts, batch_dates
+
+def drop_loaded(df, last_ts):
+    """
+    Rows of the checkpoint's day up to the checkpoint, which the daily batch
+    re-extracts and a table without the natural key would insert twice. Replayed
+    windows of earlier days are kept.
+    """
+    fecha = pd.to_datetime(df["fecha"])
+    return df[(fecha > last_ts) | (fecha < pd.Timestamp(last_ts).normalize())]
+
+def load_store(source, last_ts, start_ts, batch_dates, frames, failed):
+    """Upsert the extracted frames, queue failed batches and advance the checkpoint up to the first gap"""
+    store = source['store']
+    # Extract and load new data
+    total_rows = 0
+    max_fecha = None
+    
+    for df in metrics.timed(frames, "extract", store):
+        metrics.add_frame(df, "extract", store)
+        if last_ts and start_ts > last_ts:
+            df = drop_loaded(df, last_ts)
+        if not df.empty:
+            # Load to database (upsert on the natural key)
+            with metrics.span("load", store), analytics_engine().begin() as conn:
+                written = upsert_raw_stock_movements(conn, df)
+            metrics.add_frame(written, "load", store)
+            
+            total_rows += len(written)
+            
+            # Track the maximum fecha for checkpoint update
+            batch_max = pd.to_datetime(written['fecha']).max()
+            if max_fecha is None or batch_max > max_fecha:
+                max_fecha = batch_max
+    
+    settle_windows(analytics_engine(), RAW_STOCK_MOVEMENTS, store, batch_dates, failed)
+
+    # Never move the checkpoint past a day we failed to extract: the next run resumes there.
+    # Older replayed windows stay queued instead of holding the checkpoint back.
+    gaps = [pd.Timestamp(start) for start, end, _ in failed if pd.Timestamp(end) >= pd.Timestamp(start_ts.date())]
+    if gaps and max_fecha is not None:
+        max_fecha = min(max_fecha, min(gaps))
+        print(f"⏸️ Checkpoint held at the first failed day, {min(gaps).date()}")
+
+    if total_rows > 0:
+        print(f"✅ Upserted {total_rows} rows")
         
-        try:
-            for df in extract_incremental_data(source, start_ts):
-                if not df.empty:
-                    # Filter out records that are not newer than last_ts
-                    if last_ts:
-                        df = df[pd.to_datetime(df['fecha']) > last_ts]
-                    
-                    if not df.empty:
-                        # Load to database
-                        df.to_sql(
-                            "raw_stock_movements", 
-                            con=engine, 
-                            if_exists="append", 
-                            index=False,
-                            method="multi"
-                        )
-                        
-                        total_rows += len(df)
-                        
-                        # Track the maximum fecha for checkpoint update
-                        batch_max = pd.to_datetime(df['fecha']).max()
-                        if max_fecha is None or batch_max > max_fecha:
-                            max_fecha = batch_max
+        # Update checkpoint with the maximum fecha processed (never move it backwards)
+        if max_fecha and (last_ts is None or max_fecha > last_ts):
+            with metrics.span("checkpoint", store):
+                update_last_processed_timestamp(store, max_fecha)
+            print(f"📌 Updated checkpoint to: {max_fecha}")
+    else:
+        print(f"ℹ️ No new records found for {source['name']}")
+    return total_rows
+
+def update_store(source):
+    """Extract and upsert one store's movements since its checkpoint, then advance it"""
+    last_ts, start_ts, batch_dates = plan_store(source)
+    print(f"🚀 Extracting data from {start_ts} onwards...")
+    failed = []
+    frames = extract_stock_movements(source, batch_dates, failed)
+    return load_store(source, last_ts, start_ts, batch_dates, frames, failed)
+
+def update_stores_concurrently(sources, lock_wait, per_store, timeout):
+    """
+    Same as update_store for every store, but all stores' batches are extracted
+    at once (per_store queries per store database) before loading store by store.
+    """
+    query = SQL.source("extract_stock_movements.sql")
+    with ExitStack() as locks:
+        plans = []
+        for source in sources:
+            try:
+                locks.enter_context(stage_lock(analytics_engine(), RAW_STOCK_MOVEMENTS, source['store'], lock_wait))
+                plans.append((source, *plan_store(source)))
+            except LockBusy as e:
+                print(f"⏭️ Skipping {source['name']}: {e}")
+            except Exception as e:
+                print(f"❗️ Error planning {source['name']}: {e}")
+
+        requests = [(source, query, {"start_date": start, "end_date": end})
+                    for source, _, _, batch_dates in plans for start, end in batch_dates]
+        print(f"🚀 Extracting {len(requests)} batches from {len(plans)} stores concurrently...")
+        with metrics.span("extract"):
+            results = iter(fetch_frames(requests, per_store=per_store, timeout=timeout))
+
+        for source, last_ts, start_ts, batch_dates in plans:
+            print(f"\n📊 Loading updates for {source['name']}")
+            frames, failed = [], []
+            for (start, end), result in zip(batch_dates, results):
+                if isinstance(result, Exception):
+                    failed.append((start, end, result))
+                elif not result.empty:
+                    frames.append(tag_stock_movements(result, source))
+            try:
+                load_store(source, last_ts, start_ts, batch_dates, frames, failed)
+            except Exception as e:
+                print(f"❗️ Error processing {source['name']}: {e}")
+
+def main(argv=None):
+    """Main updater function"""
+    options = run_options("update_raw_stock_movements", argv, add_async_args(argparse.ArgumentParser()))
+    metrics.profiler = options.profiler
+    print("🔄 Starting incremental update...")
+    with analytics_engine().begin() as conn:
+        create_flows_table(conn)
+    
+    if options.async_per_store:
+        update_stores_concurrently(load_config()["sicar_sources"], options.lock_wait,
+                                   options.async_per_store, options.query_timeout)
+    else:
+        for source in load_config()["sicar_sources"]:
+            print(f"\n📊 Processing updates for {source['name']}")
             
-            if total_rows > 0:
-                print(f"✅ Loaded {total_rows} new rows")
-                
-                # Update checkpoint with the maximum fecha processed
-                if max_fecha:
-                    update_last_processed_timestamp(source['store'], max_fecha)
-                    print(f"📌 Updated checkpoint to: {max_fecha}")
-            else:
-                print(f"ℹ️ No new records found for {source['name']}")
-                
-        except Exception as e:
-            print(f"❗️ Error processing {source['name']}: {e}")
-            continue
+            try:
+                with stage_lock(analytics_engine(), RAW_STOCK_MOVEMENTS, source['store'], options.lock_wait):
+                    update_store(source)
+            except LockBusy as e:
+                print(f"⏭️ Skipping {source['name']}: {e}")
+                continue
+            except Exception as e:
+                print(f"❗️ Error processing {source['name']}: {e}")
+                continue
     
+    metrics.write()
     print("\n🎉 Incremental update completed!")
 
 if __name__ == "__main__":
-    # Import pandas here since it's used in the main function
-    import pandas as pd
-    main()
\ No newline at end of file
+    main()
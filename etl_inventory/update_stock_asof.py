@@ -0,0 +1,134 @@
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import STOCK_ASOF, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.schema import FILTERED_MOVEMENTS, apply_schema, memory_report
+from etl_inventory.dq_engine import screen_movements
+from etl_inventory.queries import SQL
+from etl_inventory.stock_flows import create_flows_table, fill_adjustments
+from etl_inventory.stock_points_helpers import prepare_movements, running_stock
+from etl_inventory.stock_series import fetch_stock_points
+
+DEFAULT_START = date(2024, 10, 26)
+WINDOW = timedelta(days=31)  # movements replayed per read/write round
+
+metrics = RunMetrics("update_stock_asof")
+
+ASOF_COLUMNS = ["raw_id", "store_id", "art_id", "fecha", "tipo_movimiento", "tabla_origen", "id_origen",
+                "delta_cantidad", "is_absolute", "sod_stock", "stock_before", "stock_after"]
+
+def create_asof_table(conn):
+    conn.execute(SQL.text("create_stock_movements_asof.sql"))
+
+def refresh_range(store):
+    """
+    Days to (re)materialize: from the last day already in stock_movements_asof
+    (it may have been partial) up to the last day with SOD stock points
+    """
+    with analytics_engine().begin() as conn:
+        last_points_dt = conn.execute(
+            SQL.text("get_last_points_dt.sql"),
+            {"store_name": store["store"]}
+        ).scalar()
+        last_asof_dt = conn.execute(
+            text("SELECT DATE(MAX(fecha)) FROM stock_movements_asof WHERE store_id = :store_id"),
+            {"store_id": store["store_id"]}
+        ).scalar()
+    return (last_asof_dt or DEFAULT_START), last_points_dt
+
+def reset_asof(engine):
+    """
+    Empty stock_movements_asof once a seed has rebuilt raw_stock_movements (new
+    raw_ids) or stock_points (new SOD stock), so the next run replays every store
+    from DEFAULT_START instead of resuming on top of stale rows
+    """
+    with engine.begin() as conn:
+        if conn.execute(text("SHOW TABLES LIKE 'stock_movements_asof'")).fetchone() is not None:
+            conn.execute(text("TRUNCATE TABLE stock_movements_asof"))
+            print("🧹 stock_movements_asof emptied; it is rebuilt from the go-live")
+
+def materialize_window(store, start, end):
+    """Replace the as-of rows of [start, end] for one store; returns the rows written"""
+    store_name = store["store"]
+    with metrics.span("extract", store_name), analytics_engine().begin() as conn:
+        query = SQL.text("extract_filter_raw_stock_movements_incremental.sql")
+        movements = pd.read_sql_query(query, conn, params={
+            "store_id": store["store_id"], "start_date": start.isoformat(), "end_date": end.isoformat()
+        })
+        movements = apply_schema(movements, FILTERED_MOVEMENTS)
+        points = fetch_stock_points(conn, store["store_id"], start, end)
+    metrics.add_frame(movements, "extract", store_name)
+    print(f"📦 {start} → {end}: {len(movements)} movements, {len(points)} stock points, {memory_report(movements)}")
+
+    # Same screen as the stock points replay, so outliers reach neither the as-of
+    # stock nor the net adjustments of the flows
+    with metrics.span("dq", store_name):
+        movements, _ = screen_movements(analytics_engine(), store, movements)
+
+    with metrics.span("transform", store_name):
+        asof = running_stock(prepare_movements(movements), points)
+        asof["store_id"] = store["store_id"]
+        asof["is_absolute"] = asof["is_absolute"].astype("int8")
+        asof = asof[ASOF_COLUMNS]
+
+    with metrics.span("load", store_name), analytics_engine().begin() as conn:
+        conn.execute(
+            text("""
+                DELETE FROM stock_movements_asof
+                WHERE store_id = :store_id AND fecha >= :start AND fecha < :end_excl
+            """),
+            {"store_id": store["store_id"], "start": start, "end_excl": end + timedelta(days=1)}
+        )
+        asof.to_sql("stock_movements_asof", con=conn, if_exists="append", index=False,
+                    method="multi", chunksize=5_000)
+        # Net adjustments only exist once the day is replayed
+        fill_adjustments(conn, store["store_id"], start, end)
+    metrics.add_frame(asof, "load", store_name)
+    return len(asof)
+
+def update_store(source):
+    """Materialize one store's as-of rows from its last materialized day up to its SOD checkpoint"""
+    with metrics.span("checkpoint", source["store"]):
+        start, end = refresh_range(source)
+    if end is None or start > end:
+        print(f"✅ Nothing to refresh for {source['name']}")
+        return 0
+
+    total = 0
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + WINDOW - timedelta(days=1), end)
+        total += materialize_window(source, window_start, window_end)
+        window_start = window_end + timedelta(days=1)
+    print(f"✅ {total} movements with as-of stock from {start} to {end}")
+    return total
+
+def main(argv=None):
+    """Main updater function: run after update_stock_points"""
+    options = run_options("update_stock_asof", argv)
+    metrics.profiler = options.profiler
+    print("🔄 Starting stock as-of refresh...")
+    with analytics_engine().begin() as conn:
+        create_asof_table(conn)
+        create_flows_table(conn)
+
+    for source in load_config()["sicar_sources"]:
+        print(f"\n📊 Processing stock as-of for {source['name']}")
+        try:
+            with stage_lock(analytics_engine(), STOCK_ASOF, source["store"], options.lock_wait):
+                update_store(source)
+        except LockBusy as e:
+            print(f"⏭️ Skipping {source['name']}: {e}")
+            continue
+        except Exception as e:
+            print(f"❗️ Error processing {source['name']}: {e}")
+            continue
+
+    metrics.write()
+    print("\n🎉 Stock as-of refresh completed!")
+
+if __name__ == "__main__":
+    main()
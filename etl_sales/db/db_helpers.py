@@ -1,11 +1,11 @@
 from sqlalchemy import text
 from sqlalchemy.dialects.mysql import insert
 
-def reset_ventas_limpias(engine):
+def reset_ventas_limpias(engine, table="ventas_limpias"):
     with engine.begin() as conn:
-        conn.execute(text("DROP TABLE IF EXISTS ventas_limpias"))
-        conn.execute(text("""
-            CREATE TABLE ventas_limpias (
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.execute(text(f"""
+            CREATE TABLE {table} (
                 ven_id INT,
                 tienda VARCHAR(100),
                 fecha_hora DATETIME,
@@ -52,5 +52,5 @@ def get_max_id_sicar(engine, store):
                 AND source_system = 'sicar';
             """),
             {"store": store}
-        )
+        ).scalar()
     return result
\ No newline at end of file
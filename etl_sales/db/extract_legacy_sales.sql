@@ -4,13 +4,14 @@ SELECT
     v.USUHORA AS susuhora,
     v.Caja AS caja,
     v.USUARIO AS usuario,
-    v.importe + v.IMPUESTO AS total,
+    -- amounts in integer cents, NULL as 0 (the int64 money columns of etl_common/schema.py)
+    CAST(ROUND(COALESCE(v.importe + v.IMPUESTO, 0) * 100) AS SIGNED) AS total,
     -- Real payment breakdown from flujo
-    SUM(CASE WHEN f.concepto2 = 'TAR' AND f.ING_EG = 'I' THEN f.importe ELSE 0 END) AS tarjeta_in,
-    SUM(CASE WHEN f.concepto2 = 'EFE' AND f.ING_EG = 'I' THEN f.importe ELSE 0 END) AS efectivo_in,
-    SUM(CASE WHEN f.concepto2 NOT IN ('EFE', 'TAR') AND f.ING_EG = 'I' THEN f.importe ELSE 0 END) AS otros_in,
-    COALESCE(c.importe, 0) AS cobranza_aplicada,
-    SUM(CASE WHEN f.concepto2 <> 'TARJ' AND f.ING_EG = 'E' THEN f.importe ELSE 0 END) AS egresos
+    CAST(ROUND(COALESCE(SUM(CASE WHEN f.concepto2 = 'TAR' AND f.ING_EG = 'I' THEN f.importe ELSE 0 END), 0) * 100) AS SIGNED) AS tarjeta_in,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN f.concepto2 = 'EFE' AND f.ING_EG = 'I' THEN f.importe ELSE 0 END), 0) * 100) AS SIGNED) AS efectivo_in,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN f.concepto2 NOT IN ('EFE', 'TAR') AND f.ING_EG = 'I' THEN f.importe ELSE 0 END), 0) * 100) AS SIGNED) AS otros_in,
+    CAST(ROUND(COALESCE(c.importe, 0) * 100) AS SIGNED) AS cobranza_aplicada,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN f.concepto2 <> 'TARJ' AND f.ING_EG = 'E' THEN f.importe ELSE 0 END), 0) * 100) AS SIGNED) AS egresos
 FROM ventas v
 LEFT JOIN flujo f ON v.venta = f.venta
 LEFT JOIN cobranza c ON v.venta = c.venta
@@ -3,10 +3,11 @@ SELECT
     MAX(historial.fecha) AS fecha_hora,
     MAX(movimiento.caj_id) AS caja,
     MAX(usuario.nombre) AS usuario,
-    SUM(CASE WHEN tipopago.tpa_id = 1 THEN movimiento.total ELSE 0 END) AS efectivo,
-    SUM(CASE WHEN tipopago.tpa_id = 6 THEN movimiento.total ELSE 0 END) AS tarjeta,
-    SUM(CASE WHEN tipopago.tpa_id NOT IN (1, 6) THEN movimiento.total ELSE 0 END) AS otros,
-    SUM(movimiento.total) AS total_venta
+    -- amounts in integer cents, NULL as 0 (the int64 money columns of etl_common/schema.py)
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 1 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS efectivo,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 6 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS tarjeta,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id NOT IN (1, 6) THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS otros,
+    CAST(ROUND(COALESCE(SUM(movimiento.total), 0) * 100) AS SIGNED) AS total_venta
 FROM 
     movimiento
 INNER JOIN historial ON movimiento.mov_id = historial.id
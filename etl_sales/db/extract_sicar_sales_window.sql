@@ -0,0 +1,26 @@
+SELECT 
+    movimiento.ven_id,
+    MAX(historial.fecha) AS fecha_hora,
+    MAX(movimiento.caj_id) AS caja,
+    MAX(usuario.nombre) AS usuario,
+    -- amounts in integer cents, NULL as 0 (the int64 money columns of etl_common/schema.py)
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 1 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS efectivo,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 6 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS tarjeta,
+    CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id NOT IN (1, 6) THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS otros,
+    CAST(ROUND(COALESCE(SUM(movimiento.total), 0) * 100) AS SIGNED) AS total_venta
+FROM 
+    movimiento
+INNER JOIN historial ON movimiento.mov_id = historial.id
+INNER JOIN tipopago ON movimiento.tpa_id = tipopago.tpa_id
+INNER JOIN usuario ON historial.usu_id = usuario.usu_id
+WHERE 
+    historial.tabla = 'Movimiento'
+    AND movimiento.tipo = 1
+    AND movimiento.status = 1
+    AND movimiento.ven_id IS NOT NULL
+    AND historial.fecha >= :start_ts
+    AND historial.fecha < :end_ts
+GROUP BY 
+    movimiento.ven_id
+ORDER BY 
+    fecha_hora;
@@ -0,0 +1,65 @@
+-- Daily sales rollups rebuilt from ventas_limpias into shadow tables (swapped in by rollups.py).
+-- caja/usuario are '' when unknown so they can be part of the primary key.
+DROP TABLE IF EXISTS ventas_diarias__next;
+
+CREATE TABLE ventas_diarias__next (
+    tienda VARCHAR(100) NOT NULL,
+    dia DATE NOT NULL,
+    tickets INT NOT NULL DEFAULT 0,
+    efectivo DECIMAL(20,2) NOT NULL DEFAULT 0,
+    tarjeta DECIMAL(20,2) NOT NULL DEFAULT 0,
+    otros DECIMAL(20,2) NOT NULL DEFAULT 0,
+    total_venta DECIMAL(20,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (tienda, dia)
+);
+
+INSERT INTO ventas_diarias__next (tienda, dia, tickets, efectivo, tarjeta, otros, total_venta)
+SELECT
+    tienda,
+    DATE(fecha_hora),
+    COUNT(*),
+    SUM(COALESCE(efectivo, 0)),
+    SUM(COALESCE(tarjeta, 0)),
+    SUM(COALESCE(otros, 0)),
+    SUM(COALESCE(total_venta, 0))
+FROM
+    ventas_limpias
+WHERE
+    fecha_hora IS NOT NULL
+GROUP BY
+    tienda, DATE(fecha_hora);
+
+DROP TABLE IF EXISTS ventas_diarias_caja_usuario__next;
+
+CREATE TABLE ventas_diarias_caja_usuario__next (
+    tienda VARCHAR(100) NOT NULL,
+    dia DATE NOT NULL,
+    caja VARCHAR(10) NOT NULL DEFAULT '',
+    usuario VARCHAR(50) NOT NULL DEFAULT '',
+    tickets INT NOT NULL DEFAULT 0,
+    efectivo DECIMAL(20,2) NOT NULL DEFAULT 0,
+    tarjeta DECIMAL(20,2) NOT NULL DEFAULT 0,
+    otros DECIMAL(20,2) NOT NULL DEFAULT 0,
+    total_venta DECIMAL(20,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (tienda, dia, caja, usuario)
+);
+
+INSERT INTO ventas_diarias_caja_usuario__next (tienda, dia, caja, usuario, tickets, efectivo, tarjeta, otros, total_venta)
+SELECT
+    tienda,
+    DATE(fecha_hora),
+    COALESCE(caja, ''),
+    COALESCE(usuario, ''),
+    COUNT(*),
+    SUM(COALESCE(efectivo, 0)),
+    SUM(COALESCE(tarjeta, 0)),
+    SUM(COALESCE(otros, 0)),
+    SUM(COALESCE(total_venta, 0))
+FROM
+    ventas_limpias
+WHERE
+    fecha_hora IS NOT NULL
+GROUP BY
+    tienda, DATE(fecha_hora), COALESCE(caja, ''), COALESCE(usuario, '');
@@ -0,0 +1,36 @@
+-- Per-bucket fingerprint of the sales extract_sicar_sales.sql would return for the window.
+-- Must stay in step with reconcile_ventas_limpias_buckets.sql (same columns, same cents).
+SELECT
+    DATE_FORMAT(s.fecha_hora, :bucket_fmt) AS bucket,
+    COUNT(*) AS sales,
+    SUM(s.total_venta) AS total_cents,
+    BIT_XOR(CRC32(CONCAT_WS('|', s.ven_id, s.caja, s.usuario, s.efectivo, s.tarjeta, s.otros, s.total_venta))) AS content_hash
+FROM (
+    SELECT 
+        movimiento.ven_id,
+        MAX(historial.fecha) AS fecha_hora,
+        MAX(movimiento.caj_id) AS caja,
+        MAX(usuario.nombre) AS usuario,
+        -- amounts in integer cents, NULL as 0 (the int64 money columns of etl_common/schema.py)
+        CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 1 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS efectivo,
+        CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id = 6 THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS tarjeta,
+        CAST(ROUND(COALESCE(SUM(CASE WHEN tipopago.tpa_id NOT IN (1, 6) THEN movimiento.total ELSE 0 END), 0) * 100) AS SIGNED) AS otros,
+        CAST(ROUND(COALESCE(SUM(movimiento.total), 0) * 100) AS SIGNED) AS total_venta
+    FROM 
+        movimiento
+    INNER JOIN historial ON movimiento.mov_id = historial.id
+    INNER JOIN tipopago ON movimiento.tpa_id = tipopago.tpa_id
+    INNER JOIN usuario ON historial.usu_id = usuario.usu_id
+    WHERE 
+        historial.tabla = 'Movimiento'
+        AND movimiento.tipo = 1
+        AND movimiento.status = 1
+        AND movimiento.ven_id IS NOT NULL
+        AND movimiento.ven_id <= :max_ven_id
+        AND historial.fecha >= :start_ts
+        AND historial.fecha < :end_ts
+    GROUP BY 
+        movimiento.ven_id
+) s
+GROUP BY
+    bucket;
@@ -0,0 +1,23 @@
+-- Per-bucket fingerprint of what ventas_limpias holds for a SICAR store.
+-- Must stay in step with reconcile_sicar_buckets.sql (same columns, same cents).
+SELECT
+    DATE_FORMAT(fecha_hora, :bucket_fmt) AS bucket,
+    COUNT(*) AS sales,
+    SUM(CAST(ROUND(total_venta * 100) AS SIGNED)) AS total_cents,
+    BIT_XOR(CRC32(CONCAT_WS('|',
+        ven_id, caja, usuario,
+        CAST(ROUND(efectivo * 100) AS SIGNED),
+        CAST(ROUND(tarjeta * 100) AS SIGNED),
+        CAST(ROUND(otros * 100) AS SIGNED),
+        CAST(ROUND(total_venta * 100) AS SIGNED)
+    ))) AS content_hash
+FROM
+    ventas_limpias
+WHERE
+    tienda = :store
+    AND source_system = 'sicar'
+    AND ven_id <= :max_ven_id
+    AND fecha_hora >= :start_ts
+    AND fecha_hora < :end_ts
+GROUP BY
+    bucket;
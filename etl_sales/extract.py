@@ -1,9 +1,12 @@
-import jaydebeapi
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy import text
+from etl_common.config import source_engine
+from etl_common.retry import with_retries
+from etl_common.schema import LEGACY_SALES, SICAR_SALES, apply_schema, extraction_timestamp, memory_report
+from etl_sales.queries import SQL
 
 def extract_legacy(config):
+    import jaydebeapi  # optional: only the MyBusiness seeds need the JDBC bridge (and a JVM)
+
     try:
         conn = None
         conn = jaydebeapi.connect(
@@ -14,9 +17,7 @@ def extract_legacy(config):
         )
         cursor = conn.cursor()
         
-        # Load legacy sales query from file
-        with open("db/extract_legacy_sales.sql", "r") as f:
-            query = f.read()
+        query = SQL.source("extract_legacy_sales.sql")
 
         for database in config["databases"]:
             try:
@@ -29,10 +30,11 @@ def extract_legacy(config):
                 df["tienda"] = config['store']
                 df['source_db'] = database
                 df['source_system'] = "mybusiness"
-                df['extracted_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+                df['extracted_at'] = extraction_timestamp()
+                df = apply_schema(df, LEGACY_SALES)
                 
                 if not df.empty:
-                    print(f" ✅ Extracted {len(df)} rows from {database}")
+                    print(f" ✅ Extracted {len(df)} rows from {database}, {memory_report(df)}")
                     yield df
                 else:
                     print(f" ⚠️ No data found in {database}")
@@ -48,41 +50,43 @@ def extract_legacy(config):
             conn.close()
             print("🔌 Connection closed")
             
-def extract_sicar(config, batch_dates):
-    try:
-        # Use SQLAlchemy to connect to modern MySQL
-        conn_str = f"mysql+pymysql://{config['user']}:{config['password']}@{config['host']}:{config['port']}/{config['database']}"
-        engine = create_engine(conn_str)
-        conn = engine.connect()
-        
-        # Load SICAR sales query from file
-        with open("db/extract_sicar_sales.sql", "r") as f:
-            query =  text(f.read())
-        
-        for start_date, end_date in batch_dates:
-            try:
-                print(f"🔄 Extracting SICAR sales for {config['store']} from {start_date} to {end_date}...", end="", flush=True)
-                df = pd.read_sql_query(
-                    query,
-                    conn,
-                    params={"start_date": start_date, "end_date": end_date}
-                )
+def extract_sicar(config, batch_dates, failed=None):
+    """
+    Yield one frame per (start_date, end_date) batch, each retried with backoff
+    on a fresh connection. Batches that still fail are appended to `failed` as
+    (start_date, end_date, error) for the caller to queue.
+    """
+    # Use SQLAlchemy to connect to modern MySQL
+    engine = source_engine(config)
+    query = SQL.text("extract_sicar_sales.sql")
 
-                df["tienda"] = config["store"]
-                df["source_db"] = config["database"]
-                df["source_system"] = "sicar"
-                df["extracted_at"] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                if not df.empty:
-                    print(f" ✅ Extracted {len(df)} rows")
-                    yield df
-                else:
-                    print(f" ⚠️ No data found in batch {start_date} to {end_date}")
-            except Exception as e:
-                print(f"❗️ Error extracting batch {start_date} to {end_date} for {config['store']}: {e}")
-    except Exception as conn_err:
-        print(f"❗️ Database connection error for SICAR {config['store']} at {config['host']}::{conn_err}")
-    finally:
-        if conn:
-            conn.close()
-            print("🔌 SICAR connection closed")
\ No newline at end of file
+    def read_batch(start_date, end_date):
+        with engine.connect() as conn:
+            return pd.read_sql_query(
+                query,
+                conn,
+                params={"start_date": start_date, "end_date": end_date}
+            )
+    
+    for start_date, end_date in batch_dates:
+        print(f"🔄 Extracting SICAR sales for {config['store']} from {start_date} to {end_date}...", end="", flush=True)
+        try:
+            df = with_retries(lambda: read_batch(start_date, end_date),
+                              f"{config['store']} batch {start_date} to {end_date}")
+        except Exception as e:
+            print(f"❗️ Error extracting batch {start_date} to {end_date} for {config['store']}: {e}")
+            if failed is not None:
+                failed.append((start_date, end_date, e))
+            continue
+
+        df["tienda"] = config["store"]
+        df["source_db"] = config["database"]
+        df["source_system"] = "sicar"
+        df["extracted_at"] = extraction_timestamp()
+        df = apply_schema(df, SICAR_SALES)
+        
+        if not df.empty:
+            print(f" ✅ Extracted {len(df)} rows, {memory_report(df)}")
+            yield df
+        else:
+            print(f" ⚠️ No data found in batch {start_date} to {end_date}")
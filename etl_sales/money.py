@@ -0,0 +1,15 @@
+# Sales frames carry money as int64 cents from extraction (the SQL casts
+# ROUND(x * 100) to SIGNED) until the load into ventas_limpias DECIMAL(20,2).
+MONEY_COLUMNS = ["efectivo", "tarjeta", "otros", "total_venta"]
+
+def cents_to_amounts(df, columns=MONEY_COLUMNS):
+    """
+    Copy of df with money columns as float64 amounts ready for DECIMAL(20,2).
+    n / 100 is the double closest to the 2-decimal value and its repr is exactly
+    that value, so the literal sent to MySQL carries no float noise.
+    """
+    out = df.copy()
+    for col in columns:
+        if col in out.columns:
+            out[col] = out[col].astype("int64") / 100
+    return out
@@ -0,0 +1,46 @@
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+import pandas as pd
+
+class QASink:
+    """
+    Buffers QA frames per partition and writes each partition once, as one
+    zstd-compressed Parquet file per run, instead of appending CSV per batch.
+    """
+    def __init__(self, out_dir, name="payment_issues", run_id=None):
+        self.out_dir = Path(out_dir)
+        self.name = name
+        self.run_id = run_id or pd.Timestamp.now().strftime("%Y%m%dT%H%M%S")
+        self._buffers = defaultdict(list)
+
+    def add(self, df, partition):
+        if not df.empty:
+            self._buffers[partition].append(df)
+
+    def flush(self, partition):
+        """Write the buffered rows of one partition; returns the file path or None"""
+        frames = self._buffers.pop(partition, [])
+        if not frames:
+            return None
+
+        out = pd.concat(frames, ignore_index=True)
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", str(partition)).strip("_")
+        path = self.out_dir / f"{self.name}_{slug}_{self.run_id}.parquet"
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = path.with_suffix(".tmp")
+        out.to_parquet(tmp_path, index=False, compression="zstd")
+        os.replace(tmp_path, path)
+        print(f"📝 Wrote {len(out)} QA rows to {path}")
+        return path
+
+    def close(self):
+        return [self.flush(partition) for partition in list(self._buffers)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,164 @@
+"""
+Reconcile ventas_limpias against the SICAR stores.
+
+    python -m etl_sales.reconcile --days 7
+    python -m etl_sales.reconcile --start 2025-01-01 --end 2025-03-31 --store centro --dry-run
+
+The ven_id watermark in update_clean_data never looks back, so sales edited
+or cancelled in SICAR after extraction drift silently. For every store this
+compares a per-day fingerprint (sale count, total in cents and an XOR of
+per-sale CRC32s) computed on both sides, drills into the hours of the days
+that differ, and repairs only those hours:
+- re-extract the window and upsert it (rollups included);
+- a stored sale missing from the window is looked up by ven_id, so a sale
+  that moved is upserted and one that is gone is deleted.
+Only sales up to the store's last_processed_ven_id are compared; newer ones
+belong to the next update run.
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import bindparam, text
+from etl_common.metrics import RunMetrics
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config, source_engine
+from etl_common.locks import SALES, LockBusy, stage_lock
+from etl_sales.queries import SQL
+from etl_sales.rollups import delete_sales, ensure_rollups
+from etl_sales.sales_sync import get_last_processed_ven_id, tag_sicar_sales, upsert_sales
+
+DAY_FMT = "%Y-%m-%d"
+HOUR_FMT = "%Y-%m-%d %H:00:00"
+FINGERPRINT_COLS = ["sales", "total_cents", "content_hash"]
+
+metrics = RunMetrics("reconcile_sales")
+
+def fingerprints(conn, query, params):
+    df = pd.read_sql_query(SQL.text(query), conn, params=params)
+    for col in FINGERPRINT_COLS:
+        df[col] = pd.to_numeric(df[col]).astype("int64")
+    return df.set_index("bucket")[FINGERPRINT_COLS]
+
+def differing_buckets(src, dst):
+    """Buckets whose fingerprint differs or that exist on one side only, in order"""
+    both = src.join(dst, how="outer", lsuffix="_src", rsuffix="_dst")
+    diff = pd.Series(False, index=both.index)
+    for col in FINGERPRINT_COLS:
+        diff |= both[f"{col}_src"].ne(both[f"{col}_dst"])
+    return sorted(both.index[diff])
+
+def repair_window(source, source_conn, analytics_engine, start_ts, end_ts, max_ven_id, dry_run):
+    """Re-extract one window and upsert/delete until ventas_limpias matches it; returns (upserted, deleted)"""
+    store = source["store"]
+    with metrics.span("extract", store):
+        fresh = pd.read_sql_query(SQL.text("extract_sicar_sales_window.sql"), source_conn, params={"start_ts": start_ts, "end_ts": end_ts})
+        fresh = fresh[fresh["ven_id"] <= max_ven_id]
+
+        with analytics_engine.connect() as conn:
+            stored_ids = conn.execute(
+                text("""
+                    SELECT ven_id FROM ventas_limpias
+                    WHERE tienda = :store AND source_system = 'sicar' AND ven_id <= :max_ven_id
+                      AND fecha_hora >= :start_ts AND fecha_hora < :end_ts
+                """),
+                {"store": store, "max_ven_id": max_ven_id, "start_ts": start_ts, "end_ts": end_ts}
+            ).scalars().all()
+
+        # Stored here but not in the window: moved to another time, or cancelled
+        orphans = sorted(set(stored_ids) - set(fresh["ven_id"].tolist()))
+        moved = fresh.iloc[0:0]
+        if orphans:
+            by_id = SQL.text("extract_sicar_sales_by_id.sql").bindparams(bindparam("ven_ids", expanding=True))
+            moved = pd.read_sql_query(by_id, source_conn, params={"ven_ids": orphans})
+        gone = sorted(set(orphans) - set(moved["ven_id"].tolist()))
+        batch = tag_sicar_sales(pd.concat([fresh, moved], ignore_index=True), source)
+    metrics.add_frame(batch, "extract", store)
+
+    print(f"   {start_ts:%Y-%m-%d %H:%M}: {len(batch)} to upsert ({len(moved)} moved), {len(gone)} to delete")
+    if dry_run:
+        return len(batch), len(gone)
+
+    with metrics.span("load", store), analytics_engine.begin() as conn:
+        if not batch.empty:
+            upsert_sales(conn, batch)
+        if gone:
+            delete_sales(conn, pd.DataFrame({"ven_id": gone, "tienda": store, "source_system": "sicar"}))
+    metrics.add_frame(batch, "load", store)
+    return len(batch), len(gone)
+
+def reconcile_store(source, analytics_engine, start, end, dry_run=False):
+    store = source["store"]
+    with analytics_engine.connect() as conn:
+        max_ven_id = get_last_processed_ven_id(conn, store)
+
+    params = {"store": store, "max_ven_id": max_ven_id, "bucket_fmt": DAY_FMT,
+              "start_ts": pd.Timestamp(start), "end_ts": pd.Timestamp(end) + pd.Timedelta(days=1)}
+
+    upserted = deleted = 0
+    with source_engine(source).connect() as source_conn:
+        with metrics.span("verify", store):
+            with analytics_engine.connect() as conn:
+                days = differing_buckets(fingerprints(source_conn, "reconcile_sicar_buckets.sql", params),
+                                         fingerprints(conn, "reconcile_ventas_limpias_buckets.sql", params))
+        print(f"🔎 {store}: {len(days)} of {(end - start).days + 1} days differ")
+
+        for day in days:
+            day_start = pd.Timestamp(day)
+            hour_params = {**params, "bucket_fmt": HOUR_FMT, "start_ts": day_start, "end_ts": day_start + pd.Timedelta(days=1)}
+            with metrics.span("verify", store):
+                with analytics_engine.connect() as conn:
+                    hours = differing_buckets(fingerprints(source_conn, "reconcile_sicar_buckets.sql", hour_params),
+                                              fingerprints(conn, "reconcile_ventas_limpias_buckets.sql", hour_params))
+
+            for hour in hours:
+                hour_start = pd.Timestamp(hour)
+                u, d = repair_window(source, source_conn, analytics_engine,
+                                     hour_start, hour_start + pd.Timedelta(hours=1), max_ven_id, dry_run)
+                upserted += u
+                deleted += d
+
+    metrics.add("days_differing", len(days), "verify", store)
+    print(f"✅ {store}: {'would upsert' if dry_run else 'upserted'} {upserted}, "
+          f"{'would delete' if dry_run else 'deleted'} {deleted}")
+    return upserted, deleted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7, help="reconcile the last N days up to today")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--store", nargs="*", help="only these stores")
+    parser.add_argument("--dry-run", action="store_true", help="report differences without writing")
+    args = run_options("reconcile_sales", argv, parser)
+    metrics.profiler = args.profiler
+
+    end = args.end or date.today()
+    start = args.start or end - timedelta(days=args.days - 1)
+
+    engine = analytics_engine()
+    if not args.dry_run:
+        try:
+            ensure_rollups(engine, args.lock_wait)
+        except LockBusy as e:
+            sys.exit(f"⛔ Sales rollups not built yet and {e}; not reconciling")
+
+    print(f"🔄 Reconciling ventas_limpias with SICAR from {start} to {end}")
+    for source in load_config()["sicar_sources"]:
+        if args.store and source["store"] not in args.store:
+            continue
+        try:
+            # Repairs write ventas_limpias and the rollups: same lock as the sales sync
+            with stage_lock(engine, SALES, source["store"], args.lock_wait):
+                reconcile_store(source, engine, start, end, args.dry_run)
+        except LockBusy as e:
+            print(f"⏭️ Skipping {source['store']}: {e}")
+            continue
+        except Exception as e:
+            print(f"❗️ Error reconciling {source['store']}: {e}")
+            continue
+
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Daily sales rollups (ventas_diarias, ventas_diarias_caja_usuario), kept current
+by every sales load inside its transaction. The loaders build them from
+ventas_limpias the first time they find them missing (ensure_rollups); to rebuild
+them by hand:
+
+    python -m etl_sales.rollups
+"""
+import sys
+from decimal import Decimal
+import pandas as pd
+from sqlalchemy import bindparam, text
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import DEFAULT_LOCK_WAIT, SALES, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.shadow_tables import run_sql_script, swap_shadow
+from etl_sales.money import MONEY_COLUMNS
+from etl_sales.queries import SQL
+
+# Rollup table -> grouping key. Measures are the ticket count and the money columns.
+ROLLUPS = {
+    "ventas_diarias": ["tienda", "dia"],
+    "ventas_diarias_caja_usuario": ["tienda", "dia", "caja", "usuario"],
+}
+MEASURES = ["tickets"] + MONEY_COLUMNS
+SALE_KEY = ["ven_id", "tienda", "source_system"]
+ID_CHUNK = 5_000
+
+metrics = RunMetrics("rollups")
+
+def rebuild_rollups(engine):
+    """Full rebuild from ventas_limpias into shadow tables, then swap them in"""
+    run_sql_script(engine, SQL.source("rebuild_ventas_diarias_next.sql"))
+    for table in ROLLUPS:
+        swap_shadow(engine, table)
+
+def sales_stores(config):
+    """Every store with rows in ventas_limpias, SICAR and MyBusiness"""
+    return [s["store"] for s in config["sicar_sources"] + config["mybusiness_sources"]]
+
+def missing_rollups(engine):
+    with engine.connect() as conn:
+        return [t for t in ROLLUPS if conn.execute(text("SHOW TABLES LIKE :t"), {"t": t}).fetchone() is None]
+
+def ensure_rollups(engine, lock_wait=DEFAULT_LOCK_WAIT):
+    """
+    Build the rollups once on a database that predates them: sales loads apply
+    their deltas to the live tables and roll back while those are missing. Takes
+    every store's sales lock, so call it before taking any; raises LockBusy.
+    """
+    if not missing_rollups(engine):
+        return
+    with stage_lock(engine, SALES, sales_stores(load_config()), lock_wait):
+        if missing_rollups(engine):  # another run may have built them meanwhile
+            print("🧱 Building the sales rollups from ventas_limpias")
+            rebuild_rollups(engine)
+
+def _stored_sales(conn, batch, table):
+    """Rows currently in `table` for the batch's sale keys, locked until the transaction ends"""
+    query = text(f"""
+        SELECT ven_id, tienda, source_system, fecha_hora, caja, usuario, {", ".join(MONEY_COLUMNS)}
+        FROM {table}
+        WHERE tienda = :tienda AND source_system = :source_system AND ven_id IN :ids
+        FOR UPDATE
+    """).bindparams(bindparam("ids", expanding=True))
+
+    frames = []
+    for (tienda, source_system), group in batch.groupby(["tienda", "source_system"], observed=True):
+        ids = group["ven_id"].astype("int64").tolist()
+        for i in range(0, len(ids), ID_CHUNK):
+            params = {"tienda": tienda, "source_system": source_system, "ids": ids[i:i + ID_CHUNK]}
+            frames.append(pd.read_sql_query(query, conn, params=params))
+
+    stored = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    for col in MONEY_COLUMNS:
+        if col in stored.columns:
+            # DECIMAL(20,2) back to integer cents, like the extracted batch
+            stored[col] = (pd.to_numeric(stored[col]).fillna(0) * 100).round().astype("int64")
+    return stored
+
+def _bucketed(df, keys, sign):
+    out = pd.DataFrame({
+        "tienda": df["tienda"].astype(object),
+        "dia": pd.to_datetime(df["fecha_hora"]).dt.date,
+        "caja": df["caja"].astype(object).fillna("").astype(str),
+        "usuario": df["usuario"].astype(object).fillna("").astype(str),
+        "tickets": sign,
+    })
+    for col in MONEY_COLUMNS:
+        out[col] = df[col].fillna(0).astype("int64") * sign
+    out = out[df["fecha_hora"].notna().to_numpy()]
+    return out[keys + MEASURES]
+
+def rollup_deltas(new, stored, keys):
+    """
+    Net change per rollup bucket from replacing `stored` rows with `new` rows:
+    new sales add, overwritten ones subtract (possibly from a different day/caja).
+    Money stays in cents so the deltas are exact.
+    """
+    parts = [_bucketed(new, keys, 1)]
+    if not stored.empty:
+        parts.append(_bucketed(stored, keys, -1))
+    delta = pd.concat(parts, ignore_index=True).groupby(keys, sort=False)[MEASURES].sum().reset_index()
+    return delta[(delta[MEASURES] != 0).any(axis=1)]
+
+def _apply_deltas(conn, new, stored):
+    for rollup, keys in ROLLUPS.items():
+        delta = rollup_deltas(new, stored, keys)
+        if delta.empty:
+            continue
+        for col in MONEY_COLUMNS:
+            delta[col] = delta[col] / 100
+
+        cols = keys + MEASURES
+        conn.execute(
+            text(f"""
+                INSERT INTO {rollup} ({", ".join(cols)})
+                VALUES ({", ".join(f":{c}" for c in cols)})
+                ON DUPLICATE KEY UPDATE
+                {", ".join(f"{m} = {m} + VALUES({m})" for m in MEASURES)}
+            """),
+            delta.astype(object).to_dict(orient="records")  # plain Python scalars for the driver
+        )
+
+def apply_rollup_deltas(conn, batch, table="ventas_limpias"):
+    """
+    Maintain the rollups for a batch (money in cents) about to be upserted into
+    `table`. Call it inside the load transaction, before the upsert.
+    """
+    new = batch.drop_duplicates(SALE_KEY, keep="last")  # the multi-row upsert keeps the last duplicate
+    _apply_deltas(conn, new, _stored_sales(conn, new, table))
+
+def delete_sales(conn, keys, table="ventas_limpias"):
+    """Delete sales (a frame of SALE_KEY columns) from `table`, subtracting them from the rollups"""
+    stored = _stored_sales(conn, keys, table)
+    if stored.empty:
+        return 0
+    _apply_deltas(conn, stored.iloc[0:0], stored)
+    conn.execute(
+        text(f"DELETE FROM {table} WHERE ven_id = :ven_id AND tienda = :tienda AND source_system = :source_system"),
+        stored[SALE_KEY].astype(object).to_dict(orient="records")
+    )
+    return len(stored)
+
+# DataFrame-free variant for the small batches of sales_sync.load_sales_rows: the same
+# deltas, from sale dicts (money in cents) and one executemany upsert per rollup
+ROLLUP_UPSERTS = {
+    rollup: f"""
+        INSERT INTO {rollup} ({", ".join(keys + MEASURES)})
+        VALUES ({", ".join(["%s"] * len(keys + MEASURES))})
+        ON DUPLICATE KEY UPDATE
+        {", ".join(f"{m} = {m} + VALUES({m})" for m in MEASURES)}
+    """
+    for rollup, keys in ROLLUPS.items()
+}
+
+def _stored_sale_rows(conn, sales, table):
+    """Like _stored_sales, for sale dicts of one (tienda, source_system); returns dicts in cents"""
+    if not sales:
+        return []
+    first = sales[0]
+    ids = [sale["ven_id"] for sale in sales]
+    result = conn.exec_driver_sql(
+        f"""
+            SELECT ven_id, tienda, source_system, fecha_hora, caja, usuario, {", ".join(MONEY_COLUMNS)}
+            FROM {table}
+            WHERE tienda = %s AND source_system = %s AND ven_id IN ({", ".join(["%s"] * len(ids))})
+            FOR UPDATE
+        """,
+        (first["tienda"], first["source_system"], *ids)
+    )
+    stored = [dict(row) for row in result.mappings()]
+    for sale in stored:
+        for col in MONEY_COLUMNS:
+            sale[col] = int((sale[col] or Decimal(0)).scaleb(2))
+    return stored
+
+def _row_buckets(sales, keys, sign, totals):
+    for sale in sales:
+        if sale["fecha_hora"] is None:
+            continue
+        bucket = {
+            "tienda": sale["tienda"],
+            "dia": sale["fecha_hora"].date(),
+            "caja": "" if sale["caja"] is None else str(sale["caja"]),
+            "usuario": "" if sale["usuario"] is None else str(sale["usuario"]),
+        }
+        measures = totals.setdefault(tuple(bucket[k] for k in keys), [0] * len(MEASURES))
+        measures[0] += sign
+        for i, col in enumerate(MONEY_COLUMNS, start=1):
+            measures[i] += (sale[col] or 0) * sign
+
+def apply_rollup_row_deltas(conn, sales, table="ventas_limpias"):
+    """
+    apply_rollup_deltas for a short list of sale dicts (money in cents) of one
+    store and source system, about to be upserted into `table`
+    """
+    new = list({sale["ven_id"]: sale for sale in sales}.values())  # the upsert keeps the last duplicate
+    stored = _stored_sale_rows(conn, new, table)
+    for rollup, keys in ROLLUPS.items():
+        totals = {}
+        _row_buckets(new, keys, 1, totals)
+        _row_buckets(stored, keys, -1, totals)
+        params = [
+            (*key, tickets, *(Decimal(cents).scaleb(-2) for cents in money))
+            for key, (tickets, *money) in totals.items()
+            if tickets or any(money)
+        ]
+        if params:
+            conn.exec_driver_sql(ROLLUP_UPSERTS[rollup], params)
+
+def main(argv=None):
+    """One-off (re)build, e.g. to create the rollups on an existing ventas_limpias"""
+    options = run_options("rollups", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    stores = sales_stores(load_config())
+
+    # Sales loads apply their deltas to the live rollups: keep them off every store
+    # until the rebuilt tables are swapped in, or their deltas would be lost
+    try:
+        with stage_lock(engine, SALES, stores, options.lock_wait), metrics.span("load"):
+            rebuild_rollups(engine)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not rebuilding the rollups")
+    finally:
+        metrics.write()
+
+if __name__ == "__main__":
+    main()
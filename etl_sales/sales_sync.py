@@ -0,0 +1,103 @@
+from decimal import Decimal
+import pandas as pd
+from sqlalchemy import text
+from etl_common.schema import SICAR_SALES, apply_schema, extraction_timestamp
+from etl_sales.db.db_helpers import insert_on_conflict_update
+from etl_sales.money import MONEY_COLUMNS, cents_to_amounts
+from etl_sales.queries import SQL
+from etl_sales.rollups import apply_rollup_deltas, apply_rollup_row_deltas
+
+# Incremental syncs usually fetch a few dozen sales: up to this many go straight from
+# the cursor to one executemany upsert; bigger batches take the DataFrame path
+SMALL_BATCH = 1_000
+
+SALES_COLUMNS = ["ven_id", "tienda", "fecha_hora", "caja", "usuario", *MONEY_COLUMNS,
+                 "source_db", "source_system", "extracted_at"]
+UPSERT_SALES_SQL = f"""
+    INSERT INTO ventas_limpias ({", ".join(SALES_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(SALES_COLUMNS))})
+    ON DUPLICATE KEY UPDATE
+    {", ".join(f"{c} = VALUES({c})" for c in SALES_COLUMNS if c not in ("ven_id", "tienda", "source_system"))}
+"""
+
+def get_last_processed_ven_id(conn, store_name):
+    result = conn.execute(
+        text("SELECT last_processed_ven_id FROM etl_progress WHERE store_name = :store"),
+        {"store": store_name}
+    ).fetchone()
+    return result[0] if result and result[0] is not None else 0
+
+def tag_sicar_sales(df, source):
+    """Add the per-source constant columns and the SICAR_SALES dtypes to an extracted frame"""
+    df["tienda"] = source["store"]
+    df["source_db"] = source["database"]
+    df["source_system"] = "sicar"
+    df["extracted_at"] = extraction_timestamp()
+    return apply_schema(df, SICAR_SALES)
+
+def fetch_latest_sicar_rows(conn, source, last_id):
+    """Sales with ven_id > last_id from a SICAR source as plain dicts (SALES_COLUMNS, money in cents)"""
+    result = conn.execute(SQL.text("extract_latest_sicar_sales.sql"), {"last_id": last_id})
+    tags = {"tienda": source["store"], "source_db": source["database"], "source_system": "sicar",
+            "extracted_at": extraction_timestamp().to_pydatetime()}
+    return [{**row, **tags} for row in result.mappings()]
+
+def sales_frame(rows):
+    """Fetched sale dicts as a frame typed per SICAR_SALES"""
+    df = pd.DataFrame.from_records(rows, columns=SALES_COLUMNS, coerce_float=True)
+    df[MONEY_COLUMNS] = df[MONEY_COLUMNS].fillna(0)  # NULL amounts are 0, as in upsert_sales_rows
+    return apply_schema(df, SICAR_SALES)
+
+def upsert_sales(conn, df):
+    """Upsert a batch (money in cents) into ventas_limpias, keeping the daily rollups in step"""
+    apply_rollup_deltas(conn, df)
+    cents_to_amounts(df).to_sql(
+        "ventas_limpias",
+        con=conn,
+        if_exists="append",
+        index=False,
+        method=insert_on_conflict_update
+    )
+
+def upsert_sales_rows(conn, rows):
+    """upsert_sales for a short list of sale dicts of one store: one prepared executemany"""
+    apply_rollup_row_deltas(conn, rows)
+    # A NULL amount is 0, as in the extraction SQL, sales_frame and the rollup deltas
+    conn.exec_driver_sql(UPSERT_SALES_SQL, [
+        tuple(Decimal(row[c] or 0).scaleb(-2) if c in MONEY_COLUMNS else row[c] for c in SALES_COLUMNS)
+        for row in rows
+    ])
+
+def set_last_processed_ven_id(conn, store_name, last_id):
+    conn.execute(
+        text("""
+            UPDATE etl_progress
+            SET last_processed_ven_id = :last_id
+            WHERE store_name = :store
+        """),
+        {"store": store_name, "last_id": last_id}
+    )
+
+def load_sales_batch(conn, df, store_name):
+    """
+    Upsert a batch and advance last_processed_ven_id in the same transaction
+    (conn should come from engine.begin()). Returns the new id.
+    """
+    upsert_sales(conn, df)
+
+    max_ven_id = int(df["ven_id"].max())
+    set_last_processed_ven_id(conn, store_name, max_ven_id)
+    return max_ven_id
+
+def load_sales_rows(conn, rows, store_name):
+    """
+    load_sales_batch for the sale dicts of fetch_latest_sicar_rows: small batches
+    skip pandas entirely, large ones go through the DataFrame path. Returns the new id.
+    """
+    if len(rows) > SMALL_BATCH:
+        return load_sales_batch(conn, sales_frame(rows), store_name)
+
+    upsert_sales_rows(conn, rows)
+    max_ven_id = max(row["ven_id"] for row in rows)
+    set_last_processed_ven_id(conn, store_name, max_ven_id)
+    return max_ven_id
@@ -1,91 +1,149 @@
-import json
-import pandas as pd
-from extract import extract_legacy, extract_sicar
-from transform import clean_and_standardize_legacy
-from db.db_helpers import reset_ventas_limpias, insert_on_conflict_update, get_max_id_sicar
-from sqlalchemy import create_engine, text
-import os
-
-CONFIG = json.load(open("../config.json"))
-
-# Create connection to the cleaned data database (osmart_data)
-db_config = CONFIG["analytics_db"]
-engine = create_engine(
-    f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
-reset_ventas_limpias(engine)
-
-# Reset CSV file for payment issues
-payment_issues_file = "data/payment_issues.csv"
-if os.path.exists(payment_issues_file):
-    os.remove(payment_issues_file)
-
-qa_header_needed = True
-dropped_header_needed = True
-
-for source in CONFIG["mybusiness_sources"]:
+import sys
+from pathlib import Path
+from sqlalchemy import text
+from etl_common.metrics import RunMetrics
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import SALES, LockBusy, stage_lock
+from etl_common.retry import settle_windows
+from etl_common.shadow_tables import LoadTally, shadow_name, swap_shadow, verify_shadow
+from etl_sales.extract import extract_legacy, extract_sicar
+from etl_sales.transform import clean_and_standardize_legacy, clean_and_standardize_sicar
+from etl_sales.qa_sink import QASink
+from etl_sales.money import cents_to_amounts
+from etl_sales.rollups import rebuild_rollups
+from etl_sales.db.db_helpers import reset_ventas_limpias, insert_on_conflict_update, get_max_id_sicar
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+PAYMENT_ISSUES_DIR = PACKAGE_DIR / "data/payment_issues"
+
+# Rebuild into ventas_limpias__next; the live table keeps serving until the swap
+VENTAS_NEXT = shadow_name("ventas_limpias")
+
+SICAR_BATCH_DATES = [
+    ("2024-10-27", "2024-10-31"),
+    ("2024-11-01", "2024-11-30"),
+    ("2024-12-01", "2024-12-31"),
+    ("2025-01-01", "2025-01-31"),
+    ("2025-02-01", "2025-02-28"),
+    ("2025-03-01", "2025-03-31"),
+    ("2025-04-01", "2025-04-30"),
+    ("2025-05-01", "2025-05-31"),
+    ("2025-06-01", "2025-06-30"),
+    ("2025-07-01", "2025-07-31"),
+    ("2025-08-01", "2025-08-31"),
+]
+
+metrics = RunMetrics("seed_historical")
+
+def seed_mybusiness_store(source, engine, tally, qa_sink):
     print(f"🚀 Extracting historical data for {source['name']}")
 
-    for df in extract_legacy(source):
-        df_dict = clean_and_standardize_legacy(df, source["store"])
-
-        df_dict["clean"].to_sql(
-            "ventas_limpias", 
-            con=engine, 
-            if_exists="append", 
-            index=False, 
-            method=insert_on_conflict_update
-        )
-        
-        # Append QA data to CSV
-        if not df_dict["qa"].empty:
-            df_dict["qa"].to_csv(
-                "data/payment_issues.csv", 
-                index=False, 
-                mode='a',
-                header=qa_header_needed
+    store = source["store"]
+    for df in metrics.timed(extract_legacy(source), "extract", store):
+        metrics.add_frame(df, "extract", store)
+        with metrics.span("transform", store):
+            df_dict = clean_and_standardize_legacy(df, store)
+            clean = cents_to_amounts(df_dict["clean"])
+
+        with metrics.span("load", store):
+            clean.to_sql(
+                VENTAS_NEXT,
+                con=engine,
+                if_exists="append",
+                index=False,
+                method=insert_on_conflict_update
             )
-            qa_header_needed = False
+        metrics.add_frame(clean, "load", store)
+        tally.add(clean)
 
-    print(f"✅ Clean data written to ventas_limpias for {source['name']}")
+        qa_sink.add(df_dict["qa"], partition=f"mybusiness_{source['name']}")
 
-for source in CONFIG["sicar_sources"]:
+    qa_sink.flush(f"mybusiness_{source['name']}")
+    print(f"✅ Clean data written to {VENTAS_NEXT} for {source['name']}")
+
+def seed_sicar_store(source, engine, tally, qa_sink):
     print(f"🚀 Extracting historical data for {source['name']}")
-    batch_dates = [
-        ("2024-10-27", "2024-10-31"),
-        ("2024-11-01", "2024-11-30"),
-        ("2024-12-01", "2024-12-31"),
-        ("2025-01-01", "2025-01-31"),
-        ("2025-02-01", "2025-02-28"),
-        ("2025-03-01", "2025-03-31"),
-        ("2025-04-01", "2025-04-30"),
-        ("2025-05-01", "2025-05-31"),
-        ("2025-06-01", "2025-06-30"),
-        ("2025-07-01", "2025-07-31"),
-        ("2025-08-01", "2025-08-31"),
-    ]
-        
-    for df in extract_sicar(source, batch_dates):
-        # clean_and_standardize_sicar(df, source["store"]) needed here?
-
-        df.to_sql(
-            "ventas_limpias", 
-            con=engine, 
-            if_exists="append", 
-            index=False
-        )
-        
-    # actualizar tabla de etl_progress
-    max_ven_id = get_max_id_sicar(engine, source['name'])
-
-    with engine.begin() as conn:
-        conn.execute(
-            text("""
-                UPDATE etl_progress
-                SET last_processed_ven_id = :last_id
-                WHERE store_name = :store
-            """),
-            {"store": source['name'], "last_id": max_ven_id}
-        )
-    
-    print(f"✅ Clean data written to ventas_limpias for {source['name']}")
\ No newline at end of file
+    batch_dates = SICAR_BATCH_DATES
+
+    store = source["store"]
+    failed = []
+    for df in metrics.timed(extract_sicar(source, batch_dates, failed), "extract", store):
+        metrics.add_frame(df, "extract", store)
+        with metrics.span("transform", store):
+            df_dict = clean_and_standardize_sicar(df, store)
+            qa_sink.add(df_dict["qa"], partition=f"sicar_{source['name']}")
+            df = cents_to_amounts(df_dict["clean"])
+
+        with metrics.span("load", store):
+            df.to_sql(
+                VENTAS_NEXT,
+                con=engine,
+                if_exists="append",
+                index=False
+            )
+        metrics.add_frame(df, "load", store)
+        tally.add(df)
+
+    qa_sink.flush(f"sicar_{source['name']}")
+    # Months that still failed are replayed into ventas_limpias by update_clean_data after the swap
+    settle_windows(engine, SALES, store, batch_dates, failed)
+    print(f"✅ Clean data written to {VENTAS_NEXT} for {source['name']}")
+
+def reset_checkpoints(engine, sources):
+    """actualizar tabla de etl_progress"""
+    for source in sources:
+        with metrics.span("checkpoint", source["store"]):
+            max_ven_id = get_max_id_sicar(engine, source['name'])
+
+            with engine.begin() as conn:
+                conn.execute(
+                    text("""
+                        UPDATE etl_progress
+                        SET last_processed_ven_id = :last_id
+                        WHERE store_name = :store
+                    """),
+                    {"store": source['name'], "last_id": max_ven_id}
+                )
+
+def seed(engine, config):
+    reset_ventas_limpias(engine, table=VENTAS_NEXT)
+    tally = LoadTally(checksum_col="total_venta", key_cols=["ven_id", "tienda", "source_system"])
+
+    # Payment issues: one Parquet file per source for this run
+    qa_sink = QASink(PAYMENT_ISSUES_DIR)
+
+    for source in config["mybusiness_sources"]:
+        seed_mybusiness_store(source, engine, tally, qa_sink)
+
+    for source in config["sicar_sources"]:
+        seed_sicar_store(source, engine, tally, qa_sink)
+
+    # Verify and swap in the rebuilt table
+    with metrics.span("verify"):
+        verify_shadow(engine, "ventas_limpias", tally, tolerance=0.001)
+    with metrics.span("load"):
+        swap_shadow(engine, "ventas_limpias")
+        # Daily rollups from the new table; loaders keep them current from here on
+        rebuild_rollups(engine)
+
+    reset_checkpoints(engine, config["sicar_sources"])
+
+def main(argv=None):
+    options = run_options("seed_historical", argv)
+    metrics.profiler = options.profiler
+    engine = analytics_engine()
+    config = load_config()
+    stores = [s["store"] for s in config["sicar_sources"] + config["mybusiness_sources"]]
+
+    # Seeds rewrite the whole table: keep the incremental updaters off every store meanwhile
+    try:
+        with stage_lock(engine, SALES, stores, options.lock_wait):
+            seed(engine, config)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not seeding")
+    finally:
+        metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,57 @@
+import numpy as np
 import pandas as pd
     
-def tag_issue(row):
-    if row["no_flujo"]:
-        return "no payment recorded"
-    if row["efectivo"] > 0 and row["tarjeta"] == 0 and row["pagado"] > row["total"]:
-        return "overpaid cash"
-    elif row["tarjeta"] > 0 and row["efectivo"] == 0 and row["pagado"] > row["total"]:
-        return "overpaid card"
-    elif row["pagado"] == 0:
-        return "no payment recorded"
-    elif row["egresos"] > row["efectivo"] + row["tarjeta"] + row["otros"]:
-        return "refund_too_big"
-    else:
-        return "unknown mismatch"
+# Issue labels for QA rows, in precedence order: the first matching rule wins
+ISSUE_RULES = [
+    ("no payment recorded", lambda d: d["no_flujo"]),
+    ("overpaid cash", lambda d: (d["efectivo"] > 0) & (d["tarjeta"] == 0) & (d["pagado"] > d["total"])),
+    ("overpaid card", lambda d: (d["tarjeta"] > 0) & (d["efectivo"] == 0) & (d["pagado"] > d["total"])),
+    ("no payment recorded", lambda d: d["pagado"] == 0),
+    ("refund_too_big", lambda d: d["egresos"] > d["efectivo"] + d["tarjeta"] + d["otros"]),
+]
+DEFAULT_ISSUE = "unknown mismatch"
+
+def tag_issues(qa_df):
+    """Vectorized issue tagging over the whole QA frame using ISSUE_RULES"""
+    conditions = [rule(qa_df).to_numpy(dtype=bool) for _, rule in ISSUE_RULES]
+    labels = [label for label, _ in ISSUE_RULES]
+    return pd.Series(np.select(conditions, labels, default=DEFAULT_ISSUE), index=qa_df.index)
+
+def _qa_flags(df):
+    """Payment QA flags on int64 cents; returns the rows that need review"""
+    df["pagado"] = df["efectivo"] + df["tarjeta"] + df["otros"]
+    df["pago_completo"] = df["pagado"] == df["total"]
+    df["pago_excedente"] = df["pagado"] > df["total"]
+    df["pago_incompleto"] = df["pagado"] < df["total"]
+
+    # Build QA dataframe with mismatches + no_flujo
+    qa_df = df[~df["pago_completo"] | df["pago_excedente"] | df["pago_incompleto"] | df["no_flujo"]].copy()
+    
+    if not qa_df.empty:
+        qa_df["issue_type"] = tag_issues(qa_df)
+    return qa_df
 
 def clean_and_standardize_legacy(df, store):
+    # All amounts are int64 cents (see db/extract_legacy_sales.sql), so QA comparisons are exact
     # Flag rows where no flujo is present
     df["no_flujo"] = (df["efectivo_in"] + df["tarjeta_in"] + df["otros_in"] == 0)
     
     # Base calculation of efectivo, tarjeta, otros
-    df["efectivo"] = df[["efectivo_in", "total"]].min(axis=1)
-    df["resto"] = df["total"] - df["efectivo"] # Remaining amount after efectivo
-    df["tarjeta"] = df[["tarjeta_in", "resto"]].min(axis=1)
+    df["efectivo"] = np.minimum(df["efectivo_in"], df["total"])
+    resto = df["total"] - df["efectivo"] # Remaining amount after efectivo
+    df["tarjeta"] = np.minimum(df["tarjeta_in"], resto)
     df["otros"] = df["total"] - df["efectivo"] - df["tarjeta"] # Remaining after efectivo + tarjeta
     
     # Override for no flujo → assume all cash
-    df.loc[df["no_flujo"], "efectivo"] = df.loc[df["no_flujo"], "total"]
-    df.loc[df["no_flujo"], "tarjeta"] = 0
-    df.loc[df["no_flujo"], "otros"] = 0
+    df["efectivo"] = df["efectivo"].where(~df["no_flujo"], df["total"])
+    df["tarjeta"] = df["tarjeta"].where(~df["no_flujo"], 0)
+    df["otros"] = df["otros"].where(~df["no_flujo"], 0)
     
-    # Clip otros at 0 to avoid negatives due to rounding
+    # Clip otros at 0 to avoid negatives
     df["otros"] = df["otros"].clip(lower=0)
-    df.drop(columns=["resto"], inplace=True)
-    
-    # QA columns
-    df["pagado"] = df["efectivo"] + df["tarjeta"] + df["otros"]
-    df["pago_completo"] = df["pagado"].round(2) == df["total"].round(2)
-    df["pago_excedente"] = df["pagado"].round(2) > df["total"].round(2)
-    df["pago_incompleto"] = df["pagado"].round(2) < df["total"].round(2)
-
-    # Build QA dataframe with mismatches + no_flujo
-    qa_df = df[~df["pago_completo"] | df["pago_excedente"] | df["pago_incompleto"] | df["no_flujo"]].copy()
     
-    if not qa_df.empty:
-        qa_df["issue_type"] = qa_df.apply(tag_issue, axis=1)
+    # QA columns + QA dataframe
+    qa_df = _qa_flags(df)
     
     # Combine fecha and usuhora to create datetime column
     df["fecha_hora"] = pd.to_datetime(
@@ -56,12 +64,23 @@ def clean_and_standardize_legacy(df, store):
     df.rename(columns={"venta": "ven_id", "total": "total_venta"}, inplace=True)
     
      # Adjust otros to include cobranza_aplicada (unless no_flujo → force to 0)
-    df["otros"] = df["otros_in"] + df["cobranza_aplicada"]
-    df.loc[df["no_flujo"], "otros"] = 0
+    df["otros"] = (df["otros_in"] + df["cobranza_aplicada"]).where(~df["no_flujo"], 0)
 
     cleaned_df = df[["ven_id", "tienda", "fecha_hora", "caja", "usuario", "efectivo", "tarjeta", "otros", "total_venta", "source_db", "source_system", "extracted_at"]]
 
     return {
         "clean": cleaned_df,
         "qa": qa_df
-    }
\ No newline at end of file
+    }
+
+def clean_and_standardize_sicar(df, store):
+    """Same payment QA pass for SICAR rows; the clean frame is already in target schema"""
+    qa_input = df.rename(columns={"total_venta": "total"})
+    qa_input["no_flujo"] = qa_input["efectivo"] + qa_input["tarjeta"] + qa_input["otros"] == 0
+    qa_input["egresos"] = 0  # the SICAR sales query carries no payment outflows
+    qa_df = _qa_flags(qa_input)
+
+    return {
+        "clean": df,
+        "qa": qa_df
+    }
@@ -1,115 +1,209 @@
-import json
-from pathlib import Path
-import pandas as pd
+import argparse
 import logging
-from sqlalchemy import create_engine, text
-from db.db_helpers import insert_on_conflict_update
-
-# Setup logging to file + console
-log_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-
-# File handler
-SCRITP_DIR = Path(__file__).resolve().parent
-LOG_PATH = SCRITP_DIR / "logs/update_clean_data.log"
-file_handler = logging.FileHandler(LOG_PATH)
-file_handler.setFormatter(log_formatter)
-file_handler.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-console_handler.setLevel(logging.INFO)
-
-# Root logger config
-logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
-PROJECT_ROOT = Path(__file__).resolve().parent.parent   # osmart-etl/
-CONFIG_PATH  = PROJECT_ROOT / "config.json"
-CONFIG = json.load(open(CONFIG_PATH))
-
-# Create connection to the cleaned data database (osmart_data)
-db_config = CONFIG["analytics_db"]
-analytics_engine = create_engine(
-    f"mysql+pymysql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
-
-# For each SICAR source (store)
-for source in CONFIG["sicar_sources"]:
+from contextlib import ExitStack
+from pathlib import Path
+from etl_common.metrics import RunMetrics
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config, source_engine
+from etl_common.locks import DEFAULT_LOCK_WAIT, SALES, LockBusy, stage_lock
+from etl_common.schema import memory_report
+from etl_common.retry import pending_windows, settle_windows, with_retries
+from etl_common.async_extract import DEFAULT_PER_STORE, DEFAULT_TIMEOUT, add_async_args, fetch_frames
+from etl_sales.queries import SQL
+from etl_sales.rollups import ensure_rollups
+from etl_sales.sales_sync import (fetch_latest_sicar_rows, get_last_processed_ven_id,
+                                  load_sales_batch, load_sales_rows, tag_sicar_sales, upsert_sales)
+
+LOG_PATH = Path(__file__).resolve().parent / "logs/update_clean_data.log"
+
+metrics = RunMetrics("update_clean_data")
+
+def setup_logging():
+    """Log to logs/update_clean_data.log and the console (done by main, not at import)"""
+    log_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+
+    # File handler
+    LOG_PATH.parent.mkdir(exist_ok=True)
+    file_handler = logging.FileHandler(LOG_PATH)
+    file_handler.setFormatter(log_formatter)
+    file_handler.setLevel(logging.INFO)
+
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(log_formatter)
+    console_handler.setLevel(logging.INFO)
+
+    # Root logger config
+    logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
+
+def replay_failed_windows(source):
+    """Re-extract and upsert the date windows a seed could not extract (etl_failed_windows)"""
     store_name = source["store"]
-    logging.info(f"\n--- Processing store: {store_name} ---")
+    windows = pending_windows(analytics_engine(), SALES, store_name)
+    if not windows:
+        return
+    logging.info(f"🔁 Replaying {len(windows)} failed sales windows")
+    from etl_sales.extract import extract_sicar
 
-    # Get last processed ven_id
+    failed = []
+    for df in metrics.timed(extract_sicar(source, windows, failed), "extract", store_name):
+        metrics.add_frame(df, "extract", store_name)
+        with metrics.span("load", store_name), analytics_engine().begin() as conn:
+            upsert_sales(conn, df)
+        metrics.add_frame(df, "load", store_name)
+    settle_windows(analytics_engine(), SALES, store_name, windows, failed)
+
+def read_checkpoint(store_name):
+    """last_processed_ven_id for a store, or None if it could not be read"""
     try:
-        with analytics_engine.connect() as conn:
-            result = conn.execute(
-                text("SELECT last_processed_ven_id FROM etl_progress WHERE store_name = :store"),
-                {"store": store_name}
-            ).fetchone()
-            last_processed_id = result[0] if result else 0
+        with metrics.span("checkpoint", store_name), analytics_engine().connect() as conn:
+            last_processed_id = get_last_processed_ven_id(conn, store_name)
             logging.info(f"Last processed ven_id: {last_processed_id}")
+            return last_processed_id
     except Exception as e:
         logging.error(f"❗️ Error extracting from analytics_db: {e}")
-        continue
+        return None
+
+def load_new_sales(store_name, df):
+    """Upsert an extracted batch into ventas_limpias and advance etl_progress"""
+    if df.empty:
+        logging.info(f"No new sales found for {store_name}.")
+        return
+
+    logging.info(f"Found {len(df)} new sales for {store_name}.")
+    metrics.add_frame(df, "extract", store_name)
+    logging.info(f"Batch memory: {memory_report(df)}")
+    
+    # Load into ventas_limpias and update etl_progress
+    try:
+        with metrics.span("load", store_name), analytics_engine().begin() as conn:
+            max_ven_id = load_sales_batch(conn, df, store_name)
+        metrics.add_frame(df, "load", store_name)
+        logging.info(f"Finished {store_name}. Last ven_id now {max_ven_id}.")
+    
+    except Exception as e:
+        logging.error(f"❗️ Error inserting data for {store_name}: {e}")
+
+def load_new_rows(store_name, rows):
+    """load_new_sales for the sale dicts of fetch_latest_sicar_rows (no DataFrame for small batches)"""
+    if not rows:
+        logging.info(f"No new sales found for {store_name}.")
+        return
+
+    logging.info(f"Found {len(rows)} new sales for {store_name}.")
+    metrics.add("rows", len(rows), "extract", store_name)
+
+    try:
+        with metrics.span("load", store_name), analytics_engine().begin() as conn:
+            max_ven_id = load_sales_rows(conn, rows, store_name)
+        metrics.add("rows", len(rows), "load", store_name)
+        logging.info(f"Finished {store_name}. Last ven_id now {max_ven_id}.")
+
+    except Exception as e:
+        logging.error(f"❗️ Error inserting data for {store_name}: {e}")
+
+def sync_store(source):
+    """Upsert one store's sales beyond its last_processed_ven_id and advance it"""
+    store_name = source["store"]
+
+    # Get last processed ven_id
+    last_processed_id = read_checkpoint(store_name)
+    if last_processed_id is None:
+        return
     
     # Extract sales data where ven_id > last_processed_id
     try:
-        # Create source DB connection
-        source_engine = create_engine(
-            f"mysql+pymysql://{source['user']}:{source['password']}@{source['host']}:{source['port']}/{source['database']}"
-        )
-        
+        def fetch():
+            with source_engine(source).connect() as conn:
+                return fetch_latest_sicar_rows(conn, source, last_processed_id)
+
         # Extract new sales
-        with source_engine.connect() as conn:
-            with open(SCRITP_DIR / "db/extract_latest_sicar_sales.sql", "r") as f:
-                    query =  text(f.read())
-            
+        with metrics.span("extract", store_name):
             logging.info(f"🔄 Extracting SICAR sales for {source['store']}")
-            df = pd.read_sql_query(
-                query,
-                conn,
-                params={"last_id": last_processed_id}
-            )
-
-            if df.empty:
-                logging.info("No new sales found.")
-                continue
-
-            logging.info(f"Found {len(df)} new sales.")
+            rows = with_retries(fetch, f"SICAR sales for {store_name}")
     
     except Exception as e:
         logging.error(f"❗️ Error extracting for {source['store']}: {e}")
-        continue
+        return
     
-    # Transform data
-    df["tienda"] = source["store"]
-    df["source_db"] = source["database"]
-    df["source_system"] = "sicar"
-    df["extracted_at"] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Load into ventas_limpias and update etl_progress
+    load_new_rows(store_name, rows)
+
+def sync_stores_concurrently(sources, lock_wait=DEFAULT_LOCK_WAIT, per_store=DEFAULT_PER_STORE, timeout=DEFAULT_TIMEOUT):
+    """
+    sync_store for every store, with all the latest-sales queries in flight at
+    once; extraction then takes as long as the slowest store.
+    """
+    with ExitStack() as locks:
+        checkpoints = []
+        for source in sources:
+            store_name = source["store"]
+            try:
+                locks.enter_context(stage_lock(analytics_engine(), SALES, store_name, lock_wait))
+            except LockBusy as e:
+                logging.warning(f"⏭️ Skipping {store_name}: {e}")
+                continue
+            try:
+                replay_failed_windows(source)
+            except Exception as e:
+                logging.error(f"❗️ Error replaying failed windows for {store_name}: {e}")
+            last_processed_id = read_checkpoint(store_name)
+            if last_processed_id is not None:
+                checkpoints.append((source, last_processed_id))
+
+        logging.info(f"🔄 Extracting SICAR sales for {len(checkpoints)} stores concurrently")
+        latest_sql = SQL.source("extract_latest_sicar_sales.sql")
+        requests = [(source, latest_sql, {"last_id": last_id}) for source, last_id in checkpoints]
+        with metrics.span("extract"):
+            results = fetch_frames(requests, per_store=per_store, timeout=timeout)
+
+        for (source, _), result in zip(checkpoints, results):
+            if isinstance(result, Exception):
+                logging.error(f"❗️ Error extracting for {source['store']}: {result}")
+                continue
+            load_new_sales(source["store"], tag_sicar_sales(result, source))
+
+def sync_stores(sources, lock_wait=DEFAULT_LOCK_WAIT):
+    """sync_store for one store after another, each under its lock"""
+    for source in sources:
+        store_name = source["store"]
+        logging.info(f"\n--- Processing store: {store_name} ---")
+
+        # One writer per store: the daemon or another cron run may be syncing it
+        try:
+            with stage_lock(analytics_engine(), SALES, store_name, lock_wait):
+                try:
+                    replay_failed_windows(source)
+                except Exception as e:
+                    logging.error(f"❗️ Error replaying failed windows for {store_name}: {e}")
+                sync_store(source)
+        except LockBusy as e:
+            logging.warning(f"⏭️ Skipping {store_name}: {e}")
+            continue
+        except Exception as e:
+            logging.error(f"❗️ Error processing {store_name}: {e}")
+            continue
+
+def main(argv=None):
+    setup_logging()
+    options = run_options("update_clean_data", argv, add_async_args(argparse.ArgumentParser()))
+    metrics.profiler = options.profiler
+
     try:
-        with analytics_engine.begin() as conn:
-            df.to_sql(
-                "ventas_limpias", 
-                con=conn, 
-                if_exists="append", 
-                index=False,
-                method=insert_on_conflict_update
-            )
-
-            max_ven_id = df["ven_id"].max()
-            conn.execute(
-                text("""
-                    UPDATE etl_progress
-                    SET last_processed_ven_id = :last_id
-                    WHERE store_name = :store
-                """),
-                {"store": store_name, "last_id": max_ven_id}
-            )
-            
-            logging.info(f"Finished {store_name}. Last ven_id now {max_ven_id}.")
-    
-    except Exception as e:
-        logging.error(f"❗️ Error inserting data for {store_name}: {e}")
-        continue
-    
-logging.info("\nAll stores processed.")
\ No newline at end of file
+        ensure_rollups(analytics_engine(), options.lock_wait)
+    except LockBusy as e:
+        logging.info(f"⏭️ Sales rollups not built yet and {e}; not syncing")
+        metrics.write()
+        return
+
+    # For each SICAR source (store)
+    sources = load_config()["sicar_sources"]
+    if options.async_per_store:
+        sync_stores_concurrently(sources, options.lock_wait, options.async_per_store, options.query_timeout)
+    else:
+        sync_stores(sources, options.lock_wait)
+
+    metrics.write()
+    logging.info("\nAll stores processed.")
+
+if __name__ == "__main__":
+    main()
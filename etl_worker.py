@@ -0,0 +1,164 @@
+"""
+Scale the per-store work out over several processes or machines through the
+etl_jobs queue table in the analytics DB.
+
+    python -m etl_worker publish                          # every store: sales + inventory chain
+    python -m etl_worker publish --stage sales --store centro
+    python -m etl_worker work                             # run jobs until stopped
+    python -m etl_worker work --stage stock_points --drain
+    python -m etl_worker status
+
+A job is one (stage, store): the SICAR sales sync, raw stock movements, stock
+points or stock as-of for one store. Workers claim jobs with a lease they keep
+renewing and run the same per-store functions as the cron scripts, under the
+same advisory locks. Finishing raw stock movements enqueues the store's stock
+points, and those its stock as-of. A job whose worker dies is claimed again
+once its lease expires; errors are retried up to --max-attempts.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from etl_common.config import analytics_engine, load_config
+from etl_common.jobs import (DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, claim, complete, create_jobs_table,
+                             fail, leased, publish, queue_summary, release, worker_id)
+from etl_common.locks import RAW_STOCK_MOVEMENTS, SALES, STOCK_ASOF, STOCK_POINTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_inventory import update_raw_stock_movements, update_stock_points, update_stock_asof
+from etl_inventory.stock_flows import create_flows_table
+from etl_sales.sales_poller import SalesPoller
+
+INVENTORY_MODULES = {
+    RAW_STOCK_MOVEMENTS: update_raw_stock_movements,
+    STOCK_POINTS: update_stock_points,
+    STOCK_ASOF: update_stock_asof,
+}
+STAGES = [SALES, *INVENTORY_MODULES]
+# Published by `publish`; the rest are enqueued when the previous stage finishes
+ENTRY_STAGES = [SALES, RAW_STOCK_MOVEMENTS]
+NEXT_STAGE = {RAW_STOCK_MOVEMENTS: STOCK_POINTS, STOCK_POINTS: STOCK_ASOF}
+
+class Worker:
+    """Claims jobs one at a time and runs the matching per-store function"""
+    def __init__(self, engine, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.engine = engine
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.owner = worker_id()
+        sources = load_config()["sicar_sources"]
+        self.sources = {s["store"]: s for s in sources}
+        self.poller = SalesPoller(engine, sources)
+        # run_stage calls the per-store functions, which expect the tables the modules' main() creates
+        with engine.begin() as conn:
+            create_flows_table(conn)
+            update_stock_asof.create_asof_table(conn)
+
+    def run_stage(self, stage, source, metrics):
+        if stage == SALES:
+            # Another worker may have moved the checkpoint since we last saw this store
+            self.poller.forget(source["store"])
+            return self.poller.poll(source, metrics)
+        module = INVENTORY_MODULES[stage]
+        module.metrics = metrics
+        return module.update_store(source)
+
+    def run_job(self, job):
+        stage, store = job["stage"], job["store"]
+        source = self.sources.get(store)
+        if source is None or stage not in STAGES:
+            fail(self.engine, job, self.owner, f"unknown stage/store {stage}/{store}", retry_delay=0)
+            return
+
+        logging.info(f"▶️ job {job['id']}: {stage} for {store} (attempt {job['attempts']}/{job['max_attempts']})")
+        metrics = RunMetrics(f"worker_{stage}_{store}")
+        t0 = time.perf_counter()
+        try:
+            with leased(self.engine, job, self.owner, self.lease), \
+                 stage_lock(self.engine, stage, store, wait=0):
+                rows = self.run_stage(stage, source, metrics)
+        except LockBusy as e:
+            logging.info(f"⏭️ job {job['id']}: {e}, handing it back")
+            release(self.engine, job, self.owner)
+            return
+        except Exception as e:
+            logging.error(f"❗️ job {job['id']}: {stage} for {store} failed: {e}")
+            fail(self.engine, job, self.owner, e)
+            return
+        finally:
+            metrics.write()
+
+        result = {"rows": rows if isinstance(rows, int) else None,
+                  "seconds": round(time.perf_counter() - t0, 3), "worker": self.owner}
+        if not complete(self.engine, job, self.owner, result):
+            logging.warning(f"⚠️ job {job['id']}: lease lost before completion; it will run again")
+            return
+        if stage in NEXT_STAGE:
+            with self.engine.begin() as conn:
+                publish(conn, NEXT_STAGE[stage], store, self.max_attempts)
+        logging.info(f"✅ job {job['id']}: {stage} for {store} done in {result['seconds']}s")
+
+    def work(self, stages, poll_interval, drain, stop):
+        while not stop.is_set():
+            job = claim(self.engine, self.owner, stages, self.lease)
+            if job is None:
+                if drain:
+                    return
+                stop.wait(poll_interval)
+                continue
+            self.run_job(job)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pub = commands.add_parser("publish", help="enqueue per-store jobs")
+    pub.add_argument("--stage", nargs="*", choices=STAGES, help=f"default: {', '.join(ENTRY_STAGES)}")
+    pub.add_argument("--store", nargs="*", help="default: every SICAR store")
+    pub.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    work = commands.add_parser("work", help="claim and run jobs")
+    work.add_argument("--stage", nargs="*", choices=STAGES, help="only claim these stages")
+    work.add_argument("--lease", type=int, default=DEFAULT_LEASE, help="seconds a claim lasts without renewal")
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="for the follow-up jobs it enqueues")
+    work.add_argument("--poll-interval", type=float, default=10, help="seconds to wait when the queue is empty")
+    work.add_argument("--drain", action="store_true", help="exit once no job is runnable")
+
+    commands.add_parser("status", help="job counts per stage and status")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    engine = analytics_engine()
+    create_jobs_table(engine)
+
+    if args.command == "publish":
+        stores = args.store or [s["store"] for s in load_config()["sicar_sources"]]
+        with engine.begin() as conn:
+            for stage in args.stage or ENTRY_STAGES:
+                for store in stores:
+                    if publish(conn, stage, store, args.max_attempts):
+                        logging.info(f"📬 queued {stage} for {store}")
+                    else:
+                        logging.info(f"⏭️ {stage} for {store} already queued")
+        return
+
+    if args.command == "status":
+        with engine.connect() as conn:
+            for row in queue_summary(conn):
+                print(f"{row['stage']:<22} {row['status']:<8} {row['jobs']:>6}")
+        return
+
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        logging.info("🛑 Stop requested, finishing current job...")
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    worker = Worker(engine, args.lease, args.max_attempts)
+    logging.info(f"🚀 Worker {worker.owner} claiming {', '.join(args.stage or STAGES)}")
+    worker.work(args.stage, args.poll_interval, args.drain, stop)
+    logging.info("👋 Worker stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Backfill one new SICAR store without touching the others.
+
+    python -m onboard_store centro --start 2024-10-26
+    python -m onboard_store centro --start 2025-09-01 --end 2025-10-31 --window-days 7 --parallel 4
+
+The store must already be in config.json's sicar_sources. Its sales and raw stock
+movements for [start, end] (end defaults to yesterday) are extracted in windows
+of --window-days, --parallel at a time (SQLAlchemy asyncio + aiomysql), and
+upserted into ventas_limpias (with the daily rollups) and raw_stock_movements
+(with the daily flows) --parallel windows at a time, so memory stays bounded
+however long the backfill. The store's stock points are replayed from zero stock
+on `start`, so it should be the store's go-live. Finally its three etl_progress
+checkpoints are set in one transaction, so the incremental updaters pick the
+store up from there.
+
+Everything is an upsert scoped to the store, under its sales, raw movements and
+stock points locks; re-running is safe. Windows that keep failing are queued in
+etl_failed_windows, and the checkpoints are held at the first failed day.
+"""
+import argparse
+import sys
+from contextlib import ExitStack
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import text
+from etl_common.async_extract import DEFAULT_TIMEOUT, fetch_frames
+from etl_common.cli import run_options
+from etl_common.config import analytics_engine, load_config
+from etl_common.locks import RAW_STOCK_MOVEMENTS, SALES, STOCK_POINTS, LockBusy, stage_lock
+from etl_common.metrics import RunMetrics
+from etl_common.retry import settle_windows
+from etl_common.schema import FILTERED_MOVEMENTS, apply_schema
+from etl_inventory.dq_engine import excluded_raw_ids, screen_movements
+from etl_inventory.extract import tag_stock_movements
+from etl_inventory.queries import SQL as INVENTORY_SQL
+from etl_inventory.raw_stock_movements_helpers import has_natural_key, upsert_raw_stock_movements
+from etl_inventory.stock_flows import create_flows_table
+from etl_inventory.stock_points_helpers import (
+    compute_sod_matrix, prepare_movements, replay_daily_deltas, sod_to_points,
+    verify_stock_accuracy, write_stock_points
+)
+from etl_inventory.stock_points_sql import derive_stock_points, stock_points_engine
+from etl_inventory.update_stock_points import get_existing_stock_data
+from etl_sales.queries import SQL as SALES_SQL
+from etl_sales.rollups import ensure_rollups
+from etl_sales.sales_sync import tag_sicar_sales, upsert_sales
+
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_PARALLEL = 4  # concurrent queries against the store database
+
+metrics = RunMetrics("onboard_store")
+
+def find_source(config, store):
+    """The sicar_sources entry whose store (or name) is `store`"""
+    for source in config["sicar_sources"]:
+        if store in (source["store"], source["name"]):
+            return source
+    known = ", ".join(s["store"] for s in config["sicar_sources"])
+    raise ValueError(f"{store!r} is not in sicar_sources ({known})")
+
+def date_windows(start, end, days):
+    """(first day, last day) ISO pairs covering [start, end], `days` days each"""
+    starts = pd.date_range(start, end, freq=f"{days}D").date
+    return [(s.isoformat(), min(s + timedelta(days=days - 1), end).isoformat()) for s in starts]
+
+def first_gap(failed):
+    """First day of the earliest failed window, or None"""
+    return min((date.fromisoformat(start) for start, _, _ in failed), default=None)
+
+def extract_windows(source, windows, parallel, timeout):
+    """
+    Sales and stock movements of every window, all requests in flight at once.
+    Returns ({window: frame}, failed) per kind, failed as settle_windows expects.
+    """
+    queries = {SALES: SALES_SQL.source("extract_sicar_sales.sql"),
+               RAW_STOCK_MOVEMENTS: INVENTORY_SQL.source("extract_stock_movements.sql")}
+    requests = [(source, sql, {"start_date": start, "end_date": end})
+                for sql in queries.values() for start, end in windows]
+    print(f"🚀 Extracting {len(requests)} windows for {source['name']}, {parallel} at a time...")
+    with metrics.span("extract", source["store"]):
+        results = iter(fetch_frames(requests, per_store=parallel, timeout=timeout))
+
+    extracted = {}
+    for stage in queries:
+        frames, failed = {}, []
+        for window, result in zip(windows, results):
+            if isinstance(result, Exception):
+                failed.append((*window, result))
+            else:
+                frames[window] = result
+        extracted[stage] = (frames, failed)
+    return extracted
+
+def load_sales(engine, source, frames):
+    store = source["store"]
+    for window, df in frames.items():
+        if df.empty:
+            continue
+        df = tag_sicar_sales(df, source)
+        metrics.add_frame(df, "extract", store)
+        with metrics.span("load", store), engine.begin() as conn:
+            upsert_sales(conn, df)
+        metrics.add_frame(df, "load", store)
+
+def last_ven_id(engine, store):
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT MAX(ven_id) FROM ventas_limpias WHERE tienda = :store AND source_system = 'sicar'"),
+            {"store": store}
+        ).scalar()
+
+def load_raw_movements(engine, source, frames):
+    """Upsert the movements; returns the latest fecha loaded, or None"""
+    store = source["store"]
+    max_fecha = None
+    for window, df in frames.items():
+        if df.empty:
+            continue
+        df = tag_stock_movements(df, source)
+        metrics.add_frame(df, "extract", store)
+        with metrics.span("load", store), engine.begin() as conn:
+            written = upsert_raw_stock_movements(conn, df)
+        metrics.add_frame(written, "load", store)
+        batch_max = pd.to_datetime(written["fecha"]).max()
+        max_fecha = batch_max if max_fecha is None else max(max_fecha, batch_max)
+    return max_fecha
+
+def replay_stock_points(engine, source, start, end):
+    """
+    Stock points of [start, end + 1 day] from zero stock on `start`, with the
+    store's stock points engine. Returns the checkpoint, end + 1 day (its SOD).
+    """
+    store = source["store"]
+    calendar_end = end + timedelta(days=1)
+    if stock_points_engine(source) == "sql":
+        with metrics.span("dq", store):
+            excluded = excluded_raw_ids(engine, source, start, end)
+        with metrics.span("load", store), engine.begin() as conn:
+            written = derive_stock_points(conn, source["store_id"], start, end, exclude_raw_ids=excluded)
+        metrics.add("rows", written, "load", store)
+        sod = None
+        if calendar_end == date.today():
+            sod = get_existing_stock_data(source["store_id"], calendar_end).to_frame(calendar_end)
+    else:
+        with metrics.span("extract", store), engine.connect() as conn:
+            df = pd.read_sql_query(
+                INVENTORY_SQL.text("extract_filter_raw_stock_movements_incremental.sql"), conn,
+                params={"store_id": source["store_id"], "start_date": start.isoformat(),
+                        "end_date": end.isoformat()}
+            )
+        df = apply_schema(df, FILTERED_MOVEMENTS)
+        metrics.add_frame(df, "extract", store)
+        with metrics.span("dq", store):
+            df, _ = screen_movements(engine, source, df)
+        if df.empty:
+            print(f"ℹ️ No raw movements from {start} to {end}")
+            return calendar_end
+        with metrics.span("transform", store):
+            cal = pd.date_range(start, calendar_end, freq="D").date
+            sod = compute_sod_matrix(replay_daily_deltas(prepare_movements(df)), cal)
+            points = sod_to_points(sod, source["store_id"])
+        with metrics.span("load", store), engine.begin() as conn:
+            write_stock_points(conn, points)
+        metrics.add_frame(points, "load", store)
+        written = len(points)
+    print(f"✅ {written} stock points from {start} to {calendar_end}")
+
+    # Only today's SOD can be checked against SICAR's current stock
+    if sod is not None and calendar_end == date.today():
+        with metrics.span("verify", store):
+            verify_stock_accuracy(source, sod)
+    return calendar_end
+
+def load_chunk(engine, source, windows, parallel, timeout, failed):
+    """
+    Extract and load one chunk of windows, adding its failures to `failed` (per
+    stage). Returns the latest raw movement fecha loaded, or None.
+    """
+    extracted = extract_windows(source, windows, parallel, timeout)
+    sales, sales_failed = extracted[SALES]
+    load_sales(engine, source, sales)
+    failed[SALES] += sales_failed
+
+    raw, raw_failed = extracted[RAW_STOCK_MOVEMENTS]
+    failed[RAW_STOCK_MOVEMENTS] += raw_failed
+    return load_raw_movements(engine, source, raw)
+
+def set_checkpoints(engine, store, last_ven_id, last_raw_ts, last_points_dt):
+    """All three etl_progress checkpoints of a store in one transaction, adding its row if needed"""
+    params = {"store": store, "last_id": last_ven_id, "ts": last_raw_ts, "dt": last_points_dt}
+    with metrics.span("checkpoint", store), engine.begin() as conn:
+        updated = conn.execute(
+            text("""
+                UPDATE etl_progress
+                SET last_processed_ven_id = :last_id, last_raw_ts = :ts, last_points_dt = :dt
+                WHERE store_name = :store
+            """),
+            params
+        ).rowcount
+        if not updated:
+            conn.execute(
+                text("""
+                    INSERT INTO etl_progress (store_name, last_processed_ven_id, last_raw_ts, last_points_dt)
+                    VALUES (:store, :last_id, :ts, :dt)
+                """),
+                params
+            )
+    print(f"📌 {store}: ven_id {last_ven_id}, raw {last_raw_ts}, points {last_points_dt}")
+
+def onboard(engine, source, start, end, window_days, parallel, timeout):
+    store = source["store"]
+    windows = date_windows(start, end, window_days)
+    with engine.begin() as conn:
+        create_flows_table(conn)
+
+    # Each chunk is loaded before the next is extracted: only `parallel` windows are in memory
+    failed = {SALES: [], RAW_STOCK_MOVEMENTS: []}
+    last_raw_ts = None
+    for i in range(0, len(windows), parallel):
+        chunk_max = load_chunk(engine, source, windows[i:i + parallel], parallel, timeout, failed)
+        if chunk_max is not None:
+            last_raw_ts = chunk_max if last_raw_ts is None else max(last_raw_ts, chunk_max)
+
+    # Sales windows that failed are replayed by update_clean_data; its checkpoint is a ven_id
+    settle_windows(engine, SALES, store, windows, failed[SALES])
+    raw_failed = failed[RAW_STOCK_MOVEMENTS]
+    gap = first_gap(raw_failed)
+    if gap is not None and last_raw_ts is not None:
+        last_raw_ts = min(last_raw_ts, pd.Timestamp(gap))
+    settle_windows(engine, RAW_STOCK_MOVEMENTS, store, windows, raw_failed)
+
+    # Stock points only up to the day before the first missing raw window
+    points_end = end if gap is None else gap - timedelta(days=1)
+    last_points_dt = None
+    if points_end >= start:
+        last_points_dt = replay_stock_points(engine, source, start, points_end)
+    if gap is not None:
+        print(f"⏸️ {len(raw_failed)} raw movement windows failed; checkpoints held at {gap}")
+
+    set_checkpoints(engine, store, last_ven_id(engine, store), last_raw_ts, last_points_dt)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store", help="store (or name) of the sicar_sources entry")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first day, the store's go-live")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today() - timedelta(days=1),
+                        help="last day (default: yesterday)")
+    parser.add_argument("--window-days", type=int, default=DEFAULT_WINDOW_DAYS)
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL,
+                        help="concurrent queries against the store database")
+    parser.add_argument("--query-timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds before a window query is abandoned and retried")
+    options = run_options("onboard_store", argv, parser)
+    metrics.profiler = options.profiler
+    if options.start > options.end:
+        parser.error(f"--start {options.start} is after --end {options.end}")
+
+    source = find_source(load_config(), options.store)
+    engine = analytics_engine()
+    with engine.connect() as conn:
+        if not has_natural_key(conn):
+            sys.exit("⛔ raw_stock_movements has no uq_natural key (run etl_inventory.add_natural_key first)")
+
+    # Only this store's stages are locked; the other stores keep updating
+    try:
+        ensure_rollups(engine, options.lock_wait)
+        with ExitStack() as locks:
+            for stage in (SALES, RAW_STOCK_MOVEMENTS, STOCK_POINTS):
+                locks.enter_context(stage_lock(engine, stage, source["store"], options.lock_wait))
+            onboard(engine, source, options.start, options.end, options.window_days,
+                    options.parallel, options.query_timeout)
+    except LockBusy as e:
+        sys.exit(f"⛔ {e}; not onboarding")
+    finally:
+        metrics.write()
+
+    print(f"🎉 {source['name']} onboarded from {options.start} to {options.end}")
+
+if __name__ == "__main__":
+    main()
@@ -27,10 +27,13 @@ if [ -f "$PROJECT_ROOT/venv/bin/activate" ]; then
   source "$PROJECT_ROOT/venv/bin/activate"
 fi
 
-# --- Run from project root ---
+# --- Run from project root (the packages are imported from here) ---
 cd "$PROJECT_ROOT"
 
 # --- Run tasks ---
-"$PY" etl_sales/update_clean_data.py
-"$PY" etl_inventory/update_raw_stock_movements.py
-"$PY" etl_inventory/update_stock_points.py
\ No newline at end of file
+"$PY" -m etl_sales.update_clean_data
+"$PY" -m etl_sales.reconcile --days 2
+"$PY" -m etl_inventory.update_raw_stock_movements
+"$PY" -m etl_inventory.update_stock_points
+"$PY" -m etl_inventory.update_stock_asof
+"$PY" -m etl_inventory.compact_raw_stock_movements
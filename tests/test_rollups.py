@@ -0,0 +1,107 @@
+"""
+The DataFrame rollup deltas (rollup_deltas, used by upsert_sales) and the row
+ones (apply_rollup_row_deltas, used by upsert_sales_rows) must net every batch
+to the same buckets.
+"""
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pandas as pd
+import pytest
+from etl_sales.money import MONEY_COLUMNS
+from etl_sales.rollups import MEASURES, ROLLUP_UPSERTS, ROLLUPS, apply_rollup_row_deltas, rollup_deltas
+
+START = datetime(2025, 3, 1, 9, 30)
+
+def sale(ven_id, day=0, caja="1", usuario="ana", **cents):
+    row = {"ven_id": ven_id, "tienda": "centro", "source_system": "sicar",
+           "fecha_hora": START + timedelta(days=day), "caja": caja, "usuario": usuario}
+    row.update({col: cents.get(col, 0) for col in MONEY_COLUMNS})
+    return row
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self.rows
+
+class FakeConn:
+    """Serves `stored` (cents) as ventas_limpias rows (DECIMAL pesos) and records the rollup upserts"""
+    def __init__(self, stored):
+        self.stored = stored
+        self.upserts = {}
+
+    def exec_driver_sql(self, sql, params):
+        for rollup, upsert in ROLLUP_UPSERTS.items():
+            if sql == upsert:
+                self.upserts[rollup] = params
+                return None
+        ids = set(params[2:])  # tienda, source_system, *ven_ids
+        return FakeResult([
+            {**s, **{c: None if s[c] is None else Decimal(s[c]).scaleb(-2) for c in MONEY_COLUMNS}}
+            for s in self.stored if s["ven_id"] in ids
+        ])
+
+def row_path(new, stored):
+    """{rollup: {bucket: [tickets, *cents]}} written by apply_rollup_row_deltas"""
+    conn = FakeConn(stored)
+    apply_rollup_row_deltas(conn, new)
+    out = {}
+    for rollup, keys in ROLLUPS.items():
+        n = len(keys)
+        out[rollup] = {
+            tuple(params[:n]): [params[n], *(int(amount.scaleb(2)) for amount in params[n + 1:])]
+            for params in conn.upserts.get(rollup, [])
+        }
+    return out
+
+def frame_path(new, stored):
+    """{rollup: {bucket: [tickets, *cents]}} from rollup_deltas, as apply_rollup_deltas computes them"""
+    new_df = pd.DataFrame(new).drop_duplicates("ven_id", keep="last")
+    stored_df = pd.DataFrame([s for s in stored if s["ven_id"] in set(new_df["ven_id"])])
+    out = {}
+    for rollup, keys in ROLLUPS.items():
+        delta = rollup_deltas(new_df, stored_df, keys)
+        out[rollup] = {tuple(r[k] for k in keys): [int(r[m]) for m in MEASURES]
+                       for r in delta.to_dict("records")}
+    return out
+
+def test_overwritten_sale_moves_day_and_caja():
+    stored = [sale(1, day=0, caja="1", efectivo=10_000, total_venta=10_000)]
+    new = [sale(1, day=1, caja="2", tarjeta=12_550, total_venta=12_550)]
+
+    deltas = row_path(new, stored)
+    assert deltas == frame_path(new, stored)
+    day0, day1 = START.date(), (START + timedelta(days=1)).date()
+    assert deltas["ventas_diarias"] == {
+        ("centro", day0): [-1, -10_000, 0, 0, -10_000],
+        ("centro", day1): [1, 0, 12_550, 0, 12_550],
+    }
+    assert deltas["ventas_diarias_caja_usuario"] == {
+        ("centro", day0, "1", "ana"): [-1, -10_000, 0, 0, -10_000],
+        ("centro", day1, "2", "ana"): [1, 0, 12_550, 0, 12_550],
+    }
+
+def test_unchanged_resync_nets_to_nothing():
+    rows = [sale(1, efectivo=500, total_venta=500), sale(2, caja=None, usuario=None, otros=99, total_venta=99)]
+    assert row_path(rows, rows) == frame_path(rows, rows) == {rollup: {} for rollup in ROLLUPS}
+
+def test_null_amounts_count_as_zero():
+    stored = [sale(1, efectivo=None, total_venta=300)]
+    new = [sale(1, efectivo=300, tarjeta=None, total_venta=300)]
+    assert row_path(new, stored) == frame_path(new, stored)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_batches_match(seed):
+    rng = random.Random(seed)
+
+    def random_sale(ven_id):
+        cents = {col: rng.choice([0, 0, rng.randint(1, 500_000)]) for col in MONEY_COLUMNS}
+        return sale(ven_id, day=rng.randint(0, 3), caja=rng.choice(["1", "2", None]),
+                    usuario=rng.choice(["ana", "luis", None]), **cents)
+
+    stored = [random_sale(ven_id) for ven_id in rng.sample(range(1, 60), 25)]
+    # Overwrites (often moving day, caja or amounts), new sales and repeated ven_ids
+    new = [random_sale(rng.randint(1, 80)) for _ in range(40)]
+    assert row_path(new, stored) == frame_path(new, stored)
@@ -0,0 +1,45 @@
+"""tag_issues must label QA rows exactly as the row-wise tag_issue it replaced"""
+import itertools
+import random
+import pandas as pd
+import pytest
+from etl_sales.transform import _qa_flags, tag_issues
+
+def tag_issue(row):
+    """The original per-row precedence chain, kept as the reference"""
+    if row["no_flujo"]:
+        return "no payment recorded"
+    if row["efectivo"] > 0 and row["tarjeta"] == 0 and row["pagado"] > row["total"]:
+        return "overpaid cash"
+    elif row["tarjeta"] > 0 and row["efectivo"] == 0 and row["pagado"] > row["total"]:
+        return "overpaid card"
+    elif row["pagado"] == 0:
+        return "no payment recorded"
+    elif row["egresos"] > row["efectivo"] + row["tarjeta"] + row["otros"]:
+        return "refund_too_big"
+    else:
+        return "unknown mismatch"
+
+def qa_frame(rows):
+    df = pd.DataFrame(rows, columns=["efectivo", "tarjeta", "otros", "total", "egresos", "no_flujo"])
+    df[["efectivo", "tarjeta", "otros", "total", "egresos"]] = (
+        df[["efectivo", "tarjeta", "otros", "total", "egresos"]].astype("int64"))
+    df["no_flujo"] = df["no_flujo"].astype(bool)
+    df["pagado"] = df["efectivo"] + df["tarjeta"] + df["otros"]
+    return df
+
+def test_every_branch_combination():
+    # Amounts around each comparison's boundaries, so every rule and tie is hit
+    values = [0, 100, 250]
+    rows = [(e, t, o, total, eg, nf) for e, t, o, total, eg, nf
+            in itertools.product(values, values, values, values, [0, 400, 1_000], [False, True])]
+    df = qa_frame(rows)
+    assert tag_issues(df).tolist() == df.apply(tag_issue, axis=1).tolist()
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_qa_rows(seed):
+    rng = random.Random(seed)
+    amount = lambda: rng.choice([0, 0, rng.randint(1, 50_000)])
+    rows = [(amount(), amount(), amount(), amount(), amount(), rng.random() < 0.2) for _ in range(500)]
+    qa = _qa_flags(qa_frame(rows))
+    assert qa["issue_type"].tolist() == qa.apply(tag_issue, axis=1).tolist()